@@ -0,0 +1,115 @@
+""" Vectorized win evaluation across many boards at once.
+
+    Used for analytics and consistency checks of stored games. Boards are
+    int8 arrays of turn slots: 0 is an empty cell and slot k is the k-th
+    player of that board. A stack of boards has shape (boards, rows, cols).
+"""
+
+from collections import defaultdict
+
+import numpy as np
+
+from connectquatro import encoding
+from connectquatro.models import Board
+
+
+def board_state_to_array(board_state:bytes) -> tuple:
+    """ Decode a stored board_state into a (rows, cols) array of turn slots.
+        Returns the array and the player ids, where slot k is player_ids[k - 1].
+    """
+    board_length_x, board_length_y = board_state[1], board_state[2]
+    cell_count = board_length_x * board_length_y
+    decoded_state = encoding.decode_board_state(board_state)
+
+    cells = np.zeros(cell_count, dtype=np.int8)
+    player_ids = []
+    if Board.STATE_KEY_CHIPS in decoded_state:
+        # Sparse mega board.
+        for cell_ix, player_id in decoded_state[Board.STATE_KEY_CHIPS].items():
+            if player_id not in player_ids:
+                player_ids.append(player_id)
+            cells[cell_ix] = player_ids.index(player_id) + 1
+        return cells.reshape(board_length_y, board_length_x), player_ids
+
+    bitboards = decoded_state[Board.STATE_KEY_BITBOARDS]
+    for slot, (player_id, bits) in enumerate(bitboards.items(), start=1):
+        player_ids.append(player_id)
+        bit_bytes = np.frombuffer(bits.to_bytes((cell_count + 7) // 8, "little"), dtype=np.uint8)
+        occupied = np.unpackbits(bit_bytes, bitorder="little")[:cell_count].astype(bool)
+        cells[occupied] = slot
+    return cells.reshape(board_length_y, board_length_x), player_ids
+
+
+def has_line(masks:np.ndarray, max_to_win:int) -> np.ndarray:
+    """ For a (boards, rows, cols) bool stack, whether each board has
+        max_to_win set cells in a row in any direction.
+    """
+    boards_count, rows, cols = masks.shape
+    found = np.zeros(boards_count, dtype=bool)
+    span = max_to_win - 1
+
+    # Convolve each direction with a line of max_to_win ones. On bool
+    # masks that is an AND of max_to_win shifted windows.
+    if cols > span:
+        windows = masks[:, :, :cols - span].copy()
+        for offset in range(1, max_to_win):
+            windows &= masks[:, :, offset:cols - span + offset]
+        found |= windows.any(axis=(1, 2))
+
+    if rows > span:
+        windows = masks[:, :rows - span, :].copy()
+        for offset in range(1, max_to_win):
+            windows &= masks[:, offset:rows - span + offset, :]
+        found |= windows.any(axis=(1, 2))
+
+    if rows > span and cols > span:
+        # down right
+        windows = masks[:, :rows - span, :cols - span].copy()
+        for offset in range(1, max_to_win):
+            windows &= masks[:, offset:rows - span + offset, offset:cols - span + offset]
+        found |= windows.any(axis=(1, 2))
+
+        # down left
+        windows = masks[:, :rows - span, span:].copy()
+        for offset in range(1, max_to_win):
+            windows &= masks[:, offset:rows - span + offset, span - offset:cols - offset]
+        found |= windows.any(axis=(1, 2))
+
+    return found
+
+
+def get_winning_slots(boards:np.ndarray, max_to_win:int) -> np.ndarray:
+    """ Winning turn slot of each board in a (boards, rows, cols) stack,
+        0 where no one has won.
+
+        A played game ends on its first line, so only a board built by hand
+        can give several slots a line. The move order that would say which
+        came first isn't on the board, so the lowest of those slots is
+        returned.
+    """
+    winners = np.zeros(boards.shape[0], dtype=np.int8)
+    for slot in range(int(boards.max(initial=0)), 0, -1):
+        winners[has_line(boards == slot, max_to_win)] = slot
+    return winners
+
+
+def get_winning_slots_mixed(boards:list, max_to_wins:list) -> np.ndarray:
+    """ Like get_winning_slots for a list of 2D boards of any size.
+
+        Boards are grouped by max_to_win and zero padded to the largest board
+        of their group, so each group is evaluated as a single stack.
+    """
+    groups = defaultdict(list)
+    for board_ix, max_to_win in enumerate(max_to_wins):
+        groups[max_to_win].append(board_ix)
+
+    winners = np.zeros(len(boards), dtype=np.int8)
+    for max_to_win, board_ixs in groups.items():
+        rows = max(boards[board_ix].shape[0] for board_ix in board_ixs)
+        cols = max(boards[board_ix].shape[1] for board_ix in board_ixs)
+        stack = np.zeros((len(board_ixs), rows, cols), dtype=np.int8)
+        for stack_ix, board_ix in enumerate(board_ixs):
+            board = boards[board_ix]
+            stack[stack_ix, :board.shape[0], :board.shape[1]] = board
+        winners[board_ixs] = get_winning_slots(stack, max_to_win)
+    return winners
@@ -0,0 +1,153 @@
+""" Bitboard representation of a Connect Quatro board.
+
+    Each player's chips are stored as one integer. The chip at
+    (row_ix, col_ix) is bit (row_ix * board_length_x + col_ix), so row 0 is
+    the top of the board just like the board_list sent to clients.
+"""
+
+from functools import lru_cache
+
+
+class Geometry:
+    """ Precomputed masks for one (board_length_x, board_length_y, max_to_win).
+    """
+    __slots__ = (
+        'board_length_x',
+        'board_length_y',
+        'max_to_win',
+        'cell_count',
+        'full_mask',
+        'column_masks',
+        'win_lines',
+        'cell_win_lines',
+        'cell_line_ixs',
+        'min_dead_chip_count',
+    )
+
+    def __init__(self, board_length_x:int, board_length_y:int, max_to_win:int):
+        self.board_length_x = board_length_x
+        self.board_length_y = board_length_y
+        self.max_to_win = max_to_win
+        self.cell_count = board_length_x * board_length_y
+        self.full_mask = (1 << self.cell_count) - 1
+
+        self.column_masks = tuple(
+            sum(1 << (row_ix * board_length_x + col_ix) for row_ix in range(board_length_y))
+            for col_ix in range(board_length_x))
+
+        # Every window of max_to_win cells: horizontal, vertical, and both diagonals.
+        win_lines = []
+        cell_win_lines = [[] for _ in range(self.cell_count)]
+        cell_line_ixs = [[] for _ in range(self.cell_count)]
+        for row_step, col_step in ((0, 1), (1, 0), (1, 1), (1, -1)):
+            for row_ix in range(board_length_y):
+                for col_ix in range(board_length_x):
+                    last_row_ix = row_ix + row_step * (max_to_win - 1)
+                    last_col_ix = col_ix + col_step * (max_to_win - 1)
+                    if not (0 <= last_row_ix < board_length_y and 0 <= last_col_ix < board_length_x):
+                        continue
+                    cells = [
+                        (row_ix + row_step * offset) * board_length_x + col_ix + col_step * offset
+                        for offset in range(max_to_win)]
+                    line = sum(1 << cell_ix for cell_ix in cells)
+                    for cell_ix in cells:
+                        cell_win_lines[cell_ix].append(line)
+                        cell_line_ixs[cell_ix].append(len(win_lines))
+                    win_lines.append(line)
+
+        self.win_lines = tuple(win_lines)
+        self.cell_win_lines = tuple(tuple(lines) for lines in cell_win_lines)
+        self.cell_line_ixs = tuple(tuple(line_ixs) for line_ixs in cell_line_ixs)
+
+        # A dead position has a chip on every line, see engine.ConnectQuatroGame
+        max_cell_line_count = max(map(len, cell_line_ixs), default=0)
+        self.min_dead_chip_count = (
+            -(-len(win_lines) // max_cell_line_count) if max_cell_line_count else 0)
+
+    def cell_ix(self, row_ix:int, col_ix:int) -> int:
+        return row_ix * self.board_length_x + col_ix
+
+
+@lru_cache(maxsize=64)
+def get_geometry(board_length_x:int, board_length_y:int, max_to_win:int) -> Geometry:
+    return Geometry(board_length_x, board_length_y, max_to_win)
+
+
+def get_occupied(bitboards:dict) -> int:
+    occupied = 0
+    for bitboard in bitboards.values():
+        occupied |= bitboard
+    return occupied
+
+
+def get_column_heights(geometry:Geometry, occupied:int) -> list:
+    """ Number of chips in each column.
+    """
+    return [bin(occupied & column_mask).count("1") for column_mask in geometry.column_masks]
+
+
+def get_landing_row_ix(geometry:Geometry, column_height:int) -> int:
+    """ Row a chip dropped into a column lands on, or -1 if the column is full.
+    """
+    return geometry.board_length_y - 1 - column_height
+
+
+def get_legal_columns(geometry:Geometry, column_heights:list) -> list:
+    board_length_y = geometry.board_length_y
+    return [col_ix for col_ix, height in enumerate(column_heights) if height < board_length_y]
+
+
+def is_win_at(geometry:Geometry, bitboard:int, cell_ix:int) -> bool:
+    """ Check only the lines that pass through cell_ix.
+    """
+    for line in geometry.cell_win_lines[cell_ix]:
+        if bitboard & line == line:
+            return True
+    return False
+
+
+def has_win(geometry:Geometry, bitboard:int) -> bool:
+    for line in geometry.win_lines:
+        if bitboard & line == line:
+            return True
+    return False
+
+
+def get_owner_id(bitboards:dict, cell_ix:int) -> int:
+    bit = 1 << cell_ix
+    for player_id, bitboard in bitboards.items():
+        if bitboard & bit:
+            return player_id
+
+
+# Conversion layer to and from the board_list clients expect.
+
+def board_list_to_bitboards(board_list:list) -> dict:
+    board_length_x = len(board_list[0])
+    bitboards = {}
+    for row_ix, row in enumerate(board_list):
+        for col_ix, player_id in enumerate(row):
+            if player_id is None:
+                continue
+            bit = 1 << (row_ix * board_length_x + col_ix)
+            bitboards[player_id] = bitboards.get(player_id, 0) | bit
+    return bitboards
+
+
+def board_list_to_column_heights(board_list:list) -> list:
+    return [
+        sum(1 for row in board_list if row[col_ix] is not None)
+        for col_ix in range(len(board_list[0]))]
+
+
+def bitboards_to_board_list(geometry:Geometry, bitboards:dict) -> list:
+    cells = [None] * geometry.cell_count
+    for player_id, bitboard in bitboards.items():
+        while bitboard:
+            low_bit = bitboard & -bitboard
+            cells[low_bit.bit_length() - 1] = player_id
+            bitboard ^= low_bit
+    board_length_x = geometry.board_length_x
+    return [
+        cells[row_start:row_start + board_length_x]
+        for row_start in range(0, geometry.cell_count, board_length_x)]
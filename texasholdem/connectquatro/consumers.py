@@ -2,18 +2,65 @@
 # chat/consumers.py
 import asyncio
 import json
+from urllib.parse import parse_qs
 
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 
+from connectquatro import lib as cq_lib
+from lobby.models import Game
+from texasholdem import broadcast, event_log
+from texasholdem.consumers import AsyncApiConsumer, PlayerContextMixin
+from texasholdem.utils import get_player_with_game
 
-class ConnectQuatroConsumer(AsyncJsonWebsocketConsumer):
+
+def splice_json(encoded_object:str, fields:dict) -> str:
+    """ Add fields to an encoded JSON object without decoding it.
+    """
+    if not fields:
+        return encoded_object
+    separator = "," if encoded_object.strip() != "{}" else ""
+    return encoded_object.rstrip()[:-1] + separator + json.dumps(fields)[1:]
+
+
+def get_game_state_for_user(user):
+    """ The snapshot a session that can't be resumed starts over from, None
+        if the user's game isn't running.
+    """
+    player = get_player_with_game(user)
+    game = player.game if player else None
+    if game is None or not game.is_started:
+        return None
+    return cq_lib.get_cached_game_state(game.board, player)
+
+
+def make_move_for_user(user, data:dict) -> tuple:
+    """ views.api_views.make_move's (data, status).
+    """
+    player = get_player_with_game(user)
+    game = player.game if player else None
+    return (cq_lib.get_move_error_response(player, game)
+        or cq_lib.get_make_move_response(player, game, data))
+
+
+def play_move_for_user(user, data:dict) -> dict:
+    """ make_move_for_user for websocket clients. Returns the fields of the
+        move.ack.
+    """
+    with broadcast.collect():
+        response_data, status = make_move_for_user(user, data)
+    if status == 200:
+        return {'ok':True, 'game_state':response_data}
+    return {'ok':False, 'error':response_data}
+
+
+class ConnectQuatroConsumer(PlayerContextMixin, AsyncJsonWebsocketConsumer):
+
+    game_channel_layer_name = None
 
     async def connect(self):
-        user = self.scope['user']
-        player = await database_sync_to_async(lambda: user.player)()
-        game = await database_sync_to_async(lambda: player.game)()
-        if not game:
+        context = await self.get_context()
+        if not context.game_id:
             await self.send({
                 'error':'player not in a game'
             })
@@ -21,15 +68,65 @@ class ConnectQuatroConsumer(AsyncJsonWebsocketConsumer):
             return await self.close(code=CLOSE_PROTOCOL_ERROR)
 
         await self.accept()
+        await self.connect_context()
+        self.game_channel_layer_name = context.game_channel_layer_name
         await self.channel_layer.group_add(
-            game.channel_layer_name, self.channel_name)
+            self.game_channel_layer_name, self.channel_name)
 
     async def disconnect(self, close_code):
-        pass
+        await self.disconnect_context()
+        if self.game_channel_layer_name:
+            await self.channel_layer.group_discard(
+                self.game_channel_layer_name, self.channel_name)
 
 
     async def receive_json(self, data):
-        pass
+        if data.get('method') == 'move':
+            await self.move(data)
+        elif data.get('method') == 'resume':
+            await self.resume(data)
+
+    async def move(self, data):
+        """ {"method":"move", "request_id":..., "column_index":...} is answered
+            with {"type":"move.ack", "request_id":..., "ok":true, "game_state":...}
+            or "ok":false and the "error" make_move would answer.
+        """
+        ack = await database_sync_to_async(play_move_for_user)(
+            self.scope['user'], {'column_index':data.get('column_index')})
+        await self.send_json({
+            'type':'move.ack',
+            'request_id':data.get('request_id'),
+            **ack,
+        })
+
+
+    async def resume(self, data):
+        """ {"method":"resume", "seq":...} replays the game's events after
+            seq, the last one the client saw, then sends
+            {"type":"session.resumed", "seq":...}. If they aren't all kept
+            any more, or seq is null, the client gets
+            {"type":"session.snapshot", "seq":..., "game_state":...} instead.
+        """
+        seq = data.get('seq')
+        events = None
+        if isinstance(seq, int) and not isinstance(seq, bool):
+            events = await event_log.read_since(self.game_channel_layer_name, seq)
+
+        if events is None:
+            # Read before the snapshot, so no event after it is skipped.
+            seq = await event_log.get_seq(self.game_channel_layer_name)
+            game_state = await database_sync_to_async(get_game_state_for_user)(
+                self.scope['user'])
+            return await self.send_json({
+                'type':'session.snapshot',
+                'seq':seq,
+                'game_state':game_state,
+            })
+
+        for event in events:
+            await self.dispatch(event)
+            seq = event['seq']
+        await self.send_json({'type':'session.resumed', 'seq':seq})
 
 
     async def player_quit(self, data):
@@ -43,29 +140,106 @@ class ConnectQuatroConsumer(AsyncJsonWebsocketConsumer):
         await self.send_json(data)
     
     async def game_move(self, data):
-        user = self.scope['user']
-        player = await database_sync_to_async(lambda: user.player)()
-        game_state = data['game_state']
-        
-        if 'next_player_slug' in game_state:
-            data['game_state']['active_player'] = player.slug == game_state['next_player_slug']
-        
-        if game_state['winner']:
-            data['game_state']['player_won'] = game_state['winner']['slug'] == player.slug
-        
-        await self.send_json(data)
+        # The delta and the feed messages riding along were encoded once by
+        # the sender, only this player's fields are added.
+        context = await self.get_context()
+        fields = {}
+        if data['next_player_slug']:
+            fields['active_player'] = data['next_player_slug'] == context.player_slug
+        if data['winner_slug']:
+            fields['player_won'] = data['winner_slug'] == context.player_slug
+        await self.send(text_data=(
+            '{"type":"game.move","seq":' + json.dumps(data.get('seq'))
+            + ',"delta":' + splice_json(data['delta'], fields)
+            + ',"feed_messages":' + data.get('feed_messages', '[]') + '}'))
 
 
     async def player_promoted(self, data):
         await self.send_json(data)
     
 
-    async def countdown_update(self, data):
-        await self.send_json(data)
-
-
     async def new_game_feed_message(self, data):
         await self.send_json(data)
 
     async def player_ready(self, data):
         await self.send_json(data)
+
+
+MAX_PING_WAIT_SECONDS = 25
+
+
+class ConnectQuatroPingConsumer(AsyncApiConsumer):
+    """ connectquat/ping/ under ASGI, see views.api_views.ping.
+
+        With ?wait=<seconds> and an If-None-Match of the current ETag the
+        response is held until the game's tick advances or the wait runs
+        out. The request waits on the game's channel group on the event
+        loop, so it holds no worker thread or database connection.
+    """
+
+    method = 'GET'
+
+    async def respond(self, user, data:dict):
+        query = parse_qs(self.scope['query_string'].decode())
+        try:
+            wait = min(float(query.get('wait', ['0'])[0]), MAX_PING_WAIT_SECONDS)
+        except ValueError:
+            return await self.send_json_response("invalid wait", 400)
+        if_none_match = dict(self.scope['headers']).get(b'if-none-match', b'').decode()
+
+        player = await self.run_sync(get_player_with_game, user)
+        game = player.game if player else None
+        if game is None:
+            return await self.send_json_response("game not found", 404)
+        if game.game_type != Game.GAME_TYPE_CHOICE_CONNECT_QUAT or not game.is_started:
+            return await self.send_json_response("invalid game state", 400)
+
+        if wait > 0 and if_none_match == cq_lib.get_game_state_etag(game):
+            player = await self.wait_for_next_tick(user, game, if_none_match, wait)
+            game = player.game if player else None
+            if game is None:
+                return await self.send_json_response("game not found", 404)
+
+        etag = cq_lib.get_game_state_etag(game)
+        if if_none_match == etag:
+            return await self.send_response(
+                304, b"", headers=[(b"ETag", etag.encode())])
+        data = await self.run_sync(cq_lib.get_cached_game_state, game.board, player)
+        await self.send_json_response(data, 200, headers=[(b"ETag", etag.encode())])
+
+    async def wait_for_next_tick(self, user, game:Game, etag:str, wait:float):
+        """ Wait for a message to the game's group that changes its ETag.
+            Returns the player reloaded after the last message.
+        """
+        channel_name = await self.channel_layer.new_channel()
+        await self.channel_layer.group_add(game.channel_layer_name, channel_name)
+        loop = asyncio.get_event_loop()
+        give_up_at = loop.time() + wait
+        try:
+            while True:
+                # Reload after joining the group so a move made before
+                # joining is not missed.
+                player = await self.run_sync(get_player_with_game, user)
+                remaining = give_up_at - loop.time()
+                if (remaining <= 0
+                        or player is None
+                        or player.game is None
+                        or cq_lib.get_game_state_etag(player.game) != etag):
+                    return player
+                try:
+                    await asyncio.wait_for(
+                        self.channel_layer.receive(channel_name), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await self.channel_layer.group_discard(
+                game.channel_layer_name, channel_name)
+
+
+class ConnectQuatroMoveConsumer(AsyncApiConsumer):
+    """ connectquat/move/ under ASGI, see views.api_views.make_move.
+    """
+
+    async def respond(self, user, data:dict):
+        response_data, status = await self.run_sync(make_move_for_user, user, data)
+        await self.send_json_response(response_data, status)
@@ -0,0 +1,142 @@
+""" Versioned binary encoding of Board.board_state.
+
+    Version 1 layout, big endian:
+        version          u8
+        board_length_x   u8
+        board_length_y   u8
+        player_count     u8
+        next_to_act      u8    index into the player table, 0xFF if unset
+        last_move        u8 u8 row_ix, col_ix, 0xFF 0xFF if unset
+        player table     u32 * player_count, the ids of the players with
+                         chips in the order board_state first lists them,
+                         then the player to act if they have none yet. This
+                         is not the turn order.
+        column heights   u8 * board_length_x
+        bitboards        ceil(cells / 8) bytes * player_count
+
+    Cells are referenced by player table index instead of player id, so
+    a board costs at most one byte per cell for up to 8 players.
+
+    Version 2 is used for sparse mega boards. The header, player table and
+    column heights are the same, then instead of bitboards:
+        chips            u8 * sum(column heights), the player table index
+                         of each chip, column by column from the bottom up
+"""
+
+import struct
+
+from connectquatro.models import Board
+
+
+STATE_VERSION_1 = 1
+STATE_VERSION_2 = 2
+
+HEADER = struct.Struct(">BBBBBBB")
+NOT_SET = 0xFF
+
+
+class UnknownStateVersionError(Exception):
+    pass
+
+
+def encode_board_state(board_state:dict, board_length_x:int, board_length_y:int) -> bytes:
+    if Board.STATE_KEY_CHIPS in board_state:
+        return encode_sparse_board_state(board_state, board_length_x, board_length_y)
+
+    bitboards = board_state[Board.STATE_KEY_BITBOARDS]
+    player_ids = _get_player_table(board_state, bitboards)
+    header = _pack_header(
+        STATE_VERSION_1, board_state, player_ids, board_length_x, board_length_y)
+
+    bitboard_size = (board_length_x * board_length_y + 7) // 8
+    return b"".join([
+        header,
+        struct.pack(f">{len(player_ids)}I", *player_ids),
+        bytes(board_state[Board.STATE_KEY_COLUMN_HEIGHTS]),
+        *(bitboards.get(player_id, 0).to_bytes(bitboard_size, "big") for player_id in player_ids),
+    ])
+
+
+def encode_sparse_board_state(board_state:dict, board_length_x:int, board_length_y:int) -> bytes:
+    cells = board_state[Board.STATE_KEY_CHIPS]
+    column_heights = board_state[Board.STATE_KEY_COLUMN_HEIGHTS]
+    player_ids = _get_player_table(board_state, cells.values())
+    header = _pack_header(
+        STATE_VERSION_2, board_state, player_ids, board_length_x, board_length_y)
+
+    player_ixs = {player_id:ix for ix, player_id in enumerate(player_ids)}
+    bottom_cell_ix = (board_length_y - 1) * board_length_x
+    chips = bytes(
+        player_ixs[cells[bottom_cell_ix + col_ix - height * board_length_x]]
+        for col_ix, column_height in enumerate(column_heights)
+        for height in range(column_height))
+    return b"".join([
+        header,
+        struct.pack(f">{len(player_ids)}I", *player_ids),
+        bytes(column_heights),
+        chips,
+    ])
+
+
+def _get_player_table(board_state:dict, chip_owner_ids) -> list:
+    player_ids = list(dict.fromkeys(chip_owner_ids))
+    next_player_id = board_state.get(Board.STATE_KEY_NEXT_PLAYER_TO_ACT)
+    if next_player_id is not None and next_player_id not in player_ids:
+        player_ids.append(next_player_id)
+    return player_ids
+
+
+def _pack_header(
+    version:int, board_state:dict, player_ids:list, board_length_x:int, board_length_y:int) -> bytes:
+    next_player_id = board_state.get(Board.STATE_KEY_NEXT_PLAYER_TO_ACT)
+    last_move = board_state.get(Board.STATE_KEY_LAST_MOVE) or (NOT_SET, NOT_SET)
+    return HEADER.pack(
+        version,
+        board_length_x,
+        board_length_y,
+        len(player_ids),
+        NOT_SET if next_player_id is None else player_ids.index(next_player_id),
+        last_move[0],
+        last_move[1])
+
+
+def decode_board_state(data:bytes) -> dict:
+    (version, board_length_x, board_length_y, player_count,
+        next_player_ix, last_row_ix, last_col_ix) = HEADER.unpack_from(data)
+    if version not in (STATE_VERSION_1, STATE_VERSION_2):
+        raise UnknownStateVersionError(version)
+
+    offset = HEADER.size
+    player_ids = struct.unpack_from(f">{player_count}I", data, offset)
+    offset += 4 * player_count
+
+    column_heights = list(data[offset:offset + board_length_x])
+    offset += board_length_x
+
+    board_state = {
+        Board.STATE_KEY_NEXT_PLAYER_TO_ACT:(
+            None if next_player_ix == NOT_SET else player_ids[next_player_ix]),
+        Board.STATE_KEY_COLUMN_HEIGHTS:column_heights,
+    }
+
+    if version == STATE_VERSION_2:
+        cells = {}
+        bottom_cell_ix = (board_length_y - 1) * board_length_x
+        for col_ix, column_height in enumerate(column_heights):
+            for height in range(column_height):
+                cells[bottom_cell_ix + col_ix - height * board_length_x] = player_ids[data[offset]]
+                offset += 1
+        board_state[Board.STATE_KEY_CHIPS] = cells
+    else:
+        bitboard_size = (board_length_x * board_length_y + 7) // 8
+        bitboards = {}
+        for player_id in player_ids:
+            bits = int.from_bytes(data[offset:offset + bitboard_size], "big")
+            offset += bitboard_size
+            if bits:
+                bitboards[player_id] = bits
+        board_state[Board.STATE_KEY_BITBOARDS] = bitboards
+
+    if last_row_ix != NOT_SET:
+        board_state[Board.STATE_KEY_LAST_MOVE] = [last_row_ix, last_col_ix]
+    return board_state
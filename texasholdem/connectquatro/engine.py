@@ -0,0 +1,350 @@
+""" Connect Quatro rules, in memory.
+
+    Nothing in this module touches the database. connectquatro.lib loads a
+    ConnectQuatroGame from a Board, applies moves to it and persists it.
+"""
+
+from connectquatro.models import Board
+from connectquatro import bitboard
+from connectquatro import sparse
+
+
+class ColumnIsFullError(Exception):
+    pass
+
+class ColumnOutOfRangeError(Exception):
+    pass
+
+class GameOverError(Exception):
+    pass
+
+
+# line_owners value for a line holding chips of more than one player.
+LINE_CLOSED = -1
+
+
+class ConnectQuatroGame:
+    """ One game of Connect Quatro.
+
+        player_ids are the players still in the game, in turn order. Chips
+        of players who quit stay in bitboards.
+
+        line_owners tracks every win line of the geometry: None while it is
+        empty, the id of the only player with chips on it, or LINE_CLOSED.
+        A line is open while it is empty or owned by a player still in the
+        game. The game is drawn once no open line is left.
+
+        line_owners is only built once a draw is possible: a dead position
+        has a chip on every line, so before geometry.min_dead_chip_count
+        chips, or while some line is still empty, it isn't. From then on
+        drop_chip and remove_player keep it up to date.
+    """
+    __slots__ = (
+        'geometry',
+        'player_ids',
+        'next_player_id',
+        'bitboards',
+        'column_heights',
+        'chip_count',
+        'last_move',
+        'winner_id',
+        'is_draw',
+        'line_owners',
+        'open_line_count',
+    )
+
+    def __init__(
+        self, geometry:bitboard.Geometry, player_ids:list, next_player_id:int,
+        bitboards:dict=None, column_heights:list=None, last_move:list=None):
+
+        self.geometry = geometry
+        self.player_ids = list(player_ids)
+        self.next_player_id = next_player_id
+        self.bitboards = {} if bitboards is None else bitboards
+        self.column_heights = (
+            [0] * geometry.board_length_x if column_heights is None else column_heights)
+        self.chip_count = sum(self.column_heights)
+        self.last_move = last_move
+        self.winner_id = None
+        self.is_draw = False
+        self.line_owners = None
+        self.open_line_count = None
+
+        if last_move:
+            # Only lines through the last dropped chip can hold a win.
+            cell_ix = geometry.cell_ix(*last_move)
+            owner_id = bitboard.get_owner_id(self.bitboards, cell_ix)
+            if owner_id is not None and bitboard.is_win_at(geometry, self.bitboards[owner_id], cell_ix):
+                self.winner_id = owner_id
+        else:
+            for player_id, player_bitboard in self.bitboards.items():
+                if bitboard.has_win(geometry, player_bitboard):
+                    self.winner_id = player_id
+                    break
+        if self.winner_id is None:
+            self._check_for_draw()
+
+    @classmethod
+    def from_state(cls, geometry:bitboard.Geometry, board_state:dict, player_ids:list):
+        # Copied, board_state may be shared. See connectquatro.lib.load_board_state
+        return cls(
+            geometry, player_ids,
+            board_state[Board.STATE_KEY_NEXT_PLAYER_TO_ACT],
+            bitboards=dict(board_state[Board.STATE_KEY_BITBOARDS]),
+            column_heights=list(board_state[Board.STATE_KEY_COLUMN_HEIGHTS]),
+            last_move=board_state.get(Board.STATE_KEY_LAST_MOVE))
+
+    def to_state(self) -> dict:
+        board_state = {
+            Board.STATE_KEY_NEXT_PLAYER_TO_ACT:self.next_player_id,
+            Board.STATE_KEY_BITBOARDS:self.bitboards,
+            Board.STATE_KEY_COLUMN_HEIGHTS:self.column_heights,
+        }
+        if self.last_move:
+            board_state[Board.STATE_KEY_LAST_MOVE] = self.last_move
+        return board_state
+
+    @property
+    def is_over(self) -> bool:
+        return self.winner_id is not None or self.is_draw
+
+    @property
+    def legal_columns(self) -> list:
+        return bitboard.get_legal_columns(self.geometry, self.column_heights)
+
+    @property
+    def board_list(self) -> list:
+        return bitboard.bitboards_to_board_list(self.geometry, self.bitboards)
+
+    def drop_chip(self, player_id:int, column_ix:int) -> int:
+        """ Place player_id's chip in column_ix and check for a win or draw.
+            Returns the row the chip landed on. The turn does not change.
+        """
+        geometry = self.geometry
+        if not 0 <= column_ix < geometry.board_length_x:
+            raise ColumnOutOfRangeError()
+        row_ix = geometry.board_length_y - 1 - self.column_heights[column_ix]
+        if row_ix < 0:
+            raise ColumnIsFullError()
+
+        cell_ix = row_ix * geometry.board_length_x + column_ix
+        player_bitboard = self.bitboards.get(player_id, 0) | (1 << cell_ix)
+        self.bitboards[player_id] = player_bitboard
+        self.column_heights[column_ix] += 1
+        self.chip_count += 1
+        self.last_move = [row_ix, column_ix]
+
+        line_owners = self.line_owners
+        if line_owners is not None:
+            for line_ix in geometry.cell_line_ixs[cell_ix]:
+                owner_id = line_owners[line_ix]
+                if owner_id is None:
+                    line_owners[line_ix] = player_id
+                elif owner_id != player_id and owner_id != LINE_CLOSED:
+                    line_owners[line_ix] = LINE_CLOSED
+                    self.open_line_count -= 1
+
+        if bitboard.is_win_at(geometry, player_bitboard, cell_ix):
+            self.winner_id = player_id
+        else:
+            self._check_for_draw()
+        return row_ix
+
+    def make_move(self, column_ix:int) -> int:
+        """ Drop a chip for the player to act, then pass the turn on.
+        """
+        if self.is_over:
+            raise GameOverError()
+        row_ix = self.drop_chip(self.next_player_id, column_ix)
+        if not self.is_over:
+            self.cycle_player_turn()
+        return row_ix
+
+    def cycle_player_turn(self) -> int:
+        """ Pass the turn to the next player. Also used when a turn times out.
+        """
+        player_ids = self.player_ids
+        try:
+            current_position = player_ids.index(self.next_player_id)
+        except ValueError:
+            current_position = -1
+        self.next_player_id = player_ids[(current_position + 1) % len(player_ids)]
+        return self.next_player_id
+
+    def remove_player(self, player_id:int):
+        """ Take a player out of the turn order. Their chips stay on the board.
+        """
+        self.player_ids.remove(player_id)
+        if self.line_owners is not None:
+            self._close_lines_of(player_id)
+
+        if len(self.player_ids) == 1 and not self.is_over:
+            self.winner_id = self.player_ids[0]
+        elif self.player_ids and self.next_player_id == player_id:
+            self.next_player_id = self.player_ids[0]
+        if not self.is_over:
+            self._check_for_draw()
+
+    def _close_lines_of(self, player_id:int):
+        line_owners = self.line_owners
+        for line_ix, owner_id in enumerate(line_owners):
+            if owner_id == player_id:
+                line_owners[line_ix] = LINE_CLOSED
+                self.open_line_count -= 1
+
+    def get_open_line_count(self) -> int:
+        if self.line_owners is None:
+            self._count_open_lines()
+        return self.open_line_count
+
+    def _count_open_lines(self):
+        active_player_ids = set(self.player_ids)
+        line_owners = []
+        for line in self.geometry.win_lines:
+            owner_id = None
+            for player_id, player_bitboard in self.bitboards.items():
+                if player_bitboard & line:
+                    if owner_id is not None:
+                        owner_id = LINE_CLOSED
+                        break
+                    owner_id = player_id
+            if owner_id is not None and owner_id not in active_player_ids:
+                owner_id = LINE_CLOSED
+            line_owners.append(owner_id)
+        self.line_owners = line_owners
+        self.open_line_count = len(line_owners) - line_owners.count(LINE_CLOSED)
+
+    def _may_be_dead(self) -> bool:
+        if self.chip_count < self.geometry.min_dead_chip_count:
+            return False
+        if self.line_owners is None:
+            occupied = bitboard.get_occupied(self.bitboards)
+            if any(not line & occupied for line in self.geometry.win_lines):
+                return False
+        return True
+
+    def _check_for_draw(self):
+        # A full board has no open line left either, but is cheaper to test.
+        if self.chip_count == self.geometry.cell_count:
+            self.is_draw = True
+        elif self._may_be_dead() and not self.get_open_line_count():
+            self.is_draw = True
+
+
+class SparseConnectQuatroGame(ConnectQuatroGame):
+    """ One game of Connect Quatro on a mega board.
+
+        Chips are kept in cells, a dict of cell_ix to player id, instead of
+        bitboards, and line_owners is a dict holding only the lines that
+        have a chip on them. See connectquatro.sparse
+    """
+    __slots__ = (
+        'cells',
+    )
+
+    def __init__(
+        self, geometry:sparse.Geometry, player_ids:list, next_player_id:int,
+        cells:dict=None, column_heights:list=None, last_move:list=None):
+
+        self.geometry = geometry
+        self.player_ids = list(player_ids)
+        self.next_player_id = next_player_id
+        self.bitboards = None
+        self.cells = {} if cells is None else cells
+        self.column_heights = (
+            [0] * geometry.board_length_x if column_heights is None else column_heights)
+        self.chip_count = len(self.cells)
+        self.last_move = last_move
+        self.winner_id = None
+        self.is_draw = False
+        self.line_owners = None
+        self.open_line_count = None
+
+        if last_move:
+            # Only lines through the last dropped chip can hold a win.
+            cell_ixs = [geometry.cell_ix(*last_move)]
+        else:
+            cell_ixs = list(self.cells)
+        for cell_ix in cell_ixs:
+            row_ix, col_ix = divmod(cell_ix, geometry.board_length_x)
+            if cell_ix in self.cells and sparse.is_win_at(geometry, self.cells, row_ix, col_ix):
+                self.winner_id = self.cells[cell_ix]
+                break
+        if self.winner_id is None:
+            self._check_for_draw()
+
+    @classmethod
+    def from_state(cls, geometry:sparse.Geometry, board_state:dict, player_ids:list):
+        return cls(
+            geometry, player_ids,
+            board_state[Board.STATE_KEY_NEXT_PLAYER_TO_ACT],
+            cells=dict(board_state[Board.STATE_KEY_CHIPS]),
+            column_heights=list(board_state[Board.STATE_KEY_COLUMN_HEIGHTS]),
+            last_move=board_state.get(Board.STATE_KEY_LAST_MOVE))
+
+    def to_state(self) -> dict:
+        board_state = {
+            Board.STATE_KEY_NEXT_PLAYER_TO_ACT:self.next_player_id,
+            Board.STATE_KEY_CHIPS:self.cells,
+            Board.STATE_KEY_COLUMN_HEIGHTS:self.column_heights,
+        }
+        if self.last_move:
+            board_state[Board.STATE_KEY_LAST_MOVE] = self.last_move
+        return board_state
+
+    @property
+    def chips(self) -> list:
+        return sparse.cells_to_chip_list(self.geometry, self.cells)
+
+    def drop_chip(self, player_id:int, column_ix:int) -> int:
+        geometry = self.geometry
+        if not 0 <= column_ix < geometry.board_length_x:
+            raise ColumnOutOfRangeError()
+        row_ix = geometry.board_length_y - 1 - self.column_heights[column_ix]
+        if row_ix < 0:
+            raise ColumnIsFullError()
+
+        self.cells[row_ix * geometry.board_length_x + column_ix] = player_id
+        self.column_heights[column_ix] += 1
+        self.chip_count += 1
+        self.last_move = [row_ix, column_ix]
+        if self.line_owners is not None:
+            self._claim_lines(player_id, row_ix, column_ix)
+
+        if sparse.is_win_at(geometry, self.cells, row_ix, column_ix):
+            self.winner_id = player_id
+        else:
+            self._check_for_draw()
+        return row_ix
+
+    def _claim_lines(self, player_id:int, row_ix:int, col_ix:int):
+        line_owners = self.line_owners
+        for line_key in sparse.get_line_keys(self.geometry, row_ix, col_ix):
+            owner_id = line_owners.get(line_key)
+            if owner_id is None:
+                line_owners[line_key] = player_id
+            elif owner_id != player_id and owner_id != LINE_CLOSED:
+                line_owners[line_key] = LINE_CLOSED
+                self.open_line_count -= 1
+
+    def _close_lines_of(self, player_id:int):
+        line_owners = self.line_owners
+        for line_key, owner_id in line_owners.items():
+            if owner_id == player_id:
+                line_owners[line_key] = LINE_CLOSED
+                self.open_line_count -= 1
+
+    def _count_open_lines(self):
+        self.line_owners = {}
+        self.open_line_count = self.geometry.line_count
+        board_length_x = self.geometry.board_length_x
+        for cell_ix, player_id in self.cells.items():
+            self._claim_lines(player_id, *divmod(cell_ix, board_length_x))
+
+        active_player_ids = set(self.player_ids)
+        for player_id in set(self.line_owners.values()):
+            if player_id != LINE_CLOSED and player_id not in active_player_ids:
+                self._close_lines_of(player_id)
+
+    def _may_be_dead(self) -> bool:
+        return self.chip_count >= self.geometry.min_dead_chip_count
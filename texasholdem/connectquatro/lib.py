@@ -1,183 +1,391 @@
 
+from datetime import timedelta
 import json
 import random
 
-from asgiref.sync import async_to_sync
+from django.core.cache import cache
 from django.db import transaction
-from channels.layers import get_channel_layer
-
-from connectquatro.models import Board
-from connectquatro import tasks as cq_tasks
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import status
+
+from connectquatro.forms import ConnectQuatroMoveForm
+from connectquatro.models import Board, BoardSnapshot, Move
+from connectquatro import bitboard
+from connectquatro import encoding
+from connectquatro import engine
+from connectquatro import sparse
+from connectquatro.engine import ColumnIsFullError, ColumnOutOfRangeError
 from lobby.models import Player, Game, CompletedGame, GameFeedMessage
 from lobby import lib as lobby_lib
+from texasholdem import broadcast
 
 
-class ColumnIsFullError(Exception):
+class SerializedDataMismatchedError(Exception):
     pass
 
-class ColumnOutOfRangeError(Exception):
+class StaleGameStateError(Exception):
     pass
 
-class SerializedDataMismatchedError(Exception):
-    pass
+
+# A BoardSnapshot is taken every MOVE_SNAPSHOT_INTERVAL plies.
+MOVE_SNAPSHOT_INTERVAL = 20
+
+# Attempts at a quit that races with a move or a timeout.
+STALE_GAME_STATE_RETRIES = 3
+
+# Cached game states are keyed by tick, old ticks just expire.
+GAME_STATE_CACHE_TIMEOUT = 60 * 10
 
 
 # sync database functions
 
-def board_state_to_obj(board:Board) -> str:
-    return json.loads(board.board_state)
+def load_board_state(board:Board) -> dict:
+    """ Decode board_state. Player bitboards are keyed by player id.
+
+        The decoded state is cached on board until board_state is replaced,
+        so the permission checks, the view and get_game_state of a request
+        decode it once. Callers get a shallow copy, engines copy what they
+        change.
+    """
+    cached = getattr(board, '_decoded_board_state', None)
+    if cached is None or cached[0] is not board.board_state:
+        cached = (board.board_state, encoding.decode_board_state(bytes(board.board_state)))
+        board._decoded_board_state = cached
+    return dict(cached[1])
+
+def _set_board_state(board:Board, board_state:dict):
+    board.board_state = encoding.encode_board_state(
+        board_state, board.board_length_x, board.board_length_y)
+    board._decoded_board_state = (board.board_state, board_state)
+
+def save_board_state(board:Board, board_state:dict):
+    _set_board_state(board, board_state)
+    board.save(update_fields=['board_state'])
 
-def board_obj_to_serialized_state(board:dict) -> str:
-    return json.dumps(board)
+def get_board_geometry(board:Board):
+    geometry_module = sparse if board.is_mega else bitboard
+    return geometry_module.get_geometry(
+        board.board_length_x, board.board_length_y, board.max_to_win)
+
+def get_game_class(board:Board):
+    if board.is_mega:
+        return engine.SparseConnectQuatroGame
+    return engine.ConnectQuatroGame
+
+def load_game(board:Board, player_ids:list=None) -> engine.ConnectQuatroGame:
+    """ Build the in-memory game for board. player_ids are the players still
+        in the game in turn order, and are looked up when not given.
+    """
+    if player_ids is None:
+        player_ids = list(
+            board.game.players.order_by('turn_order').values_list('id', flat=True))
+    return get_game_class(board).from_state(
+        get_board_geometry(board), load_board_state(board), player_ids)
+
+def save_game(board:Board, cq_game:engine.ConnectQuatroGame):
+    save_board_state(board, cq_game.to_state())
+
+def record_move(board:Board, game:Game, move_type:str, player:Player, column_ix:int=None) -> Move:
+    """ Append to the move log. Call this in the transaction that saved the
+        board after the move, so snapshots line up with the log.
+    """
+    board.ply_count += 1
+    board.save(update_fields=['ply_count'])
+    move = Move.objects.create(
+        game=game, ply=board.ply_count, player=player, move_type=move_type,
+        column=column_ix, tick=game.tick_count)
+    if board.ply_count % MOVE_SNAPSHOT_INTERVAL == 0:
+        save_board_snapshot(board, game)
+    return move
+
+def save_board_snapshot(board:Board, game:Game, player_ids:list=None) -> BoardSnapshot:
+    if player_ids is None:
+        player_ids = game.players.order_by('turn_order').values_list('id', flat=True)
+    return BoardSnapshot.objects.create(
+        game=game, ply=board.ply_count, board_state=bytes(board.board_state),
+        turn_order=",".join(str(player_id) for player_id in player_ids))
+
+def apply_logged_move(cq_game:engine.ConnectQuatroGame, move:Move):
+    if move.move_type == Move.MOVE_TYPE_DROP_CHIP:
+        cq_game.drop_chip(move.player_id, move.column)
+        # make_move passes the turn on even when the move ends the game.
+        cq_game.cycle_player_turn()
+    elif move.move_type == Move.MOVE_TYPE_TIMEOUT:
+        cq_game.cycle_player_turn()
+    elif move.move_type == Move.MOVE_TYPE_QUIT:
+        cq_game.remove_player(move.player_id)
+
+def reconstruct_game(board:Board, ply:int=None) -> engine.ConnectQuatroGame:
+    """ Rebuild the game as it was after ply moves, the latest by default,
+        from the closest snapshot and the moves logged after it.
+    """
+    snapshots = BoardSnapshot.objects.filter(game_id=board.game_id)
+    moves = Move.objects.filter(game_id=board.game_id)
+    if ply is not None:
+        snapshots = snapshots.filter(ply__lte=ply)
+        moves = moves.filter(ply__lte=ply)
+
+    snapshot = snapshots.order_by('-ply').first()
+    if not snapshot:
+        raise BoardSnapshot.DoesNotExist()
+    cq_game = get_game_class(board).from_state(
+        get_board_geometry(board),
+        encoding.decode_board_state(bytes(snapshot.board_state)),
+        snapshot.player_ids)
+    moves = moves.filter(ply__gt=snapshot.ply).order_by('ply')
+    for move in moves.only('move_type', 'player_id', 'column').iterator():
+        apply_logged_move(cq_game, move)
+    return cq_game
+
+def board_state_to_obj(board:Board) -> dict:
+    """ board_state with the board_list that clients expect.
+    """
+    board_state = load_board_state(board)
+    board_state[Board.STATE_KEY_BOARD_LIST] = bitboard.bitboards_to_board_list(
+        get_board_geometry(board), board_state.pop(Board.STATE_KEY_BITBOARDS))
+    return board_state
+
+def board_obj_to_serialized_state(board:dict) -> bytes:
+    """ Encode a board_state built around a board_list.
+    """
+    board_state = dict(board)
+    board_list = board_state.pop(Board.STATE_KEY_BOARD_LIST)
+    board_state[Board.STATE_KEY_BITBOARDS] = bitboard.board_list_to_bitboards(board_list)
+    board_state[Board.STATE_KEY_COLUMN_HEIGHTS] = bitboard.board_list_to_column_heights(board_list)
+    return encoding.encode_board_state(board_state, len(board_list[0]), len(board_list))
 
 def get_active_player_id_from_board(board:Board):
-    board_state = board_state_to_obj(board)
+    board_state = load_board_state(board)
     return board_state[Board.STATE_KEY_NEXT_PLAYER_TO_ACT]
 
 
+def get_legal_columns(board:Board) -> list:
+    board_state = load_board_state(board)
+    return bitboard.get_legal_columns(
+        get_board_geometry(board), board_state[Board.STATE_KEY_COLUMN_HEIGHTS])
+
+
 def get_next_player_turn(board:Board):
-    game_data = board_state_to_obj(board)
+    game_data = load_board_state(board)
     return game_data[Board.STATE_KEY_NEXT_PLAYER_TO_ACT]
 
 
-def get_game_over_state(board:Board) -> tuple:
-    if board.game.is_over:
-        winning_player =  board.game.completedgame.winners.first()
+def get_game_over_state(board:Board, cq_game:engine.ConnectQuatroGame=None) -> tuple:
+    """ Returns (game_over, winning_player). A draw has no winning player.
+        Pass cq_game if it is already loaded with the players in the game.
+    """
+    game = board.game
+    if game.is_over:
+        winning_player =  game.completedgame.winners.first()
         return True, winning_player
 
-    winner = get_winning_player(board)
-    if winner:
-        return True, winner
-    game = board.game
-    if game.players.count() == 1:
+    if cq_game is None:
+        cq_game = load_game(board)
+    if cq_game.winner_id is not None:
+        winner = game.archived_players.filter(id=cq_game.winner_id).first()
+        if winner:
+            return True, winner
+    if len(cq_game.player_ids) == 1:
         return True, game.players.first()
+    if cq_game.is_draw:
+        return True, None
 
     return False, None
 
 def get_winning_player(board:Board) -> Player:
-    board.refresh_from_db()
-    game_data = board_state_to_obj(board)
-    board_list = game_data[Board.STATE_KEY_BOARD_LIST]
-
-    for player in board.game.archived_players.all():
-        
-
-        # Check for horizontal N in a rows
-        for row_ix, row in enumerate(board_list):
-            in_a_row = 0
-            for col_ix, player_in_slot in enumerate(row):
-                if player_in_slot == player.id:
-                    in_a_row += 1
-                else:
-                    in_a_row = 0
-                if in_a_row == board.max_to_win:
-                    return player
-
-        # Check for verticle N in a rows
-        for col_ix in range(len(board_list[0])):
-            column = [board_list[row_ix][col_ix] for row_ix in range(len(board_list))]
-            in_a_row = 0
-            for row_ix, player_in_slot in enumerate(column):
-                if player_in_slot == player.id:
-                    in_a_row += 1
-                else:
-                    in_a_row = 0
-                if in_a_row == board.max_to_win:
-                    return player
-        
-        # check for diagonal N in a row
-        number_of_rows = len(board_list)
-        for row_ix, row in enumerate(board_list):
-            for col_ix, player_in_slot in enumerate(row):
-                if player_in_slot != player.id:
-                    continue
-                
-                # check for diagonal down right
-                if (
-                    col_ix <= (len(row) - board.max_to_win)             # we have space to the right
-                    and row_ix <= (number_of_rows - board.max_to_win)): # we have space below
-
-                    in_a_row = 1
-                    for offset in range(1, board.max_to_win):
-                        row_ix_to_check = row_ix + offset
-                        col_ix_to_check = col_ix + offset
-                        next_chip = board_list[row_ix_to_check][col_ix_to_check]
-                        if next_chip == player.id:
-                            in_a_row += 1
-
-                    if in_a_row >= board.max_to_win:
-                        return player
-
-                # check for diagonal down left
-                if (
-                    col_ix >= (len(row) - board.max_to_win)             # we have space to the left
-                    and row_ix <= (number_of_rows - board.max_to_win)): # we have space below
-
-                    in_a_row = 1
-                    for offset in range(1, board.max_to_win):
-                        row_ix_to_check = row_ix + offset
-                        col_ix_to_check = col_ix - offset
-                        next_chip = board_list[row_ix_to_check][col_ix_to_check]
-                        if next_chip == player.id:
-                            in_a_row += 1
-
-                    if in_a_row >= board.max_to_win:
-                        return player
+    # Turn order is not needed to find a winner.
+    winning_player_id = load_game(board, player_ids=[]).winner_id
+    if winning_player_id is None:
+        return None
+    return board.game.archived_players.filter(id=winning_player_id).first()
 
 
 def cycle_player_turn(board:Board) -> tuple:
-    board_state = board_state_to_obj(board)
-    current_player_id = board_state[Board.STATE_KEY_NEXT_PLAYER_TO_ACT]
-    player_ids = list(board.game.players.order_by('turn_order').values_list('id', flat=True))
-
-    current_player_position = player_ids.index(current_player_id)
-    restart_order = current_player_position == len(player_ids) - 1
-    if restart_order:
-        new_player_to_act = player_ids[0]
-    else:
-        new_player_to_act = player_ids[current_player_position + 1]
-    
-    board_state[Board.STATE_KEY_NEXT_PLAYER_TO_ACT] = new_player_to_act
-    board.board_state = board_obj_to_serialized_state(board_state)
-    board.save(update_fields=['board_state'])
+    cq_game = load_game(board)
+    new_player_to_act = cq_game.cycle_player_turn()
+    save_game(board, cq_game)
     return board, new_player_to_act
 
 
 
 @transaction.atomic
 def drop_chip(board:Board, player:Player, column_ix:int):
-    game_data = board_state_to_obj(board)
-    board_list = game_data[Board.STATE_KEY_BOARD_LIST]
-    try:
-        target_colum = [row[column_ix] for row in board_list]
-    except IndexError:
-        raise ColumnOutOfRangeError()
+    # Turn order is needed to tell which lines can still be won.
+    cq_game = load_game(board)
+    cq_game.drop_chip(player.id, column_ix)
+    save_game(board, cq_game)
+    return board
 
-    if target_colum[0]:
-        raise ColumnIsFullError()
-    
-    next_row_ix = None
-    for last_ix, chip in enumerate(target_colum):
-        if chip:
-            next_row_ix = last_ix - 1
-            break
+def start_turn_timer(game:Game):
+    """ Set the deadline of the turn that starts now. The caller saves
+        turn_deadline, together with tick_count. See connectquatro.turn_timer
+    """
+    game.turn_deadline = timezone.now() + timedelta(seconds=game.max_seconds_per_turn)
+
+def advance_tick(game:Game, expected_tick_count:int, **fields):
+    """ Compare and swap on tick_count: bump it and set fields only if the
+        game is still at expected_tick_count and not over. Raises
+        StaleGameStateError otherwise.
+
+        Every write to a running game's board happens in a transaction that
+        first advances the tick, so a writer that read the game at
+        expected_tick_count knows the board it read is still current.
+    """
+    updated = (Game.objects
+        .filter(id=game.id, tick_count=expected_tick_count, is_over=False)
+        .update(tick_count=expected_tick_count + 1, **fields))
+    if not updated:
+        raise StaleGameStateError()
+    game.tick_count = expected_tick_count + 1
+    for field, value in fields.items():
+        setattr(game, field, value)
+
+def get_turn_clock(game:Game) -> dict:
+    """ Turn deadline and the server time, for clients to count down
+        locally. Both are ISO 8601 strings, turn_deadline is None while no
+        turn is running.
+    """
+    return {
+        'turn_deadline':game.turn_deadline.isoformat() if game.turn_deadline else None,
+        'server_time':timezone.now().isoformat(),
+    }
 
-    # This column is empty
-    if next_row_ix is None:
-        next_row_ix = len(target_colum) - 1
+def end_game(game:Game, winning_player:Player=None) -> GameFeedMessage:
+    """ Mark game as over and record the result. No winning_player means
+        the game is a draw. Returns the game status feed message.
+    """
+    game.is_over = True
+    game.turn_deadline = None
+    game.save(update_fields=['is_over', 'turn_deadline'])
+    return record_game_result(game, winning_player)
+
+def record_game_result(game:Game, winning_player:Player=None) -> GameFeedMessage:
+    if winning_player:
+        cg = CompletedGame.objects.create(game=game)
+        CompletedGame.winners.through.objects.create(
+            completedgame=cg, player=winning_player)
+        message = f"{winning_player.handle} wins"
+    else:
+        CompletedGame.objects.create(
+            game=game, winner_type=CompletedGame.WINNER_TYPE_DRAW)
+        message = "draw, no one can connect anymore"
 
-    
-    board_list[next_row_ix][column_ix] = player.id
-    game_data[Board.STATE_KEY_BOARD_LIST] = board_list
-    board.board_state = board_obj_to_serialized_state(game_data)
-    board.save(update_fields=['board_state'])
-    return board
+    return GameFeedMessage.objects.create(
+        game=game, message_type=GameFeedMessage.MESSAGE_TYPE_GAME_STATUS,
+        message=message)
+
+@transaction.atomic
+def commit_move(game:Game, board:Board, player:Player, column_ix:int) -> tuple:
+    """ Drop player's chip in column_ix and pass the turn on. The new board,
+        tick, turn deadline and outcome are worked out in memory first, then
+        written: the tick (which carries the end of the game), the board, the
+        move log, a board snapshot every MOVE_SNAPSHOT_INTERVAL plies and the
+        move's feed message. A move that ends the game also writes the result
+        and its feed message through record_game_result.
+
+        Raises ColumnIsFullError, ColumnOutOfRangeError or
+        StaleGameStateError, with nothing written. Returns (game_over,
+        winning_player, feed messages to push).
+    """
+    cq_game = load_game(board)
+    cq_game.drop_chip(player.id, column_ix)
+    # Passed on even when the move ends the game, as the move log replays it.
+    cq_game.cycle_player_turn()
+
+    winning_player = player if cq_game.winner_id == player.id else None
+    if cq_game.is_over:
+        advance_tick(game, game.tick_count, is_over=True, turn_deadline=None)
+    else:
+        start_turn_timer(game)
+        advance_tick(game, game.tick_count, turn_deadline=game.turn_deadline)
+
+    _set_board_state(board, cq_game.to_state())
+    board.ply_count += 1
+    board.save(update_fields=['board_state', 'ply_count'])
+    Move.objects.create(
+        game=game, ply=board.ply_count, player=player,
+        move_type=Move.MOVE_TYPE_DROP_CHIP, column=column_ix, tick=game.tick_count)
+    if board.ply_count % MOVE_SNAPSHOT_INTERVAL == 0:
+        save_board_snapshot(board, game, cq_game.player_ids)
+
+    feed_messages = [GameFeedMessage.objects.create(
+        game=game,
+        message_type=GameFeedMessage.MESSAGE_TYPE_PLAYER_MOVE_DROP_CHIP,
+        message=f"{player.handle} dropped in column {column_ix + 1}")]
+    if cq_game.is_over:
+        feed_messages.append(record_game_result(game, winning_player))
+    return cq_game.is_over, winning_player, feed_messages
+
+def get_move_error(player:Player, game:Game) -> str:
+    """ Why player can't make a move now, or None if they can.
+    """
+    if not player or not game:
+        return "game not found"
+    if game.game_type != Game.GAME_TYPE_CHOICE_CONNECT_QUAT or not game.is_started:
+        return "invalid game state"
+    if game.is_over:
+        return "game over"
+    if get_active_player_id_from_board(game.board) != player.id:
+        return "turn order error"
+    return None
+
+def play_move(game:Game, board:Board, player:Player, column_ix:int) -> dict:
+    """ commit_move, then broadcast it. Raises what commit_move raises.
+        Returns the game state as player sees it.
+    """
+    game_over, winning_player, feed_messages = commit_move(
+        game, board, player, column_ix)
+
+    game_state, _ = get_game_state(board, player, include_chips=False)
+    alert_game_players_to_new_move(game, get_game_delta(
+        game, board, moving_player=player, winning_player=winning_player,
+        players=game_state['players']))
+    for gfm in feed_messages:
+        push_new_game_feed_message(gfm)
+
+    game_state['active_player'] = False
+    if game_over:
+        game_state['player_won'] = winning_player == player
+    return game_state
+
+def get_move_error_response(player:Player, game:Game):
+    """ (data, status) for a player who may not move now, else None.
+    """
+    error = get_move_error(player, game)
+    if error == "game not found":
+        return error, status.HTTP_404_NOT_FOUND
+    if error:
+        return error, status.HTTP_400_BAD_REQUEST
+    return None
+
+def get_make_move_response(player:Player, game:Game, data:dict) -> tuple:
+    """ (data, status) answering the active player's move, whichever
+        transport it came over: views.api_views.make_move and the consumers.
+    """
+    board = game.board
+    form = ConnectQuatroMoveForm(
+        data, max_column_index=board.board_length_x - 1)
+    if not form.is_valid():
+        return form.errors, status.HTTP_400_BAD_REQUEST
+
+    try:
+        game_state = play_move(game, board, player, form.cleaned_data['column_index'])
+    except (ColumnIsFullError,
+            ColumnOutOfRangeError):
+        return "illegal move", status.HTTP_400_BAD_REQUEST
+    except StaleGameStateError:
+        # A timeout or a quit committed since the board was read.
+        return "turn is over", status.HTTP_409_CONFLICT
+
+    return game_state, status.HTTP_200_OK
 
 @transaction.atomic
 def start_game(game):
     # Set game flags.
     game.is_started = True
-    game.save(update_fields=['is_started'])
+    start_turn_timer(game)
+    game.save(update_fields=['is_started', 'turn_deadline'])
     game.archived_players.set(game.players.all())
 
     # Set player turn order and color.
@@ -196,112 +404,224 @@ def start_game(game):
 
     # Set board state
     board = Board.objects.get(game=game)
-    board_state = {
-        Board.STATE_KEY_NEXT_PLAYER_TO_ACT:random_order_player_ids[0],
-        Board.STATE_KEY_BOARD_LIST:[
-            [None for i in range(board.board_length_x)]
-                for j in range(board.board_length_y)
-        ]
-    }
-    board.board_state = board_obj_to_serialized_state(board_state)
-    board.save(update_fields=['board_state'])
+    cq_game = get_game_class(board)(
+        get_board_geometry(board), random_order_player_ids, random_order_player_ids[0])
+    save_game(board, cq_game)
+    save_board_snapshot(board, game, random_order_player_ids)
 
     # Fire off websocket events
     alert_game_lobby_game_started(game) # TODO: clean code move to diff abstraction
     lobby_lib.update_lobby_list_remove_game(game)
+    lobby_lib.invalidate_player_connections(*game.players.all())
 
 
-def get_game_state(board, requesting_player=None) -> tuple:
+def get_game_state(board, requesting_player=None, include_chips=True) -> tuple:
+    """ A snapshot of the game at 'tick'. Mega boards send their chips as
+        [row_ix, col_ix, player_id] instead of a board_list. Move responses
+        leave them out with include_chips=False, clients apply 'last_move'
+        and track legal columns themselves.
+    """
     game = board.game
-    board_state = board_state_to_obj(board)
-    board_list = board_state[Board.STATE_KEY_BOARD_LIST]
-    data = {
-        'board_list':board_list,
+    players = list(game.players.order_by('turn_order').values('slug', 'id', 'color'))
+    cq_game = load_game(board, player_ids=[p['id'] for p in players])
+    if board.is_mega:
+        data = {'last_move':None}
+        if cq_game.last_move:
+            row_ix, col_ix = cq_game.last_move
+            data['last_move'] = [
+                row_ix, col_ix, cq_game.cells[cq_game.geometry.cell_ix(row_ix, col_ix)]]
+        if include_chips:
+            data['chips'] = cq_game.chips
+            data['legal_columns'] = cq_game.legal_columns
+    else:
+        data = {
+            'board_list':cq_game.board_list,
+            'legal_columns':cq_game.legal_columns,
+        }
+    data.update({
+        'tick':game.tick_count,
         'players':[],
         'winner':None,
+        'draw':False,
         'game_over':False,
         'active_player':None,
         'next_player_slug':None,
-    }
+    })
+    data.update(get_turn_clock(game))
 
-    game_over, winning_player = get_game_over_state(board)
+    game_over, winning_player = get_game_over_state(board, cq_game)
     if game_over:
         data['game_over'] = True
-        data['winner'] = {
-            'handle':winning_player.handle,
-            'slug':winning_player.slug,
-        }
+        if winning_player:
+            data['winner'] = {
+                'handle':winning_player.handle,
+                'slug':winning_player.slug,
+            }
+        else:
+            data['draw'] = True
     
-    if not winning_player:
-        players = game.players.all()
-        next_player_id_to_act = board_state[Board.STATE_KEY_NEXT_PLAYER_TO_ACT]
-        player_to_move = players.filter(id=next_player_id_to_act).first()
-        data['next_player_slug'] = player_to_move.slug
+    if not game_over:
+        next_player_id_to_act = cq_game.next_player_id
+        data['next_player_slug'] = next(
+            p['slug'] for p in players if p['id'] == next_player_id_to_act)
 
         if requesting_player:
-            data['active_player'] = player_to_move == requesting_player
+            data['active_player'] = requesting_player.id == next_player_id_to_act
     
-    data['players'] = [p for p in board.game.players.values('slug', 'id', 'color')]
-    game_over = winning_player is not None
+    data['players'] = players
 
     return data, game_over # TUPLE !
 
 
-@transaction.atomic
+def get_game_delta(game:Game, board:Board, moving_player:Player=None,
+        quit_player:Player=None, winning_player:Player=None, players:list=None) -> dict:
+    """ What the last tick changed, for game.move broadcasts: the chip
+        moving_player dropped as [row_ix, col_ix, player slug], the player
+        who quit, the turn and the outcome. Clients apply it to the state
+        they have and fetch a snapshot from ping if 'tick' is not the one
+        after theirs. Pass players from get_game_state to skip looking up
+        the next player's slug.
+    """
+    data = {
+        'tick':game.tick_count,
+        'move':None,
+        'quit_player_slug':quit_player.slug if quit_player else None,
+        'next_player_slug':None,
+        'winner':None,
+        'draw':False,
+        'game_over':game.is_over,
+    }
+    data.update(get_turn_clock(game))
+
+    board_state = load_board_state(board)
+    if moving_player:
+        row_ix, col_ix = board_state[Board.STATE_KEY_LAST_MOVE]
+        data['move'] = [row_ix, col_ix, moving_player.slug]
+
+    if game.is_over:
+        if winning_player:
+            data['winner'] = {
+                'handle':winning_player.handle,
+                'slug':winning_player.slug,
+            }
+        else:
+            data['draw'] = True
+    else:
+        next_player_id = board_state[Board.STATE_KEY_NEXT_PLAYER_TO_ACT]
+        if players is not None:
+            data['next_player_slug'] = next(
+                p['slug'] for p in players if p['id'] == next_player_id)
+        else:
+            data['next_player_slug'] = (Player.objects
+                .filter(id=next_player_id)
+                .values_list('slug', flat=True)
+                .first())
+    return data
+
+
+def get_game_state_cache_key(game:Game) -> str:
+    return f"cq-game-state-{game.slug}-{game.tick_count}"
+
+def get_game_state_etag(game:Game) -> str:
+    """ Every change to the game state advances tick_count.
+    """
+    return f'"{game.id}-{game.tick_count}"'
+
+def get_cached_game_state(board:Board, requesting_player:Player) -> dict:
+    """ get_game_state as requesting_player sees it, for polling clients.
+
+        Every change to a running game advances tick_count, so the shared
+        part of the state is cached per game and tick and rebuilt once per
+        tick. The turn clock and the fields that depend on the requesting
+        player are set on a copy.
+    """
+    game = board.game
+    cache_key = get_game_state_cache_key(game)
+    data = cache.get(cache_key)
+    if data is None:
+        data, _ = get_game_state(board)
+        cache.set(cache_key, data, GAME_STATE_CACHE_TIMEOUT)
+
+    data = dict(data)
+    data.update(get_turn_clock(game))
+    if not data['game_over']:
+        data['active_player'] = data['next_player_slug'] == requesting_player.slug
+    if data['winner']:
+        data['player_won'] = data['winner']['slug'] == requesting_player.slug
+    return data
+
+
 def remove_player_from_active_game(player):
+    """ Take player out of a running game. Retried if a move or a timeout
+        commits first. If that ended the game, the player just leaves it.
+    """
+    for attempt in range(STALE_GAME_STATE_RETRIES):
+        try:
+            return _remove_player_from_active_game(player)
+        except StaleGameStateError:
+            player.refresh_from_db()
+            if player.game and player.game.is_over:
+                return remove_player_from_completed_game(player)
+    raise StaleGameStateError()
+
+
+@transaction.atomic
+def _remove_player_from_active_game(player):
     game = player.game
+    expected_tick_count = game.tick_count
     if not game.is_started:
         raise TypeError("game is not started")
     if game.is_over:
         raise TypeError("game already over")
 
+    board = game.board
+    cq_game = load_game(board)
+    current_player_turn_id = cq_game.next_player_id
+    cq_game.remove_player(player.id)
+
     player.game = None
     player.is_lobby_owner = False
     player.save(update_fields=['game', 'is_lobby_owner'])
 
     game_over_gfm = None
+    winning_player = None
     gfm = GameFeedMessage.objects.create(
         game=game, message_type=GameFeedMessage.MESSAGE_TYPE_PLAYER_QUIT,
         message=f"{player.handle} quit")
 
-    board = game.board
-    board_state = board_state_to_obj(board)
-    players_left = game.players.all()
-    players_left_count = players_left.count()
+    players_left_count = len(cq_game.player_ids)
+
+    if players_left_count > 1 and cq_game.is_draw:
+        # The quitter's lines were the last ones anyone could win.
+        advance_tick(game, expected_tick_count)
+        save_game(board, cq_game)
+        game_over_gfm = end_game(game)
 
-    if players_left_count > 1:
+    elif players_left_count > 1:
         # Still players left. The game continues.
-        current_player_turn_id = board_state[Board.STATE_KEY_NEXT_PLAYER_TO_ACT]
         if current_player_turn_id == player.id:
             # Adjust active player turn. Active player just left.
-            next_turn_player_id = players_left.order_by('turn_order').first().id
-
-            board_state[Board.STATE_KEY_NEXT_PLAYER_TO_ACT] = next_turn_player_id
-            board.board_state = board_obj_to_serialized_state(board_state)
-            board.save(update_fields=['board_state'])
-            game.tick_count = game.tick_count + 1
-            game.save(update_fields=['tick_count'])
-            cq_tasks.cycle_player_turn_if_inactive.delay(
-                game.id, next_turn_player_id, game.tick_count)
+            start_turn_timer(game)
+            advance_tick(game, expected_tick_count, turn_deadline=game.turn_deadline)
+            save_game(board, cq_game)
+        else:
+            # The turn goes on, but the players in the game changed.
+            advance_tick(game, expected_tick_count)
     
     elif players_left_count == 1:
         # 1x player left. End the game
-        game.is_over = True
-        game.save()
-        cg = CompletedGame.objects.create(game=game)
-        last_player = game.players.first()
-        cg.winners.set([last_player])
-
-        game_over_gfm = GameFeedMessage.objects.create(
-            game=game, message_type=GameFeedMessage.MESSAGE_TYPE_GAME_STATUS,
-            message=f"{last_player.handle} wins")
+        advance_tick(game, expected_tick_count)
+        winning_player = game.players.first()
+        game_over_gfm = end_game(game, winning_player)
 
+    record_move(board, game, Move.MOVE_TYPE_QUIT, player)
     
-    game_state, is_over = get_game_state(board)
-    alert_game_players_to_new_move(game, game_state)
+    alert_game_players_to_new_move(game, get_game_delta(
+        game, board, quit_player=player, winning_player=winning_player))
     push_new_game_feed_message(gfm)
     if game_over_gfm:
         push_new_game_feed_message(game_over_gfm)
+    lobby_lib.invalidate_player_connections(player)
 
 
 @transaction.atomic
@@ -313,40 +633,34 @@ def remove_player_from_completed_game(player):
     player.game = None
     player.is_lobby_owner = False
     player.save(update_fields=['game', 'is_lobby_owner'])
-
-# async channel layer functions
-
-@async_to_sync
-async def alert_game_lobby_game_started(game):
-    channel_layer = get_channel_layer()
-    await channel_layer.group_send(
-        game.channel_layer_name, {"type":"game.started"})
-
-@async_to_sync
-async def alert_game_players_to_new_move(game, game_state):
-    channel_layer = get_channel_layer()
-    await channel_layer.group_send(
+    # The players still looking at the game see one less player.
+    Game.objects.filter(id=game.id).update(tick_count=F('tick_count') + 1)
+    lobby_lib.invalidate_player_connections(player)
+
+# channel layer functions
+
+def alert_game_lobby_game_started(game):
+    broadcast.group_send(
+        game.channel_layer_name, {"type":"game.started", **get_turn_clock(game)},
+        resumable=True)
+
+def alert_game_players_to_new_move(game, game_delta):
+    """ game_delta is encoded once here for every player. Consumers add
+        their player's fields to the encoded delta, using the slugs sent
+        next to it.
+    """
+    broadcast.group_send(
         game.channel_layer_name, 
         {
             "type":"game.move",
-            "game_state":game_state,
-        })
-
-@async_to_sync
-async def update_count_down_clock(game, player_slug, seconds_left):
-    channel_layer = get_channel_layer()
-    await channel_layer.group_send(
-        game.channel_layer_name, 
-        {
-            "type":"countdown.update",
-            "player_slug":player_slug,
-            "seconds":seconds_left,
-        })
-
-@async_to_sync
-async def push_new_game_feed_message(game_feed_message:GameFeedMessage):
-    channel_layer = get_channel_layer()
-    await channel_layer.group_send(
+            "delta":json.dumps(game_delta),
+            "next_player_slug":game_delta['next_player_slug'],
+            "winner_slug":game_delta['winner']['slug'] if game_delta['winner'] else None,
+        },
+        resumable=True)
+
+def push_new_game_feed_message(game_feed_message:GameFeedMessage):
+    broadcast.group_send(
         game_feed_message.game.channel_layer_name, 
         {
             "type": "new.game.feed.message",
@@ -354,4 +668,5 @@ async def push_new_game_feed_message(game_feed_message:GameFeedMessage):
             "message_type": game_feed_message.message_type,
             "font_awesome_classes": game_feed_message.font_awesome_classes,
             "created_at":game_feed_message.created_at.isoformat(),
-        })
+        },
+        resumable=True)
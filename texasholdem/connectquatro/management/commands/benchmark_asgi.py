@@ -0,0 +1,198 @@
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from channels.http import AsgiHandler
+from channels.routing import ProtocolTypeRouter
+from daphne.server import Server
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.middleware.csrf import _get_new_csrf_token
+from django.test import Client
+
+from connectquatro import lib as cq_lib
+from lobby import lib as lobby_lib
+from lobby.models import Game, Player
+from texasholdem import broadcast
+
+
+BENCHMARK_USER_PREFIX = "benchmark-asgi-"
+
+# Every HTTP request through Django's view stack, as before the async
+# consumers in texasholdem.routing.
+sync_application = ProtocolTypeRouter({'http': AsgiHandler})
+
+
+class Command(BaseCommand):
+
+    help = ('Compare ping, make_move, join_lobby and leave_lobby under daphne, '
+        'served by the sync view stack and by the async consumers. Uses the '
+        'configured database and channel layer. Errors are mostly SQLite '
+        'turning away concurrent writers ("database is locked"), a failed '
+        'move also fails the moves after it.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=25)
+        parser.add_argument('--lobbies', type=int, default=25)
+        parser.add_argument('--moves', type=int, default=20)
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--threads', type=int,
+            help="ASYNC_API_MAX_THREADS for the async stack.")
+        parser.add_argument('--serve', choices=('sync', 'async'),
+            help="Run the daphne server for one stack, used by the benchmark itself.")
+
+    def handle(self, *args, **options):
+        if options['serve']:
+            return self.serve(options['serve'], options['port'], options['threads'])
+
+        self.stdout.write(
+            f"{'stack':>6} {'endpoint':>12} {'requests':>9} {'errors':>7} "
+            f"{'p50 ms':>8} {'p95 ms':>8}")
+        for stack in ('sync', 'async'):
+            self.delete_benchmark_users()
+            clients = self.create_clients(options['games'], options['lobbies'])
+            server_args = [
+                sys.executable, sys.argv[0], 'benchmark_asgi',
+                '--serve', stack, '--port', str(options['port'])]
+            if options['threads']:
+                server_args += ['--threads', str(options['threads'])]
+            server = subprocess.Popen(server_args)
+            try:
+                results, elapsed = asyncio.get_event_loop().run_until_complete(
+                    self.run_clients(clients, options['port'], options['moves']))
+            finally:
+                server.terminate()
+                server.wait()
+                broadcast.wait_for_dispatcher()
+                self.delete_benchmark_users()
+
+            request_count = error_count = 0
+            for endpoint, timings in sorted(results.items()):
+                latencies = sorted(latency for latency, ok in timings)
+                errors = sum(1 for latency, ok in timings if not ok)
+                request_count += len(timings)
+                error_count += errors
+                p95 = latencies[int(len(latencies) * 0.95)]
+                self.stdout.write(
+                    f"{stack:>6} {endpoint:>12} {len(timings):>9} {errors:>7} "
+                    f"{statistics.median(latencies) * 1000:>8.1f} {p95 * 1000:>8.1f}")
+            self.stdout.write(
+                f"{stack:>6} {'total':>12} {request_count:>9} {error_count:>7} "
+                f"{(request_count - error_count) / elapsed:>8.0f} ok req/s")
+
+    def serve(self, stack:str, port:int, threads:int=None):
+        if threads:
+            settings.ASYNC_API_MAX_THREADS = threads
+        if stack == 'async':
+            from texasholdem.routing import application
+        else:
+            application = sync_application
+        Server(
+            application=application,
+            endpoints=[f"tcp:port={port}:interface=127.0.0.1"],
+        ).run()
+
+    def delete_benchmark_users(self):
+        Game.objects.filter(players__user__username__startswith=BENCHMARK_USER_PREFIX).delete()
+        User.objects.filter(username__startswith=BENCHMARK_USER_PREFIX).delete()
+
+    def create_client(self, name:str) -> dict:
+        user = User.objects.create_user(BENCHMARK_USER_PREFIX + name, password='password')
+        player = Player.objects.create(user=user, handle=name)
+        client = Client()
+        client.force_login(user)
+        csrf_token = _get_new_csrf_token()
+        return {
+            'player':player,
+            'headers':{
+                'Cookie':f"sessionid={client.cookies['sessionid'].value}; csrftoken={csrf_token}",
+                'X-CSRFToken':csrf_token,
+            },
+        }
+
+    def create_clients(self, game_count:int, lobby_count:int) -> dict:
+        """ Two players in each started game, and for each lobby a player who
+            joins and leaves it. max_to_win is out of reach so games don't end.
+        """
+        games = []
+        for ix in range(game_count):
+            clients = [self.create_client(f"game{ix}-{p}") for p in range(2)]
+            game = lobby_lib.player_create_connectquat_lobby(
+                clients[0]['player'], f"benchmark {ix}", 10, 10, 2, 4, 600)
+            lobby_lib.player_join_lobby(clients[1]['player'], game)
+            cq_lib.start_game(game)
+            turn_order = dict(Player.objects
+                .filter(game=game)
+                .values_list("id", "turn_order"))
+            clients.sort(key=lambda c: turn_order[c['player'].id])
+            games.append(clients)
+
+        lobbies = []
+        for ix in range(lobby_count):
+            owner = self.create_client(f"owner{ix}")
+            game = lobby_lib.player_create_connectquat_lobby(
+                owner['player'], f"benchmark lobby {ix}", 7, 7, 2, 4, 600)
+            lobbies.append((game.slug, self.create_client(f"lobby{ix}")))
+
+        return {'games':games, 'lobbies':lobbies}
+
+    async def run_clients(self, clients:dict, port:int, moves:int) -> tuple:
+        await wait_for_port(port)
+        results = {}
+        async def request(endpoint, client, method, path, data=None):
+            started_at = time.perf_counter()
+            status = await http_request(port, method, path, client['headers'], data)
+            results.setdefault(endpoint, []).append(
+                (time.perf_counter() - started_at, status in (200, 304)))
+
+        async def play(game_clients):
+            for ix in range(moves):
+                mover, waiter = game_clients[ix % 2], game_clients[(ix + 1) % 2]
+                await request('make_move', mover, 'POST', "/connectquat/move/",
+                    {'column_index':ix % 7})
+                await request('ping', waiter, 'GET', "/connectquat/ping/")
+
+        async def join_and_leave(slug, client):
+            for ix in range(moves):
+                await request('join_lobby', client, 'POST', f"/api/lobby/join/{slug}/", {})
+                await request('leave_lobby', client, 'POST', "/api/lobby/leave/", {})
+
+        started_at = time.perf_counter()
+        await asyncio.gather(
+            *(play(game_clients) for game_clients in clients['games']),
+            *(join_and_leave(slug, client) for slug, client in clients['lobbies']))
+        return results, time.perf_counter() - started_at
+
+
+async def wait_for_port(port:int, timeout=30):
+    give_up_at = time.monotonic() + timeout
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > give_up_at:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def http_request(port:int, method:str, path:str, headers:dict, data=None) -> int:
+    """ One HTTP/1.1 request on a new connection, returns the status.
+    """
+    body = json.dumps(data).encode() if data is not None else b""
+    head = [f"{method} {path} HTTP/1.1", "Host: 127.0.0.1", "Connection: close",
+        f"Content-Length: {len(body)}"]
+    if data is not None:
+        head.append("Content-Type: application/json")
+    head += [f"{name}: {value}" for name, value in headers.items()]
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return int(response.split(b" ", 2)[1])
@@ -0,0 +1,69 @@
+
+import json
+import random
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from connectquatro.models import Board
+from connectquatro import bitboard
+from connectquatro import encoding
+
+
+def _random_board_list(board_length_x, board_length_y, player_ids, fill_ratio):
+    board_list = [[None for i in range(board_length_x)] for j in range(board_length_y)]
+    chips_to_drop = int(board_length_x * board_length_y * fill_ratio)
+    for turn in range(chips_to_drop):
+        col_ix = random.choice(
+            [c for c in range(board_length_x) if board_list[0][c] is None])
+        row_ix = max(r for r in range(board_length_y) if board_list[r][col_ix] is None)
+        board_list[row_ix][col_ix] = player_ids[turn % len(player_ids)]
+    return board_list
+
+
+class Command(BaseCommand):
+
+    help = 'Compare JSON board_list and binary board_state size and encode/decode time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        number = options['number']
+        # (board_length_x, board_length_y, player count)
+        geometries = ((7, 7, 2), (12, 12, 4), (20, 20, 8))
+
+        self.stdout.write(
+            f"{'board':>12} {'format':>8} {'bytes':>7} {'encode us':>10} {'decode us':>10}")
+        for board_length_x, board_length_y, player_count in geometries:
+            player_ids = [random.randint(10000, 999999) for i in range(player_count)]
+            board_list = _random_board_list(
+                board_length_x, board_length_y, player_ids, fill_ratio=0.5)
+
+            json_obj = {
+                Board.STATE_KEY_NEXT_PLAYER_TO_ACT:player_ids[0],
+                Board.STATE_KEY_BOARD_LIST:board_list,
+            }
+            json_state = json.dumps(json_obj)
+
+            binary_obj = {
+                Board.STATE_KEY_NEXT_PLAYER_TO_ACT:player_ids[0],
+                Board.STATE_KEY_BITBOARDS:bitboard.board_list_to_bitboards(board_list),
+                Board.STATE_KEY_COLUMN_HEIGHTS:bitboard.board_list_to_column_heights(board_list),
+            }
+            binary_state = encoding.encode_board_state(
+                binary_obj, board_length_x, board_length_y)
+
+            rows = (
+                ('json', json_state,
+                    lambda: json.dumps(json_obj), lambda: json.loads(json_state)),
+                ('binary', binary_state,
+                    lambda: encoding.encode_board_state(binary_obj, board_length_x, board_length_y),
+                    lambda: encoding.decode_board_state(binary_state)),
+            )
+            label = f"{board_length_x}x{board_length_y}/{player_count}p"
+            for name, state, encode, decode in rows:
+                encode_us = timeit.timeit(encode, number=number) / number * 1e6
+                decode_us = timeit.timeit(decode, number=number) / number * 1e6
+                self.stdout.write(
+                    f"{label:>12} {name:>8} {len(state):>7} {encode_us:>10.2f} {decode_us:>10.2f}")
@@ -0,0 +1,94 @@
+import json
+import random
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from connectquatro.consumers import splice_json
+from connectquatro.management.commands.benchmark_board_state import _random_board_list
+
+
+class Command(BaseCommand):
+
+    help = 'Compare per client CPU time and bytes of a game.move broadcast.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=500)
+        parser.add_argument('--clients', type=int, default=8)
+
+    def handle(self, *args, **options):
+        number = options['number']
+        clients = options['clients']
+        # (board_length_x, board_length_y, player count)
+        geometries = ((7, 7, 2), (12, 12, 4), (20, 20, 8))
+
+        self.stdout.write(
+            f"{'board':>12} {'format':>9} {'bytes':>7} {'us/client':>10}")
+        for board_length_x, board_length_y, player_count in geometries:
+            player_ids = [random.randint(10000, 999999) for i in range(player_count)]
+            players = [
+                {'slug':f"{player_id:x}player", 'id':player_id, 'color':"red"}
+                for player_id in player_ids]
+            slugs = [p['slug'] for p in players]
+            recipient_slugs = [slugs[ix % player_count] for ix in range(clients)]
+            now = timezone.now().isoformat()
+
+            game_state = {
+                'board_list':_random_board_list(
+                    board_length_x, board_length_y, player_ids, fill_ratio=0.5),
+                'legal_columns':list(range(board_length_x)),
+                'tick':40,
+                'players':players,
+                'winner':None,
+                'draw':False,
+                'game_over':False,
+                'active_player':None,
+                'next_player_slug':slugs[1],
+                'turn_deadline':now,
+                'server_time':now,
+            }
+            game_delta = {
+                'tick':40,
+                'move':[3, 2, slugs[0]],
+                'quit_player_slug':None,
+                'next_player_slug':slugs[1],
+                'winner':None,
+                'draw':False,
+                'game_over':False,
+                'turn_deadline':now,
+                'server_time':now,
+            }
+
+            def send_snapshot():
+                # Each consumer edits the state and encodes all of it.
+                for slug in recipient_slugs:
+                    game_state['active_player'] = slug == game_state['next_player_slug']
+                    frame = json.dumps({'type':"game.move", 'game_state':game_state})
+                return frame
+
+            def send_delta():
+                # Each consumer encodes the delta with its fields.
+                for slug in recipient_slugs:
+                    frame = json.dumps({'type':"game.move", 'delta':dict(
+                        game_delta, active_player=slug == game_delta['next_player_slug'])})
+                return frame
+
+            def send_spliced():
+                # The sender encodes the delta once, consumers splice in their fields.
+                encoded_delta = json.dumps(game_delta)
+                for slug in recipient_slugs:
+                    frame = ('{"type":"game.move","delta":' + splice_json(
+                        encoded_delta, {'active_player':slug == game_delta['next_player_slug']})
+                        + '}')
+                return frame
+
+            label = f"{board_length_x}x{board_length_y}/{player_count}p"
+            for name, send in (
+                    ('snapshot', send_snapshot),
+                    ('delta', send_delta),
+                    ('spliced', send_spliced)):
+                frame = send()
+                client_us = timeit.timeit(send, number=number) / number / clients * 1e6
+                self.stdout.write(
+                    f"{label:>12} {name:>9} {len(frame):>7} {client_us:>10.2f}")
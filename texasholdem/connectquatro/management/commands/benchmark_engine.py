@@ -0,0 +1,65 @@
+
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from connectquatro import bitboard
+from connectquatro import sparse
+from connectquatro.engine import (
+    ConnectQuatroGame,
+    SparseConnectQuatroGame,
+    ColumnIsFullError,
+)
+
+
+class Command(BaseCommand):
+
+    help = 'Simulate random Connect Quatro games in memory and report moves per second.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=5000)
+        parser.add_argument('--board-length-x', type=int, default=7)
+        parser.add_argument('--board-length-y', type=int, default=7)
+        parser.add_argument('--max-to-win', type=int, default=4)
+        parser.add_argument('--players', type=int, default=2)
+        parser.add_argument(
+            '--mega', action='store_true', help='Use the sparse mega board engine.')
+
+    def handle(self, *args, **options):
+        geometry_module, game_class = bitboard, ConnectQuatroGame
+        if options['mega']:
+            geometry_module, game_class = sparse, SparseConnectQuatroGame
+        geometry = geometry_module.get_geometry(
+            options['board_length_x'], options['board_length_y'], options['max_to_win'])
+        player_ids = list(range(1, options['players'] + 1))
+        board_length_x = geometry.board_length_x
+
+        # Pre-roll column choices so the RNG is not part of the measurement.
+        rng = random.Random(0)
+        columns = [rng.randrange(board_length_x) for i in range(geometry.cell_count * 4)]
+
+        moves = 0
+        wins = 0
+        draws = 0
+        start = time.perf_counter()
+        for game_ix in range(options['games']):
+            cq_game = game_class(geometry, player_ids, player_ids[0])
+            column_offset = game_ix % len(columns)
+            while not cq_game.is_over:
+                column_ix = columns[column_offset % len(columns)]
+                column_offset += 1
+                try:
+                    cq_game.make_move(column_ix)
+                except ColumnIsFullError:
+                    continue
+                moves += 1
+            if cq_game.is_draw:
+                draws += 1
+            else:
+                wins += 1
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            f"{options['games']} games, {moves} moves ({wins} wins, {draws} draws) "
+            f"in {elapsed:.3f}s: {moves / elapsed:,.0f} moves/s")
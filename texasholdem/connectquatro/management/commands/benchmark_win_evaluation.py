@@ -0,0 +1,68 @@
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from connectquatro import analysis
+from connectquatro import bitboard
+from connectquatro.engine import ConnectQuatroGame, ColumnIsFullError
+
+
+def _random_game(geometry, player_count, rng):
+    player_ids = list(range(1, player_count + 1))
+    cq_game = ConnectQuatroGame(geometry, player_ids, player_ids[0])
+    moves_to_play = rng.randrange(geometry.cell_count)
+    while moves_to_play and not cq_game.is_over:
+        try:
+            cq_game.make_move(rng.randrange(geometry.board_length_x))
+            moves_to_play -= 1
+        except ColumnIsFullError:
+            pass
+    return cq_game
+
+
+class Command(BaseCommand):
+
+    help = 'Compare batched NumPy win evaluation with the scalar bitboard scan.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--boards', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        # (board_length_x, board_length_y, max_to_win, player count)
+        geometries = ((7, 7, 4, 2), (12, 12, 5, 4), (20, 20, 4, 8))
+
+        for board_length_x, board_length_y, max_to_win, player_count in geometries:
+            geometry = bitboard.get_geometry(board_length_x, board_length_y, max_to_win)
+            games = [
+                _random_game(geometry, player_count, rng) for i in range(options['boards'])]
+            stack = np.array(
+                [[[cell or 0 for cell in row] for row in cq_game.board_list] for cq_game in games],
+                dtype=np.int8)
+
+            # Scalar path: a full scan of every player's bitboard, per board.
+            start = time.perf_counter()
+            scalar_winners = []
+            for cq_game in games:
+                winner = 0
+                for player_id in range(1, player_count + 1):
+                    if bitboard.has_win(geometry, cq_game.bitboards.get(player_id, 0)):
+                        winner = player_id
+                        break
+                scalar_winners.append(winner)
+            scalar_elapsed = time.perf_counter() - start
+
+            start = time.perf_counter()
+            vector_winners = analysis.get_winning_slots(stack, max_to_win)
+            vector_elapsed = time.perf_counter() - start
+
+            if list(vector_winners) != scalar_winners:
+                self.stderr.write("scalar and vectorized winners differ")
+
+            label = f"{board_length_x}x{board_length_y}/{max_to_win}/{player_count}p"
+            self.stdout.write(
+                f"{label:>14} {len(games)} boards: scalar {scalar_elapsed * 1000:.1f}ms, "
+                f"numpy {vector_elapsed * 1000:.1f}ms "
+                f"({scalar_elapsed / vector_elapsed:.1f}x)")
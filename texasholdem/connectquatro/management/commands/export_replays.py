@@ -0,0 +1,44 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from connectquatro import replay
+
+
+class Command(BaseCommand):
+
+    help = 'Stream completed Connect Quatro games as NDJSON or binary replays.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format', choices=replay.EXPORT_FORMATS, default=replay.EXPORT_FORMAT_NDJSON)
+        parser.add_argument(
+            '--since', help='Only games completed at or after this ISO 8601 timestamp.')
+        parser.add_argument(
+            '--since-game', type=int,
+            help='With --since, the id of the last exported game: skips the games '
+                'completed at --since up to and including it.')
+        parser.add_argument(
+            '--output', default='-', help='File to write to, stdout by default.')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = replay.parse_since(options['since'])
+            except ValueError:
+                raise CommandError("--since must be an ISO 8601 timestamp")
+
+        is_binary = options['format'] == replay.EXPORT_FORMAT_BINARY
+        if options['output'] == '-':
+            out = sys.stdout.buffer if is_binary else sys.stdout
+        else:
+            out = open(options['output'], 'wb' if is_binary else 'w')
+
+        try:
+            for data in replay.iter_export(
+                    options['format'], since=since, since_game_id=options['since_game']):
+                out.write(data)
+        finally:
+            if out not in (sys.stdout, sys.stdout.buffer):
+                out.close()
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from connectquatro import turn_timer
+from texasholdem import broadcast
+
+
+class Command(BaseCommand):
+
+    help = 'Skip the turns of players who run out of time. Run a single instance.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true', help='Skip the turns due now, then exit.')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            expired_count = turn_timer.expire_due_turns()
+            if expired_count:
+                self.stdout.write(f"skipped {expired_count} turns")
+            if options['once']:
+                broadcast.wait_for_dispatcher()
+                return
+            time.sleep(turn_timer.get_sleep_seconds())
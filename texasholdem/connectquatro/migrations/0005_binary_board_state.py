@@ -0,0 +1,124 @@
+import json
+import struct
+
+from django.db import migrations, models
+
+
+# Frozen copy of the version 1 layout in connectquatro.encoding.
+STATE_VERSION_1 = 1
+HEADER = struct.Struct(">BBBBBBB")
+NOT_SET = 0xFF
+
+
+def _json_state_to_binary(json_state, board_length_x, board_length_y):
+    state = json.loads(json_state)
+    cells = [None] * (board_length_x * board_length_y)
+    if "board_list" in state:
+        for row_ix, row in enumerate(state["board_list"]):
+            for col_ix, player_id in enumerate(row):
+                cells[row_ix * board_length_x + col_ix] = player_id
+    else:
+        for player_id, bits in state["bitboards"].items():
+            for cell_ix in range(len(cells)):
+                if bits >> cell_ix & 1:
+                    cells[cell_ix] = int(player_id)
+
+    player_ids = []
+    for player_id in cells:
+        if player_id is not None and player_id not in player_ids:
+            player_ids.append(player_id)
+    next_player_id = state.get("next_to_act")
+    if next_player_id is not None and next_player_id not in player_ids:
+        player_ids.append(next_player_id)
+
+    bitboards = {player_id:0 for player_id in player_ids}
+    for cell_ix, player_id in enumerate(cells):
+        if player_id is not None:
+            bitboards[player_id] |= 1 << cell_ix
+
+    column_heights = [
+        sum(1 for row_ix in range(board_length_y)
+            if cells[row_ix * board_length_x + col_ix] is not None)
+        for col_ix in range(board_length_x)]
+
+    last_move = state.get("last_move") or (NOT_SET, NOT_SET)
+    bitboard_size = (board_length_x * board_length_y + 7) // 8
+    return b"".join([
+        HEADER.pack(
+            STATE_VERSION_1, board_length_x, board_length_y, len(player_ids),
+            NOT_SET if next_player_id is None else player_ids.index(next_player_id),
+            last_move[0], last_move[1]),
+        struct.pack(f">{len(player_ids)}I", *player_ids),
+        bytes(column_heights),
+        *(bitboards[player_id].to_bytes(bitboard_size, "big") for player_id in player_ids),
+    ])
+
+
+def _binary_state_to_json(binary_state):
+    (version, board_length_x, board_length_y, player_count,
+        next_player_ix, last_row_ix, last_col_ix) = HEADER.unpack_from(binary_state)
+    offset = HEADER.size
+    player_ids = struct.unpack_from(f">{player_count}I", binary_state, offset)
+    offset += 4 * player_count + board_length_x
+
+    bitboard_size = (board_length_x * board_length_y + 7) // 8
+    board_list = [[None for i in range(board_length_x)] for j in range(board_length_y)]
+    for player_id in player_ids:
+        bits = int.from_bytes(binary_state[offset:offset + bitboard_size], "big")
+        offset += bitboard_size
+        for cell_ix in range(board_length_x * board_length_y):
+            if bits >> cell_ix & 1:
+                board_list[cell_ix // board_length_x][cell_ix % board_length_x] = player_id
+
+    state = {
+        "next_to_act":None if next_player_ix == NOT_SET else player_ids[next_player_ix],
+        "board_list":board_list,
+    }
+    if last_row_ix != NOT_SET:
+        state["last_move"] = [last_row_ix, last_col_ix]
+    return json.dumps(state)
+
+
+def forwards(apps, schema_editor):
+    Board = apps.get_model('connectquatro', 'Board')
+    for board in Board.objects.exclude(board_state='').iterator():
+        board.board_state_binary = _json_state_to_binary(
+            board.board_state, board.board_length_x, board.board_length_y)
+        board.save(update_fields=['board_state_binary'])
+
+
+def backwards(apps, schema_editor):
+    Board = apps.get_model('connectquatro', 'Board')
+    for board in Board.objects.exclude(board_state_binary=b'').iterator():
+        board.board_state = _binary_state_to_json(bytes(board.board_state_binary))
+        board.save(update_fields=['board_state'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connectquatro', '0004_auto_20200530_2107'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='board',
+            name='board_state_binary',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.AlterField(
+            model_name='board',
+            name='board_state',
+            field=models.CharField(blank=True, default='', max_length=1000),
+        ),
+        migrations.RunPython(forwards, backwards),
+        migrations.RemoveField(
+            model_name='board',
+            name='board_state',
+        ),
+        migrations.RenameField(
+            model_name='board',
+            old_name='board_state_binary',
+            new_name='board_state',
+        ),
+    ]
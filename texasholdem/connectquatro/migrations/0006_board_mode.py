@@ -0,0 +1,18 @@
+# Generated by Django 3.0.6 on 2026-10-18 19:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connectquatro', '0005_binary_board_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='board',
+            name='mode',
+            field=models.CharField(choices=[('classic', 'Classic'), ('mega', 'Mega Board')], default='classic', max_length=10),
+        ),
+    ]
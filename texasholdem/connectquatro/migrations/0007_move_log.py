@@ -0,0 +1,50 @@
+# Generated by Django 3.0.6 on 2026-10-18 19:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lobby', '0024_completedgame_winner_type'),
+        ('connectquatro', '0006_board_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='board',
+            name='ply_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='Move',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ply', models.PositiveIntegerField()),
+                ('move_type', models.CharField(choices=[('drop', 'Player Dropped A Chip'), ('timeout', 'Player Ran Out Of Time'), ('quit', 'Player Quit')], max_length=8)),
+                ('column', models.SmallIntegerField(blank=True, default=None, null=True)),
+                ('tick', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='moves', to='lobby.Game')),
+                ('player', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='lobby.Player')),
+            ],
+            options={
+                'unique_together': {('game', 'ply')},
+            },
+        ),
+        migrations.CreateModel(
+            name='BoardSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ply', models.PositiveIntegerField()),
+                ('board_state', models.BinaryField()),
+                ('turn_order', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='board_snapshots', to='lobby.Game')),
+            ],
+            options={
+                'unique_together': {('game', 'ply')},
+            },
+        ),
+    ]
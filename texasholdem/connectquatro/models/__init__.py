@@ -1 +1,3 @@
-from .board import Board
\ No newline at end of file
+from .board import Board
+from .board_snapshot import BoardSnapshot
+from .move import Move
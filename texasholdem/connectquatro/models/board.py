@@ -7,12 +7,33 @@ class Board(models.Model):
 
     STATE_KEY_NEXT_PLAYER_TO_ACT = "next_to_act"
     STATE_KEY_BOARD_LIST = "board_list"
+    STATE_KEY_BITBOARDS = "bitboards"
+    STATE_KEY_COLUMN_HEIGHTS = "column_heights"
+    STATE_KEY_LAST_MOVE = "last_move"
+    STATE_KEY_CHIPS = "chips"
+
+    BOARD_MODE_CLASSIC = "classic"
+    BOARD_MODE_MEGA = "mega"
+    BOARD_MODE_CHOICES = (
+        (BOARD_MODE_CLASSIC, "Classic",),
+        (BOARD_MODE_MEGA, "Mega Board",),
+    )
+    # Mega boards are stored and broadcast sparsely. See connectquatro.sparse
+    mode = models.CharField(
+        max_length=10, choices=BOARD_MODE_CHOICES, default=BOARD_MODE_CLASSIC)
 
     game = models.OneToOneField('lobby.Game', on_delete=models.CASCADE)
-    board_state = models.CharField(max_length=1000)
+    # See connectquatro.encoding for the layout.
+    board_state = models.BinaryField(default=b'')
 
     max_to_win = models.IntegerField(default=4)
 
     board_length_x = models.IntegerField(default=7)
     board_length_y = models.IntegerField(default=7)
 
+    # Number of Move rows logged for this game.
+    ply_count = models.PositiveIntegerField(default=0)
+
+    @property
+    def is_mega(self):
+        return self.mode == self.BOARD_MODE_MEGA
@@ -0,0 +1,22 @@
+
+from django.db import models
+
+
+class BoardSnapshot(models.Model):
+    """ Copy of a board_state taken after ply moves, so a board can be
+        rebuilt without replaying the whole game.
+    """
+
+    game = models.ForeignKey('lobby.Game', on_delete=models.CASCADE, related_name="board_snapshots")
+    ply = models.PositiveIntegerField()
+    board_state = models.BinaryField()
+    # Comma separated ids of the players still in the game, in turn order.
+    turn_order = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = (('game', 'ply'),)
+
+    @property
+    def player_ids(self) -> list:
+        return [int(player_id) for player_id in self.turn_order.split(",") if player_id]
@@ -0,0 +1,33 @@
+
+from django.db import models
+
+
+class Move(models.Model):
+    """ Append-only log of everything that changes a board, in ply order.
+        See connectquatro.lib.record_move
+    """
+
+    game = models.ForeignKey('lobby.Game', on_delete=models.CASCADE, related_name="moves")
+    ply = models.PositiveIntegerField()
+    player = models.ForeignKey('lobby.Player', on_delete=models.SET_NULL, null=True)
+
+    MOVE_TYPE_DROP_CHIP = 'drop'
+    MOVE_TYPE_TIMEOUT = 'timeout'
+    MOVE_TYPE_QUIT = 'quit'
+    MOVE_TYPE_CHOICES = (
+        (MOVE_TYPE_DROP_CHIP, "Player Dropped A Chip",),
+        (MOVE_TYPE_TIMEOUT, "Player Ran Out Of Time",),
+        (MOVE_TYPE_QUIT, "Player Quit",),
+    )
+    move_type = models.CharField(max_length=8, choices=MOVE_TYPE_CHOICES)
+
+    # Only set for MOVE_TYPE_DROP_CHIP
+    column = models.SmallIntegerField(null=True, blank=True, default=None)
+    tick = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = (('game', 'ply'),)
+
+    def __str__(self):
+        return f"<Move {self.game_id} #{self.ply} {self.move_type}>"
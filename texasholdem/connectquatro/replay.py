@@ -0,0 +1,209 @@
+""" Streaming export of completed Connect Quatro games.
+
+    Each replay has a header (game and board), the players in turn order,
+    the move log and the result. Completed games are read with a server
+    side cursor and their players, moves and winners are fetched a chunk
+    of CHUNK_SIZE games at a time, so memory stays flat however many games
+    are exported.
+
+    Binary layout, big endian. The stream starts with BINARY_MAGIC, then
+    for each game:
+        game header      GAME_HEADER, see below
+        players          u32 * player_count, in turn order
+        moves            MOVE * move_count, in ply order
+
+    GAME_HEADER is game id u32, completed_at unix time f64, board_length_x
+    u8, board_length_y u8, max_to_win u8, flags u8 (FLAG_MEGA, FLAG_DRAW),
+    player_count u8, winner player index u8 (0xFF if none), move_count u32.
+    MOVE is player index u8 (0xFF if unknown), move type u8 (index into
+    MOVE_TYPES), column u8 (0xFF if not a drop) and tick u32.
+"""
+
+import json
+import struct
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from connectquatro.models import Board, BoardSnapshot, Move
+from lobby.models import CompletedGame, Game
+
+
+EXPORT_FORMAT_NDJSON = 'ndjson'
+EXPORT_FORMAT_BINARY = 'binary'
+EXPORT_FORMATS = (EXPORT_FORMAT_NDJSON, EXPORT_FORMAT_BINARY)
+
+BINARY_MAGIC = b"CQR1"
+GAME_HEADER = struct.Struct(">IdBBBBBBI")
+MOVE = struct.Struct(">BBBI")
+NOT_SET = 0xFF
+FLAG_MEGA = 1
+FLAG_DRAW = 2
+MOVE_TYPES = (Move.MOVE_TYPE_DROP_CHIP, Move.MOVE_TYPE_TIMEOUT, Move.MOVE_TYPE_QUIT)
+
+CHUNK_SIZE = 500
+
+
+def parse_since(value:str):
+    """ An ISO 8601 timestamp for get_completed_games. One without an offset
+        is in the current time zone. Raises ValueError if value isn't one.
+    """
+    since = parse_datetime(value)
+    if since is None:
+        raise ValueError(f"invalid timestamp {value!r}")
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def get_completed_games(since=None, since_game_id=None):
+    """ Completed Connect Quatro games, oldest first, ordered by
+        (completed_at, game id). To export incrementally pass the last
+        exported game's completed_at as since and its id as since_game_id.
+        Without since_game_id the games completed at since are included.
+    """
+    completed_games = CompletedGame.objects.filter(
+        game__game_type=Game.GAME_TYPE_CHOICE_CONNECT_QUAT)
+    if since is not None and since_game_id is not None:
+        completed_games = completed_games.filter(
+            Q(created_at__gt=since) | Q(created_at=since, game_id__gt=since_game_id))
+    elif since is not None:
+        completed_games = completed_games.filter(created_at__gte=since)
+    return completed_games.order_by('created_at', 'game_id')
+
+
+def iter_replays(completed_games):
+    """ Yield one replay dict per completed game.
+    """
+    rows = completed_games.values_list(
+        'id', 'created_at', 'winner_type',
+        'game_id', 'game__slug', 'game__name',
+        'game__board__board_length_x', 'game__board__board_length_y',
+        'game__board__max_to_win', 'game__board__mode')
+
+    chunk = []
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            yield from _iter_chunk_replays(chunk)
+            chunk = []
+    if chunk:
+        yield from _iter_chunk_replays(chunk)
+
+
+def _iter_chunk_replays(chunk:list):
+    completed_game_ids = [row[0] for row in chunk]
+    game_ids = [row[3] for row in chunk]
+
+    winners = {}
+    for completed_game_id, player_id in (CompletedGame.winners.through.objects
+            .filter(completedgame_id__in=completed_game_ids)
+            .values_list('completedgame_id', 'player_id')):
+        winners.setdefault(completed_game_id, []).append(player_id)
+
+    # The first snapshot has the turn order the game started with.
+    turn_orders = dict(BoardSnapshot.objects
+        .filter(game_id__in=game_ids, ply=0)
+        .values_list('game_id', 'turn_order'))
+    players = {}
+    for game_id, player_id, handle, color in (Game.archived_players.through.objects
+            .filter(game_id__in=game_ids)
+            .order_by('game_id', 'player_id')
+            .values_list('game_id', 'player_id', 'player__handle', 'player__color')):
+        players.setdefault(game_id, []).append(
+            {'id':player_id, 'handle':handle, 'color':color})
+    for game_id, game_players in players.items():
+        if turn_orders.get(game_id):
+            turn_order = [int(player_id) for player_id in turn_orders[game_id].split(",")]
+            game_players.sort(
+                key=lambda p: turn_order.index(p['id']) if p['id'] in turn_order else len(turn_order))
+
+    moves = {}
+    for game_id, ply, player_id, move_type, column, tick, created_at in (Move.objects
+            .filter(game_id__in=game_ids)
+            .order_by('game_id', 'ply')
+            .values_list('game_id', 'ply', 'player_id', 'move_type', 'column', 'tick', 'created_at')
+            .iterator()):
+        moves.setdefault(game_id, []).append({
+            'ply':ply,
+            'player_id':player_id,
+            'move_type':move_type,
+            'column':column,
+            'tick':tick,
+            'created_at':created_at,
+        })
+
+    for (completed_game_id, completed_at, winner_type, game_id, slug, name,
+            board_length_x, board_length_y, max_to_win, board_mode) in chunk:
+        yield {
+            'game':{
+                'id':game_id,
+                'slug':slug,
+                'name':name,
+                'completed_at':completed_at,
+            },
+            'board':{
+                'board_length_x':board_length_x,
+                'board_length_y':board_length_y,
+                'max_to_win':max_to_win,
+                'mode':board_mode,
+            },
+            'players':players.get(game_id, []),
+            'moves':moves.get(game_id, []),
+            'result':{
+                'winners':winners.get(completed_game_id, []),
+                'draw':winner_type == CompletedGame.WINNER_TYPE_DRAW,
+            },
+        }
+
+
+def iter_ndjson(replays):
+    for replay in replays:
+        yield json.dumps(replay, cls=DjangoJSONEncoder) + "\n"
+
+
+def iter_binary(replays):
+    yield BINARY_MAGIC
+    move_type_ixs = {move_type:ix for ix, move_type in enumerate(MOVE_TYPES)}
+    for replay in replays:
+        player_ids = [p['id'] for p in replay['players']]
+        player_ixs = {player_id:ix for ix, player_id in enumerate(player_ids)}
+        winners = replay['result']['winners']
+        board = replay['board']
+
+        flags = 0
+        if board['mode'] == Board.BOARD_MODE_MEGA:
+            flags |= FLAG_MEGA
+        if replay['result']['draw']:
+            flags |= FLAG_DRAW
+
+        yield b"".join([
+            GAME_HEADER.pack(
+                replay['game']['id'],
+                replay['game']['completed_at'].timestamp(),
+                board['board_length_x'],
+                board['board_length_y'],
+                board['max_to_win'],
+                flags,
+                len(player_ids),
+                player_ixs.get(winners[0], NOT_SET) if winners else NOT_SET,
+                len(replay['moves'])),
+            struct.pack(f">{len(player_ids)}I", *player_ids),
+            *(
+                MOVE.pack(
+                    player_ixs.get(move['player_id'], NOT_SET),
+                    move_type_ixs[move['move_type']],
+                    NOT_SET if move['column'] is None else move['column'],
+                    move['tick'])
+                for move in replay['moves']
+            ),
+        ])
+
+
+def iter_export(export_format:str, since=None, since_game_id=None):
+    replays = iter_replays(get_completed_games(since, since_game_id))
+    if export_format == EXPORT_FORMAT_BINARY:
+        return iter_binary(replays)
+    return iter_ndjson(replays)
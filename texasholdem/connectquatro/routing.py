@@ -1,4 +1,5 @@
 
+from channels.auth import AuthMiddlewareStack
 from django.urls import re_path
 
 from . import consumers
@@ -6,3 +7,8 @@ from . import consumers
 websocket_urlpatterns = [
     re_path(r'connectquatro/?$', consumers.ConnectQuatroConsumer),
 ]
+
+http_urlpatterns = [
+    re_path(r'^connectquat/ping/$', AuthMiddlewareStack(consumers.ConnectQuatroPingConsumer)),
+    re_path(r'^connectquat/move/$', AuthMiddlewareStack(consumers.ConnectQuatroMoveConsumer)),
+]
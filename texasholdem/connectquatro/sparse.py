@@ -0,0 +1,101 @@
+""" Sparse representation of a mega board.
+
+    Only occupied cells are kept, as a dict of cell_ix to player id, next to
+    the column heights. Cells are numbered like in connectquatro.bitboard:
+    (row_ix * board_length_x + col_ix), row 0 at the top. Nothing here
+    allocates per cell of the board, so memory and the cost of a move grow
+    with the number of chips played rather than with the board area.
+"""
+
+from functools import lru_cache
+
+
+# (row_step, col_step): horizontal, vertical, and both diagonals.
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+
+class Geometry:
+    """ Board dimensions. Win lines are counted, not built.
+    """
+    __slots__ = (
+        'board_length_x',
+        'board_length_y',
+        'max_to_win',
+        'cell_count',
+        'line_count',
+        'min_dead_chip_count',
+    )
+
+    def __init__(self, board_length_x:int, board_length_y:int, max_to_win:int):
+        self.board_length_x = board_length_x
+        self.board_length_y = board_length_y
+        self.max_to_win = max_to_win
+        self.cell_count = board_length_x * board_length_y
+
+        starts_x = max(board_length_x - max_to_win + 1, 0)
+        starts_y = max(board_length_y - max_to_win + 1, 0)
+        self.line_count = (
+            starts_x * board_length_y + board_length_x * starts_y + 2 * starts_x * starts_y)
+        # A dead position has a chip on every line, and a cell is on at most
+        # max_to_win lines in each direction.
+        self.min_dead_chip_count = -(-self.line_count // (4 * max_to_win))
+
+    def cell_ix(self, row_ix:int, col_ix:int) -> int:
+        return row_ix * self.board_length_x + col_ix
+
+
+@lru_cache(maxsize=64)
+def get_geometry(board_length_x:int, board_length_y:int, max_to_win:int) -> Geometry:
+    return Geometry(board_length_x, board_length_y, max_to_win)
+
+
+def get_line_keys(geometry:Geometry, row_ix:int, col_ix:int) -> list:
+    """ Keys of the win lines through (row_ix, col_ix). A key is the first
+        cell of the line times 4 plus the index of its direction.
+    """
+    board_length_x = geometry.board_length_x
+    board_length_y = geometry.board_length_y
+    span = geometry.max_to_win - 1
+    line_keys = []
+    for direction_ix, (row_step, col_step) in enumerate(DIRECTIONS):
+        for offset in range(span + 1):
+            start_row_ix = row_ix - row_step * offset
+            start_col_ix = col_ix - col_step * offset
+            end_row_ix = start_row_ix + row_step * span
+            end_col_ix = start_col_ix + col_step * span
+            if (0 <= start_row_ix and end_row_ix < board_length_y
+                    and 0 <= min(start_col_ix, end_col_ix)
+                    and max(start_col_ix, end_col_ix) < board_length_x):
+                line_keys.append((start_row_ix * board_length_x + start_col_ix) * 4 + direction_ix)
+    return line_keys
+
+
+def is_win_at(geometry:Geometry, cells:dict, row_ix:int, col_ix:int) -> bool:
+    """ Walk out from (row_ix, col_ix) in each direction counting the owner's chips.
+    """
+    board_length_x = geometry.board_length_x
+    board_length_y = geometry.board_length_y
+    max_to_win = geometry.max_to_win
+    owner_id = cells[row_ix * board_length_x + col_ix]
+    for row_step, col_step in DIRECTIONS:
+        in_a_row = 1
+        for sign in (1, -1):
+            next_row_ix = row_ix + row_step * sign
+            next_col_ix = col_ix + col_step * sign
+            while (0 <= next_row_ix < board_length_y and 0 <= next_col_ix < board_length_x
+                    and cells.get(next_row_ix * board_length_x + next_col_ix) == owner_id):
+                in_a_row += 1
+                next_row_ix += row_step * sign
+                next_col_ix += col_step * sign
+        if in_a_row >= max_to_win:
+            return True
+    return False
+
+
+def cells_to_chip_list(geometry:Geometry, cells:dict) -> list:
+    """ [row_ix, col_ix, player_id] for every chip, as sent to clients.
+    """
+    board_length_x = geometry.board_length_x
+    return [
+        [cell_ix // board_length_x, cell_ix % board_length_x, player_id]
+        for cell_ix, player_id in sorted(cells.items())]
@@ -0,0 +1,74 @@
+import random
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from connectquatro import analysis
+from connectquatro import bitboard
+from connectquatro.engine import ConnectQuatroGame, ColumnIsFullError
+from connectquatro.lib import board_obj_to_serialized_state
+from connectquatro.models import Board
+
+
+class TestVectorizedWinEvaluation(SimpleTestCase):
+
+    def _play_random_game(self, geometry, player_count, rng):
+        cq_game = ConnectQuatroGame(geometry, list(range(1, player_count + 1)), 1)
+        moves_to_play = rng.randrange(geometry.cell_count)
+        while moves_to_play and not cq_game.is_over:
+            try:
+                cq_game.make_move(rng.randrange(geometry.board_length_x))
+                moves_to_play -= 1
+            except ColumnIsFullError:
+                pass
+        return cq_game
+
+    def test_batched_winners_match_engine_on_mixed_geometries(self):
+        rng = random.Random(7)
+        boards = []
+        max_to_wins = []
+        expected_winners = []
+        for board_length_x, board_length_y, max_to_win in ((7, 7, 4), (9, 6, 4), (12, 10, 5), (5, 8, 3)):
+            geometry = bitboard.get_geometry(board_length_x, board_length_y, max_to_win)
+            for i in range(60):
+                cq_game = self._play_random_game(geometry, rng.randint(2, 6), rng)
+                boards.append(np.array(
+                    [[cell or 0 for cell in row] for row in cq_game.board_list], dtype=np.int8))
+                max_to_wins.append(max_to_win)
+                expected_winners.append(cq_game.winner_id or 0)
+
+        winners = analysis.get_winning_slots_mixed(boards, max_to_wins)
+        self.assertEqual(list(winners), expected_winners)
+        self.assertTrue(any(expected_winners))
+        self.assertFalse(all(expected_winners))
+
+    def test_diagonal_lines_are_found(self):
+        boards = np.zeros((2, 6, 7), dtype=np.int8)
+        for offset in range(4):
+            boards[0, 2 + offset, 1 + offset] = 2   # down right
+            boards[1, 2 + offset, 6 - offset] = 1   # down left
+        self.assertEqual(list(analysis.get_winning_slots(boards, 4)), [2, 1])
+        self.assertEqual(list(analysis.get_winning_slots(boards, 5)), [0, 0])
+
+    def test_lowest_slot_wins_when_several_have_a_line(self):
+        boards = np.zeros((1, 6, 7), dtype=np.int8)
+        boards[0, 5, :4] = 3
+        boards[0, 4, :4] = 2
+        self.assertEqual(list(analysis.get_winning_slots(boards, 4)), [2])
+
+    def test_stored_board_state_decodes_to_turn_slots(self):
+        board_list = [[None for i in range(7)] for j in range(6)]
+        board_list[5][0] = 42
+        board_list[5][1] = 17
+        board_list[4][0] = 42
+        board_state = board_obj_to_serialized_state({
+            Board.STATE_KEY_NEXT_PLAYER_TO_ACT:17,
+            Board.STATE_KEY_BOARD_LIST:board_list,
+        })
+        board, player_ids = analysis.board_state_to_array(board_state)
+        self.assertEqual(board.shape, (6, 7))
+        self.assertEqual(player_ids, [42, 17])
+        self.assertEqual(board[5, 0], 1)
+        self.assertEqual(board[4, 0], 1)
+        self.assertEqual(board[5, 1], 2)
+        self.assertEqual(int(board.sum()), 4)
@@ -0,0 +1,142 @@
+
+import json
+import threading
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import SimpleTestCase, TransactionTestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from lobby.models import Player, Game, GameFeedMessage
+from connectquatro.models import Board
+from connectquatro import lib as cq_lib
+from texasholdem import broadcast
+from texasholdem.testing import start_patch
+
+
+class TestDispatcher(SimpleTestCase):
+
+    def test_queued_batches_are_waited_on_at_exit(self):
+        sending = threading.Event()
+        sent = []
+        async def send_messages(messages):
+            sending.wait(5)
+            sent.extend(messages)
+
+        dispatcher = broadcast.Dispatcher()
+        mock_register = start_patch(self, broadcast.atexit, 'register')
+        with patch.object(broadcast, 'send_messages', send_messages):
+            dispatcher.put([("game1", {"type":"player.quit"})])
+            dispatcher.put([("lobby", {"type":"room.remove"})])
+            self.assertFalse(dispatcher.join(timeout=0.05))
+            sending.set()
+            self.assertTrue(dispatcher.join(timeout=5))
+
+        mock_register.assert_called_once_with(
+            broadcast.wait_for_dispatcher, broadcast.EXIT_WAIT_SECONDS)
+        self.assertEqual(sent, [
+            ("game1", {"type":"player.quit"}),
+            ("lobby", {"type":"room.remove"}),
+        ])
+
+
+class TestBroadcastCollector(TransactionTestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.mock_send_messages = start_patch(self, broadcast, 'send_messages')
+
+    def test_sends_are_queued_until_collect_exits(self):
+        with broadcast.collect():
+            broadcast.group_send("game1", {"type":"player.quit"})
+            with broadcast.collect():
+                broadcast.group_send("lobby", {"type":"room.remove"})
+            self.mock_send_messages.assert_not_called()
+
+        self.mock_send_messages.assert_called_once_with([
+            ("game1", {"type":"player.quit"}),
+            ("lobby", {"type":"room.remove"}),
+        ])
+
+    def test_sends_wait_for_the_transaction_to_commit(self):
+        with broadcast.collect():
+            with transaction.atomic():
+                broadcast.group_send("game1", {"type":"player.quit"})
+            try:
+                with transaction.atomic():
+                    broadcast.group_send("game1", {"type":"player.joined"})
+                    raise ValueError()
+            except ValueError:
+                pass
+
+        self.mock_send_messages.assert_called_once_with([
+            ("game1", {"type":"player.quit"}),
+        ])
+
+    def test_capture_hands_the_messages_back(self):
+        with broadcast.capture() as messages:
+            broadcast.group_send("game1", {"type":"player.quit"})
+        self.mock_send_messages.assert_not_called()
+        self.assertEqual(messages, [("game1", {"type":"player.quit"})])
+
+        with self.assertRaises(ValueError):
+            with broadcast.capture():
+                broadcast.group_send("game1", {"type":"player.joined"})
+                raise ValueError()
+        self.mock_send_messages.assert_called_once_with([
+            ("game1", {"type":"player.joined"}),
+        ])
+
+    def test_feed_messages_ride_inside_the_game_move_before_them(self):
+        feed_message1 = {"type":"new.game.feed.message", "message":"foo dropped"}
+        feed_message2 = {"type":"new.game.feed.message", "message":"foo won"}
+        with broadcast.collect():
+            broadcast.group_send("game2", feed_message1)
+            broadcast.group_send("game1", {"type":"game.move", "delta":"{}"})
+            broadcast.group_send("game1", feed_message1)
+            broadcast.group_send("game1", feed_message2)
+
+        messages = self.mock_send_messages.call_args[0][0]
+        self.assertEqual(messages, [
+            ("game2", feed_message1),
+            ("game1", {
+                "type":"game.move",
+                "delta":"{}",
+                "feed_messages":json.dumps([feed_message1, feed_message2]),
+            }),
+        ])
+
+    def test_move_request_broadcasts_in_one_send(self):
+        game = Game.objects.create(
+            game_type=Game.GAME_TYPE_CHOICE_CONNECT_QUAT, name="fooo", is_started=True,
+            max_players=2)
+        user1 = User.objects.create_user('testuser1@mail.com', password='password')
+        player1 = Player.objects.create(
+            user=user1, handle="foobar", game=game, turn_order=1)
+        user2 = User.objects.create_user('testuser2@mail.com', password='password')
+        player2 = Player.objects.create(
+            user=user2, handle="foobar", game=game, turn_order=2)
+        Board.objects.create(
+            game=game, board_length_x=7, board_length_y=7,
+            board_state=cq_lib.board_obj_to_serialized_state({
+                Board.STATE_KEY_NEXT_PLAYER_TO_ACT:player1.id,
+                Board.STATE_KEY_BOARD_LIST:[[None for i in range(7)] for j in range(7)],
+            }))
+
+        self.client.login(username='testuser1@mail.com', password='password')
+        response = self.client.post(
+            reverse('api-connectquat-move'), {'column_index':3}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.mock_send_messages.assert_called_once()
+        (group, message), = self.mock_send_messages.call_args[0][0]
+        self.assertEqual(group, game.channel_layer_name)
+        self.assertEqual(message['type'], "game.move")
+        self.assertEqual(json.loads(message['delta'])['move'], [6, 3, player1.slug])
+        feed_messages = json.loads(message['feed_messages'])
+        self.assertEqual(
+            [m['message_type'] for m in feed_messages],
+            [GameFeedMessage.MESSAGE_TYPE_PLAYER_MOVE_DROP_CHIP])
@@ -0,0 +1,103 @@
+
+from django.contrib.auth.models import User
+from rest_framework.test import APITestCase
+
+from lobby.models import Player, Game, CompletedGame, GameFeedMessage
+from connectquatro.models import Board, Move
+from connectquatro import lib as cq_lib
+
+
+class TestConnectQuatroCommitMove(APITestCase):
+
+    def setUp(self):
+        self.game = Game.objects.create(
+            name="foobar", game_type=Game.GAME_TYPE_CHOICE_CONNECT_QUAT,
+            is_started=True, max_players=2)
+        self.user1 = User.objects.create_user('testuser1@mail.com', password='password')
+        self.player1 = Player.objects.create(
+            user=self.user1, handle="foobar", game=self.game, turn_order=1)
+        self.user2 = User.objects.create_user('testuser2@mail.com', password='password')
+        self.player2 = Player.objects.create(
+            user=self.user2, handle="foobar", game=self.game, turn_order=2)
+        self.game.archived_players.set([self.player1, self.player2])
+
+        board_list = [[None for i in range(7)] for j in range(7)]
+        for row_ix in (4, 5, 6):
+            board_list[row_ix][0] = self.player1.id
+            board_list[row_ix][1] = self.player2.id
+        self.board = Board.objects.create(
+            game=self.game, max_to_win=4, board_length_x=7, board_length_y=7,
+            board_state=cq_lib.board_obj_to_serialized_state({
+                Board.STATE_KEY_NEXT_PLAYER_TO_ACT:self.player1.id,
+                Board.STATE_KEY_BOARD_LIST:board_list,
+            }))
+
+    def test_normal_move_queries(self):
+        # players, savepoint, tick, board, move, feed message, release
+        with self.assertNumQueries(7):
+            game_over, winning_player, feed_messages = cq_lib.commit_move(
+                self.game, self.board, self.player1, 3)
+
+        self.assertFalse(game_over)
+        self.assertIsNone(winning_player)
+        self.assertEqual(len(feed_messages), 1)
+
+        self.game.refresh_from_db()
+        self.board.refresh_from_db()
+        self.assertEqual(self.game.tick_count, 1)
+        self.assertIsNotNone(self.game.turn_deadline)
+        self.assertEqual(self.board.ply_count, 1)
+        self.assertEqual(cq_lib.get_active_player_id_from_board(self.board), self.player2.id)
+        self.assertEqual(cq_lib.board_state_to_obj(self.board)[Board.STATE_KEY_BOARD_LIST][6][3], self.player1.id)
+        self.assertEqual(Move.objects.get(game=self.game).column, 3)
+
+    def test_winning_move_queries(self):
+        # players, savepoint, tick and game over, board, move,
+        # feed message, completed game, winner, result feed message, release
+        with self.assertNumQueries(10):
+            game_over, winning_player, feed_messages = cq_lib.commit_move(
+                self.game, self.board, self.player1, 0)
+
+        self.assertTrue(game_over)
+        self.assertEqual(winning_player, self.player1)
+        self.assertEqual(
+            [gfm.message_type for gfm in feed_messages],
+            [GameFeedMessage.MESSAGE_TYPE_PLAYER_MOVE_DROP_CHIP, GameFeedMessage.MESSAGE_TYPE_GAME_STATUS])
+
+        self.game.refresh_from_db()
+        self.assertTrue(self.game.is_over)
+        self.assertIsNone(self.game.turn_deadline)
+        self.assertEqual(self.game.tick_count, 1)
+        self.assertEqual(list(self.game.completedgame.winners.all()), [self.player1])
+        self.assertEqual(cq_lib.get_game_over_state(self.board), (True, self.player1))
+
+    def test_illegal_move_writes_nothing(self):
+        with self.assertRaises(cq_lib.ColumnOutOfRangeError):
+            cq_lib.commit_move(self.game, self.board, self.player1, 7)
+
+        self.game.refresh_from_db()
+        self.board.refresh_from_db()
+        self.assertEqual(self.game.tick_count, 0)
+        self.assertEqual(self.board.ply_count, 0)
+        self.assertFalse(Move.objects.exists())
+        self.assertFalse(CompletedGame.objects.exists())
+
+    def test_game_delta_has_the_move_and_the_turn_change(self):
+        cq_lib.commit_move(self.game, self.board, self.player1, 3)
+
+        with self.assertNumQueries(1):
+            game_delta = cq_lib.get_game_delta(self.game, self.board, moving_player=self.player1)
+        self.assertEqual(game_delta['tick'], 1)
+        self.assertEqual(game_delta['move'], [6, 3, self.player1.slug])
+        self.assertEqual(game_delta['next_player_slug'], self.player2.slug)
+        self.assertEqual(game_delta['turn_deadline'], self.game.turn_deadline.isoformat())
+        self.assertFalse(game_delta['game_over'])
+
+        game_state, _ = cq_lib.get_game_state(self.board)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                cq_lib.get_game_delta(
+                    self.game, self.board, moving_player=self.player1,
+                    players=game_state['players'])['next_player_slug'],
+                self.player2.slug)
+        self.assertEqual(game_state['tick'], game_delta['tick'])
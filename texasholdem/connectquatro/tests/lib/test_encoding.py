@@ -0,0 +1,66 @@
+from django.test import SimpleTestCase
+
+from connectquatro.models import Board
+from connectquatro import bitboard
+from connectquatro import encoding
+
+
+class TestBoardStateEncoding(SimpleTestCase):
+
+    def test_board_state_round_trips_through_binary_encoding(self):
+        board_list = [[None for i in range(20)] for j in range(20)]
+        board_list[19][0] = 4000000000
+        board_list[19][19] = 12
+        board_list[18][19] = 7
+        board_state = {
+            Board.STATE_KEY_NEXT_PLAYER_TO_ACT:31,
+            Board.STATE_KEY_BITBOARDS:bitboard.board_list_to_bitboards(board_list),
+            Board.STATE_KEY_COLUMN_HEIGHTS:bitboard.board_list_to_column_heights(board_list),
+            Board.STATE_KEY_LAST_MOVE:[18, 19],
+        }
+        data = encoding.encode_board_state(board_state, 20, 20)
+
+        # header, 4x player ids, column heights, 4x 50 byte bitboards
+        self.assertEqual(len(data), encoding.HEADER.size + 4 * 4 + 20 + 4 * 50)
+        self.assertEqual(encoding.decode_board_state(data), board_state)
+
+    def test_empty_board_without_last_move_round_trips(self):
+        board_state = {
+            Board.STATE_KEY_NEXT_PLAYER_TO_ACT:5,
+            Board.STATE_KEY_BITBOARDS:{},
+            Board.STATE_KEY_COLUMN_HEIGHTS:[0 for i in range(7)],
+        }
+        data = encoding.encode_board_state(board_state, 7, 7)
+        self.assertEqual(encoding.decode_board_state(data), board_state)
+
+    def test_unknown_version_is_rejected(self):
+        board_state = {
+            Board.STATE_KEY_NEXT_PLAYER_TO_ACT:5,
+            Board.STATE_KEY_BITBOARDS:{},
+            Board.STATE_KEY_COLUMN_HEIGHTS:[0 for i in range(7)],
+        }
+        data = b"\x09" + encoding.encode_board_state(board_state, 7, 7)[1:]
+        self.assertRaises(
+            encoding.UnknownStateVersionError,
+            lambda: encoding.decode_board_state(data))
+
+    def test_sparse_board_state_size_depends_on_chips_played(self):
+        board_state = {
+            Board.STATE_KEY_NEXT_PLAYER_TO_ACT:12,
+            Board.STATE_KEY_CHIPS:{
+                199 * 200 + 0:4000000000,
+                198 * 200 + 0:12,
+                199 * 200 + 150:7,
+            },
+            Board.STATE_KEY_COLUMN_HEIGHTS:[0 for i in range(200)],
+            Board.STATE_KEY_LAST_MOVE:[199, 150],
+        }
+        board_state[Board.STATE_KEY_COLUMN_HEIGHTS][0] = 2
+        board_state[Board.STATE_KEY_COLUMN_HEIGHTS][150] = 1
+        data = encoding.encode_board_state(board_state, 200, 200)
+
+        # header, 3x player ids, column heights, 1 byte per chip
+        self.assertEqual(data[0], encoding.STATE_VERSION_2)
+        self.assertEqual(len(data), encoding.HEADER.size + 3 * 4 + 200 + 3)
+        self.assertEqual(encoding.decode_board_state(data), board_state)
+
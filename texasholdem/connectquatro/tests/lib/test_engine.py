@@ -0,0 +1,182 @@
+from django.test import SimpleTestCase
+
+import random
+
+from connectquatro import bitboard
+from connectquatro import engine
+from connectquatro import sparse
+from connectquatro.engine import ConnectQuatroGame, SparseConnectQuatroGame
+
+
+class TestConnectQuatroEngine(SimpleTestCase):
+
+    def setUp(self):
+        self.geometry = bitboard.get_geometry(7, 6, 4)
+
+    def test_moves_rotate_turns_in_player_order(self):
+        cq_game = ConnectQuatroGame(self.geometry, [30, 10, 20], 30)
+        self.assertEqual(cq_game.make_move(3), 5)
+        self.assertEqual(cq_game.next_player_id, 10)
+        self.assertEqual(cq_game.make_move(3), 4)
+        self.assertEqual(cq_game.next_player_id, 20)
+        cq_game.make_move(0)
+        self.assertEqual(cq_game.next_player_id, 30)
+        self.assertEqual(cq_game.column_heights, [1, 0, 0, 2, 0, 0, 0])
+        self.assertEqual(cq_game.board_list[5][3], 30)
+        self.assertEqual(cq_game.board_list[4][3], 10)
+        self.assertEqual(cq_game.board_list[5][0], 20)
+
+    def test_timeout_passes_the_turn(self):
+        cq_game = ConnectQuatroGame(self.geometry, [1, 2], 2)
+        self.assertEqual(cq_game.cycle_player_turn(), 1)
+        self.assertEqual(cq_game.chip_count, 0)
+
+    def test_vertical_win_ends_the_game(self):
+        cq_game = ConnectQuatroGame(self.geometry, [1, 2], 1)
+        for i in range(3):
+            cq_game.make_move(0)
+            cq_game.make_move(1)
+        cq_game.make_move(0)
+        self.assertTrue(cq_game.is_over)
+        self.assertEqual(cq_game.winner_id, 1)
+        self.assertEqual(cq_game.next_player_id, 1)
+        self.assertRaises(engine.GameOverError, lambda: cq_game.make_move(2))
+
+    def test_board_without_any_line_is_a_draw(self):
+        geometry = bitboard.get_geometry(2, 2, 3)
+        cq_game = ConnectQuatroGame(geometry, [1, 2], 1)
+        self.assertTrue(cq_game.is_draw)
+        self.assertIsNone(cq_game.winner_id)
+        self.assertRaises(engine.GameOverError, lambda: cq_game.make_move(0))
+
+    def test_game_is_drawn_once_every_line_is_blocked(self):
+        geometry = bitboard.get_geometry(3, 2, 3)
+        cq_game = ConnectQuatroGame(geometry, [1, 2], 1)
+        for column_ix in (0, 1, 0):
+            cq_game.make_move(column_ix)
+        self.assertEqual(cq_game.get_open_line_count(), 1)
+        self.assertFalse(cq_game.is_over)
+        cq_game.make_move(1)
+        self.assertTrue(cq_game.is_draw)
+        self.assertEqual(cq_game.chip_count, 4)
+        self.assertEqual(cq_game.legal_columns, [2])
+
+    def test_lines_held_by_a_quitting_player_close(self):
+        geometry = bitboard.get_geometry(3, 2, 3)
+        cq_game = ConnectQuatroGame(geometry, [1, 2, 3], 1)
+        for column_ix in (0, 1, 2, 0):
+            cq_game.make_move(column_ix)
+        self.assertEqual(cq_game.get_open_line_count(), 1)
+        cq_game.remove_player(1)
+        self.assertEqual(cq_game.get_open_line_count(), 0)
+        self.assertTrue(cq_game.is_draw)
+
+        loaded_game = ConnectQuatroGame.from_state(geometry, cq_game.to_state(), [2, 3])
+        self.assertTrue(loaded_game.is_draw)
+
+    def test_illegal_columns_are_rejected(self):
+        cq_game = ConnectQuatroGame(self.geometry, [1, 2], 1)
+        for i in range(6):
+            cq_game.make_move(2)
+        self.assertNotIn(2, cq_game.legal_columns)
+        self.assertRaises(engine.ColumnIsFullError, lambda: cq_game.make_move(2))
+        self.assertRaises(engine.ColumnOutOfRangeError, lambda: cq_game.make_move(7))
+        self.assertRaises(engine.ColumnOutOfRangeError, lambda: cq_game.make_move(-1))
+
+    def test_quitting_player_on_turn_hands_turn_to_first_player(self):
+        cq_game = ConnectQuatroGame(self.geometry, [1, 2, 3], 2)
+        cq_game.make_move(0)
+        cq_game.remove_player(3)
+        self.assertEqual(cq_game.next_player_id, 1)
+        self.assertFalse(cq_game.is_over)
+        self.assertEqual(cq_game.bitboards[2], 1 << self.geometry.cell_ix(5, 0))
+
+    def test_last_player_left_wins(self):
+        cq_game = ConnectQuatroGame(self.geometry, [1, 2], 1)
+        cq_game.remove_player(1)
+        self.assertTrue(cq_game.is_over)
+        self.assertEqual(cq_game.winner_id, 2)
+
+    def test_line_owners_are_built_once_a_draw_is_possible(self):
+        cq_game = ConnectQuatroGame(self.geometry, [1, 2], 1)
+        for column_ix in (0, 1, 2, 3, 4, 5, 6, 0, 1, 2):
+            cq_game.make_move(column_ix)
+        self.assertIsNone(cq_game.line_owners)
+        loaded_game = ConnectQuatroGame.from_state(self.geometry, cq_game.to_state(), [1, 2])
+        self.assertIsNone(loaded_game.line_owners)
+
+        # Only dropped chips and quits are counted once line_owners is built.
+        open_line_count = loaded_game.get_open_line_count()
+        loaded_game.make_move(3)
+        self.assertLess(loaded_game.open_line_count, open_line_count)
+        self.assertEqual(
+            loaded_game.open_line_count,
+            ConnectQuatroGame.from_state(
+                self.geometry, loaded_game.to_state(), [1, 2]).get_open_line_count())
+
+    def test_game_round_trips_through_state(self):
+        cq_game = ConnectQuatroGame(self.geometry, [1, 2], 1)
+        for column_ix in (3, 3, 4, 4, 5, 5):
+            cq_game.make_move(column_ix)
+        loaded_game = ConnectQuatroGame.from_state(self.geometry, cq_game.to_state(), [1, 2])
+        self.assertEqual(loaded_game.next_player_id, 1)
+        self.assertEqual(loaded_game.chip_count, 6)
+        loaded_game.make_move(6)
+        self.assertEqual(loaded_game.winner_id, 1)
+
+
+class TestSparseConnectQuatroEngine(SimpleTestCase):
+
+    def test_sparse_engine_matches_bitboard_engine(self):
+        rng = random.Random(3)
+        for board_length_x, board_length_y, max_to_win, player_count in (
+                (7, 6, 4, 2), (9, 5, 3, 3), (12, 12, 5, 8)):
+            dense_geometry = bitboard.get_geometry(board_length_x, board_length_y, max_to_win)
+            sparse_geometry = sparse.get_geometry(board_length_x, board_length_y, max_to_win)
+            self.assertEqual(sparse_geometry.line_count, len(dense_geometry.win_lines))
+            for game_ix in range(10):
+                player_ids = list(range(1, player_count + 1))
+                dense_game = ConnectQuatroGame(dense_geometry, player_ids, 1)
+                sparse_game = SparseConnectQuatroGame(sparse_geometry, player_ids, 1)
+                # Never asked for its line count, so it only builds line_owners to check for a draw.
+                lazy_game = ConnectQuatroGame(dense_geometry, player_ids, 1)
+                while not dense_game.is_over:
+                    column_ix = rng.choice(dense_game.legal_columns)
+                    dense_game.make_move(column_ix)
+                    sparse_game.make_move(column_ix)
+                    lazy_game.make_move(column_ix)
+                    self.assertEqual(sparse_game.get_open_line_count(), dense_game.get_open_line_count())
+                    self.assertEqual(lazy_game.is_draw, dense_game.is_draw)
+                self.assertTrue(sparse_game.is_over)
+                self.assertEqual(sparse_game.winner_id, dense_game.winner_id)
+                self.assertEqual(sparse_game.is_draw, dense_game.is_draw)
+                self.assertEqual(sparse_game.column_heights, dense_game.column_heights)
+
+                loaded_game = SparseConnectQuatroGame.from_state(
+                    sparse_geometry, sparse_game.to_state(), player_ids)
+                self.assertEqual(loaded_game.winner_id, dense_game.winner_id)
+                self.assertEqual(loaded_game.get_open_line_count(), dense_game.get_open_line_count())
+
+    def test_mega_board_only_tracks_played_chips(self):
+        geometry = sparse.get_geometry(200, 200, 4)
+        cq_game = SparseConnectQuatroGame(geometry, [1, 2, 3], 1)
+        for column_ix in (0, 199, 100, 0, 199):
+            cq_game.make_move(column_ix)
+        self.assertEqual(len(cq_game.cells), 5)
+        self.assertIsNone(cq_game.line_owners)
+        cq_game.get_open_line_count()
+        self.assertLessEqual(len(cq_game.line_owners), 5 * 4 * 4)
+        self.assertEqual(cq_game.chips, [[198, 0, 1], [198, 199, 2], [199, 0, 1], [199, 100, 3], [199, 199, 2]])
+
+        for i in range(2):
+            cq_game.make_move(50)
+            cq_game.make_move(51)
+            cq_game.make_move(150)
+        cq_game.make_move(50)
+        self.assertFalse(cq_game.is_over)
+        cq_game.make_move(51)
+        self.assertFalse(cq_game.is_over)
+        cq_game.make_move(150)
+        cq_game.make_move(50)
+        self.assertEqual(cq_game.winner_id, 3)
+
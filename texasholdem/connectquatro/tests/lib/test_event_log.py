@@ -0,0 +1,47 @@
+import uuid
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from texasholdem import event_log
+
+
+@override_settings(EVENT_LOG=dict(settings.EVENT_LOG, SIZE=3))
+class TestEventLog(SimpleTestCase):
+
+    def setUp(self):
+        self.group = uuid.uuid4().hex
+
+    def _append(self, message):
+        return async_to_sync(event_log.append)(self.group, message)
+
+    def _read_since(self, seq):
+        return async_to_sync(event_log.read_since)(self.group, seq)
+
+    def test_events_are_numbered_from_one(self):
+        self.assertEqual(async_to_sync(event_log.get_seq)(self.group), 0)
+        self.assertEqual(self._append({"type":"player.quit"}), 1)
+        self.assertEqual(self._append({"type":"game.move"}), 2)
+        self.assertEqual(async_to_sync(event_log.get_seq)(self.group), 2)
+
+    def test_read_since_returns_the_events_after_seq(self):
+        for ix in range(3):
+            self._append({"type":"game.move", "ix":ix})
+
+        self.assertEqual(self._read_since(1), [
+            {"type":"game.move", "ix":1, "seq":2},
+            {"type":"game.move", "ix":2, "seq":3},
+        ])
+        self.assertEqual(self._read_since(3), [])
+
+    def test_read_since_returns_none_once_events_are_evicted(self):
+        for ix in range(4):
+            self._append({"type":"game.move", "ix":ix})
+
+        self.assertEqual([e['seq'] for e in self._read_since(1)], [2, 3, 4])
+        self.assertIsNone(self._read_since(0))
+
+    def test_read_since_returns_none_for_a_seq_ahead_of_the_log(self):
+        self._append({"type":"game.move"})
+        self.assertIsNone(self._read_since(5))
@@ -0,0 +1,99 @@
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework import status
+
+from lobby.models import Player, Game
+from lobby import lib as lobby_lib
+from connectquatro.models import Board, BoardSnapshot, Move
+from connectquatro import lib as cq_lib
+from connectquatro import turn_timer
+
+
+class TestConnectQuatroMoveLog(APITestCase):
+
+    def setUp(self):
+        self.game = Game.objects.create(
+            game_type=Game.GAME_TYPE_CHOICE_CONNECT_QUAT, name="fooo", max_players=3)
+        self.board = Board.objects.create(
+            game=self.game, board_length_x=7, board_length_y=6, max_to_win=4)
+        self.players = []
+        for ix in range(3):
+            user = User.objects.create_user(f'testuser{ix}@mail.com', password='password')
+            self.players.append(Player.objects.create(user=user, handle="foobar", game=self.game))
+
+        self.patches = [
+            patch.object(cq_lib, 'MOVE_SNAPSHOT_INTERVAL', 4),
+            patch.object(cq_lib, 'alert_game_lobby_game_started'),
+            patch.object(cq_lib, 'alert_game_players_to_new_move'),
+            patch.object(cq_lib, 'push_new_game_feed_message'),
+            patch.object(lobby_lib, 'update_lobby_list_remove_game'),
+            patch.object(lobby_lib, 'invalidate_player_connections'),
+        ]
+        for p in self.patches:
+            p.start()
+        cq_lib.start_game(self.game)
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+
+    def _active_player(self):
+        self.board.refresh_from_db()
+        active_player_id = cq_lib.get_active_player_id_from_board(self.board)
+        return Player.objects.get(id=active_player_id)
+
+    def _drop_chip(self, column_ix):
+        self.client.force_authenticate(self._active_player().user)
+        response = self.client.post(
+            reverse('api-connectquat-move'), {'column_index':column_ix}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def _current_state(self):
+        self.board.refresh_from_db()
+        cq_game = cq_lib.load_game(self.board)
+        return cq_game.board_list, cq_game.next_player_id, cq_game.column_heights
+
+    def _reconstructed_state(self, ply=None):
+        cq_game = cq_lib.reconstruct_game(self.board, ply=ply)
+        return cq_game.board_list, cq_game.next_player_id, cq_game.column_heights
+
+    def test_moves_timeouts_and_quits_are_logged_and_replayable(self):
+        states_by_ply = {0:self._current_state()}
+        for column_ix in (3, 3, 4):
+            self._drop_chip(column_ix)
+            states_by_ply[self.board.ply_count] = self._current_state()
+
+        self.game.refresh_from_db()
+        timed_out_player = self._active_player()
+        turn_timer.expire_turn(self.game.id, self.game.tick_count, self.game.turn_deadline)
+        states_by_ply[4] = self._current_state()
+
+        quitting_player = self._active_player()
+        cq_lib.remove_player_from_active_game(quitting_player)
+        states_by_ply[5] = self._current_state()
+
+        for column_ix in (0, 1, 0):
+            self._drop_chip(column_ix)
+            self.board.refresh_from_db()
+            states_by_ply[self.board.ply_count] = self._current_state()
+
+        moves = list(Move.objects.filter(game=self.game).order_by('ply'))
+        self.assertEqual([m.ply for m in moves], list(range(1, 9)))
+        self.assertEqual(
+            [m.move_type for m in moves],
+            ['drop', 'drop', 'drop', 'timeout', 'quit', 'drop', 'drop', 'drop'])
+        self.assertEqual([m.column for m in moves[:3]], [3, 3, 4])
+        self.assertEqual(moves[3].player, timed_out_player)
+        self.assertEqual(moves[4].player, quitting_player)
+        self.assertEqual(moves[3].tick, 4)
+
+        self.assertEqual(
+            list(BoardSnapshot.objects.filter(game=self.game).values_list('ply', flat=True)),
+            [0, 4, 8])
+
+        self.assertEqual(self._reconstructed_state(), self._current_state())
+        for ply, state in states_by_ply.items():
+            self.assertEqual(self._reconstructed_state(ply), state)
@@ -0,0 +1,149 @@
+import json
+import os
+import struct
+import tempfile
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management import call_command, CommandError
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework import status
+
+from lobby.models import Player, Game, CompletedGame
+from connectquatro.models import Board, BoardSnapshot, Move
+from connectquatro import replay
+
+
+class TestReplayExport(APITestCase):
+
+    def setUp(self):
+        self.user1 = User.objects.create_user('testuser1@mail.com', password='password')
+        self.player1 = Player.objects.create(user=self.user1, handle="foobar")
+        self.user2 = User.objects.create_user('testuser2@mail.com', password='password')
+        self.player2 = Player.objects.create(user=self.user2, handle="barfoo")
+        self.admin = User.objects.create_superuser('admin@mail.com', password='password')
+
+        self.won_game = self._create_completed_game(
+            [(self.player2, 3), (self.player1, 4), (self.player2, None), (self.player1, 3)],
+            winner=self.player1)
+        self.drawn_game = self._create_completed_game([(self.player1, 0)], winner=None)
+        self.won_game.completedgame.created_at = timezone.now() - timedelta(days=1)
+        self.won_game.completedgame.save(update_fields=['created_at'])
+        self.won_game.completedgame.refresh_from_db()
+
+    def _create_completed_game(self, moves, winner):
+        game = Game.objects.create(
+            game_type=Game.GAME_TYPE_CHOICE_CONNECT_QUAT, name="fooo",
+            is_started=True, is_over=True, max_players=2)
+        game.archived_players.set([self.player1, self.player2])
+        Board.objects.create(game=game, board_length_x=7, board_length_y=6, ply_count=len(moves))
+        BoardSnapshot.objects.create(
+            game=game, ply=0, board_state=b'',
+            turn_order=f"{self.player2.id},{self.player1.id}")
+        for ix, (player, column) in enumerate(moves):
+            Move.objects.create(
+                game=game, ply=ix + 1, player=player, column=column, tick=ix + 1,
+                move_type=Move.MOVE_TYPE_TIMEOUT if column is None else Move.MOVE_TYPE_DROP_CHIP)
+        if winner:
+            CompletedGame.objects.create(game=game).winners.set([winner])
+        else:
+            CompletedGame.objects.create(game=game, winner_type=CompletedGame.WINNER_TYPE_DRAW)
+        return game
+
+    def test_ndjson_export_streams_one_replay_per_line(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse('api-connectquat-replays'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+
+        won_replay, drawn_replay = [json.loads(line) for line in lines]
+        self.assertEqual(won_replay['game']['slug'], self.won_game.slug)
+        self.assertEqual(
+            [p['id'] for p in won_replay['players']], [self.player2.id, self.player1.id])
+        self.assertEqual([m['column'] for m in won_replay['moves']], [3, 4, None, 3])
+        self.assertEqual(won_replay['moves'][2]['move_type'], Move.MOVE_TYPE_TIMEOUT)
+        self.assertEqual(won_replay['result'], {'winners':[self.player1.id], 'draw':False})
+        self.assertEqual(drawn_replay['result'], {'winners':[], 'draw':True})
+        self.assertEqual(drawn_replay['board']['board_length_y'], 6)
+
+    def _export_game_ids(self, params):
+        response = self.client.get(reverse('api-connectquat-replays'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        return [json.loads(line)['game']['id'] for line in lines]
+
+    def test_export_since_only_returns_newer_games(self):
+        self.client.force_authenticate(self.admin)
+        since = self.won_game.completedgame.created_at.isoformat()
+        self.assertEqual(
+            self._export_game_ids({'since':since, 'since_game':self.won_game.id}),
+            [self.drawn_game.id])
+        self.assertEqual(
+            self._export_game_ids({'since':since}), [self.won_game.id, self.drawn_game.id])
+
+    def test_export_since_keeps_games_completed_at_the_same_time(self):
+        completed_at = self.won_game.completedgame.created_at
+        CompletedGame.objects.filter(game=self.drawn_game).update(created_at=completed_at)
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(
+            self._export_game_ids({'since':completed_at.isoformat(), 'since_game':self.won_game.id}),
+            [self.drawn_game.id])
+
+    def test_export_with_an_empty_since_returns_every_game(self):
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(
+            self._export_game_ids({'since':''}), [self.won_game.id, self.drawn_game.id])
+
+    def test_export_rejects_an_invalid_since(self):
+        self.client.force_authenticate(self.admin)
+        for since in ("yesterday", "2020-13-01T00:00:00"):
+            response = self.client.get(reverse('api-connectquat-replays'), {'since':since})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_since_without_an_offset_is_in_the_current_time_zone(self):
+        completed_at = self.won_game.completedgame.created_at
+        self.client.force_authenticate(self.admin)
+        with timezone.override('America/New_York'):
+            since = timezone.make_naive(completed_at).isoformat()
+            self.assertEqual(
+                self._export_game_ids({'since':since, 'since_game':self.won_game.id}),
+                [self.drawn_game.id])
+
+    def test_export_command_rejects_an_invalid_since(self):
+        with self.assertRaises(CommandError):
+            call_command('export_replays', since="yesterday", output=os.devnull)
+
+    def test_only_admins_can_export(self):
+        self.client.force_authenticate(self.user1)
+        response = self.client.get(reverse('api-connectquat-replays'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_binary_export_from_management_command(self):
+        with tempfile.NamedTemporaryFile() as f:
+            call_command('export_replays', format='binary', output=f.name)
+            data = open(f.name, 'rb').read()
+
+        self.assertEqual(data[:4], replay.BINARY_MAGIC)
+        offset = 4
+        (game_id, completed_at, board_length_x, board_length_y, max_to_win, flags,
+            player_count, winner_ix, move_count) = replay.GAME_HEADER.unpack_from(data, offset)
+        offset += replay.GAME_HEADER.size
+        self.assertEqual(game_id, self.won_game.id)
+        self.assertEqual((board_length_x, board_length_y, flags), (7, 6, 0))
+        player_ids = struct.unpack_from(f">{player_count}I", data, offset)
+        offset += 4 * player_count
+        self.assertEqual(player_ids[winner_ix], self.player1.id)
+        moves = [replay.MOVE.unpack_from(data, offset + ix * replay.MOVE.size) for ix in range(move_count)]
+        offset += move_count * replay.MOVE.size
+        self.assertEqual(moves[0], (0, 0, 3, 1))
+        self.assertEqual(moves[2], (0, 1, replay.NOT_SET, 3))
+
+        header = replay.GAME_HEADER.unpack_from(data, offset)
+        self.assertEqual(header[0], self.drawn_game.id)
+        self.assertEqual(header[5], replay.FLAG_DRAW)
+        self.assertEqual(header[7], replay.NOT_SET)
+        self.assertEqual(
+            len(data), offset + replay.GAME_HEADER.size + 4 * 2 + replay.MOVE.size)
@@ -0,0 +1,126 @@
+
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from lobby.models import Player, Game, GameFeedMessage
+from connectquatro.models import Board, Move
+from connectquatro import lib as cq_lib
+from connectquatro import turn_timer
+from texasholdem.testing import start_patch
+
+
+class TestConnectQuatroTurnTimer(APITestCase):
+
+    def setUp(self):
+        self.user1 = User.objects.create_user('testuser1@mail.com', password='password')
+        self.player1 = Player.objects.create(user=self.user1, handle="foobar")
+        self.user2 = User.objects.create_user('testuser2@mail.com', password='password')
+        self.player2 = Player.objects.create(user=self.user2, handle="foobar")
+
+        self.mock_push_new_game_feed_message = start_patch(
+            self, cq_lib, 'push_new_game_feed_message')
+        self.mock_alert_game_players_to_new_move = start_patch(
+            self, cq_lib, 'alert_game_players_to_new_move')
+
+    def _create_game(self, seconds_overdue=1, players=None):
+        player1, player2 = players or (self.player1, self.player2)
+        game = Game.objects.create(
+            game_type=Game.GAME_TYPE_CHOICE_CONNECT_QUAT, name="fooo",
+            is_started=True, is_over=False, max_players=2,
+            turn_deadline=timezone.now() - timedelta(seconds=seconds_overdue))
+        player1.game = game
+        player1.turn_order = 1
+        player2.game = game
+        player2.turn_order = 2
+        player1.save()
+        player2.save()
+        board_state = cq_lib.board_obj_to_serialized_state({
+            Board.STATE_KEY_NEXT_PLAYER_TO_ACT:player1.id,
+            Board.STATE_KEY_BOARD_LIST:[[None for i in range(7)] for j in range(7)]
+        })
+        board = Board.objects.create(
+            game=game, board_state=board_state, board_length_x=7, board_length_y=7)
+        return game, board
+
+    def test_expire_due_turns_skips_active_player_and_sets_next_deadline(self):
+        game, board = self._create_game()
+
+        self.assertEqual(turn_timer.expire_due_turns(), 1)
+
+        game.refresh_from_db()
+        board.refresh_from_db()
+        self.assertEqual(cq_lib.get_active_player_id_from_board(board), self.player2.id)
+        self.assertEqual(game.tick_count, 1)
+        self.assertGreater(game.turn_deadline, timezone.now())
+        move = Move.objects.get(game=game)
+        self.assertEqual(move.move_type, Move.MOVE_TYPE_TIMEOUT)
+        self.assertEqual(move.player, self.player1)
+
+    def test_expire_due_turns_creates_game_feed_message(self):
+        game, board = self._create_game()
+        self.assertEqual(GameFeedMessage.objects.count(), 0)
+
+        turn_timer.expire_due_turns()
+
+        self.assertEqual(GameFeedMessage.objects.count(), 1)
+        gfm = GameFeedMessage.objects.first()
+        self.assertEqual(gfm.game, game)
+        self.assertEqual(gfm.message_type, GameFeedMessage.MESSAGE_TYPE_GAME_STATUS)
+        self.mock_push_new_game_feed_message.assert_called_once_with(gfm)
+        self.mock_alert_game_players_to_new_move.assert_called_once()
+
+    def test_turn_not_due_yet_is_not_skipped(self):
+        game, board = self._create_game(seconds_overdue=-10)
+
+        self.assertEqual(turn_timer.expire_due_turns(), 0)
+
+        board.refresh_from_db()
+        self.assertEqual(cq_lib.get_active_player_id_from_board(board), self.player1.id)
+        self.assertAlmostEqual(turn_timer.get_sleep_seconds(), turn_timer.MAX_SLEEP_SECONDS, delta=1)
+
+    def test_move_made_after_deadline_was_read_cancels_timeout(self):
+        game, board = self._create_game()
+        game_id, tick_count = turn_timer.get_due_games(timezone.now()).values_list(
+            'id', 'tick_count').get()
+
+        # The player moves before the timer gets to the game.
+        Game.objects.filter(id=game_id).update(tick_count=tick_count + 1)
+
+        self.assertFalse(turn_timer.expire_turn(game_id, tick_count, timezone.now()))
+        board.refresh_from_db()
+        self.assertEqual(cq_lib.get_active_player_id_from_board(board), self.player1.id)
+        self.assertEqual(GameFeedMessage.objects.count(), 0)
+        self.mock_alert_game_players_to_new_move.assert_not_called()
+
+    def test_game_over_is_not_expired(self):
+        game, board = self._create_game()
+        game.is_over = True
+        game.save()
+
+        self.assertEqual(turn_timer.expire_due_turns(), 0)
+        self.assertFalse(Move.objects.exists())
+
+    def test_overdue_turns_are_recovered_in_batches(self):
+        game, board = self._create_game(seconds_overdue=60 * 60)
+        other_games = []
+        for ix in range(3):
+            players = [
+                Player.objects.create(
+                    user=User.objects.create_user(f'other{ix}{jx}@mail.com', password='password'),
+                    handle="foobar")
+                for jx in range(2)]
+            other_game, _ = self._create_game(seconds_overdue=60 * ix, players=players)
+            other_games.append(other_game)
+
+        with patch.object(turn_timer, 'BATCH_SIZE', 2):
+            self.assertEqual(turn_timer.expire_due_turns(), 4)
+
+        for g in [game] + other_games:
+            g.refresh_from_db()
+            self.assertEqual(g.tick_count, 1)
+            self.assertGreater(g.turn_deadline, timezone.now())
+        self.assertEqual(turn_timer.expire_due_turns(), 0)
@@ -1,5 +1,7 @@
 
 
+import random
+
 from django.contrib.auth.models import User
 from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
@@ -9,6 +11,7 @@ from lobby.models import Player, Game
 from lobby import views
 from connectquatro.models import Board
 from connectquatro import lib as cq_lib
+from connectquatro import bitboard
 
 class TestConnectQuatroWinConditions(APITestCase):
     def setUp(self):
@@ -170,4 +173,84 @@ class TestConnectQuatroWinConditions(APITestCase):
                 [None, None, None, self.player2.id, None, None, None], #
             ]})
         self.board.save()
-        self.assertEqual(cq_lib.get_winning_player(self.board), self.player2)
\ No newline at end of file
+        self.assertEqual(cq_lib.get_winning_player(self.board), self.player2)
+
+
+    def test_last_move_win_check_matches_full_board_scan_on_random_games(self):
+        def has_n_in_a_row(board_list, player_id, max_to_win):
+            rows = len(board_list)
+            cols = len(board_list[0])
+            for row_ix in range(rows):
+                for col_ix in range(cols):
+                    for row_step, col_step in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                        cells = [
+                            (row_ix + row_step * i, col_ix + col_step * i)
+                            for i in range(max_to_win)]
+                        if all(0 <= r < rows and 0 <= c < cols and board_list[r][c] == player_id
+                               for r, c in cells):
+                            return True
+            return False
+
+        rng = random.Random(1337)
+        geometries = [(7, 7, 4), (8, 6, 4), (6, 9, 4), (10, 10, 5), (5, 12, 3), (14, 11, 6)]
+        for board_length_x, board_length_y, max_to_win in geometries:
+            geometry = bitboard.get_geometry(board_length_x, board_length_y, max_to_win)
+            for game_ix in range(15):
+                player_ids = list(range(1, rng.randint(2, 8) + 1))
+                bitboards = {}
+                column_heights = [0 for i in range(board_length_x)]
+                open_columns = list(range(board_length_x))
+                turn = 0
+                while open_columns:
+                    player_id = player_ids[turn % len(player_ids)]
+                    turn += 1
+                    col_ix = rng.choice(open_columns)
+                    row_ix = bitboard.get_landing_row_ix(geometry, column_heights[col_ix])
+                    column_heights[col_ix] += 1
+                    cell_ix = geometry.cell_ix(row_ix, col_ix)
+                    bitboards[player_id] = bitboards.get(player_id, 0) | (1 << cell_ix)
+                    if row_ix == 0:
+                        open_columns.remove(col_ix)
+                    self.assertEqual(
+                        bitboard.get_legal_columns(geometry, column_heights), open_columns)
+
+                    incremental_win = bitboard.is_win_at(geometry, bitboards[player_id], cell_ix)
+                    scanned_winners = [
+                        pid for pid in player_ids
+                        if bitboard.has_win(geometry, bitboards.get(pid, 0))]
+                    if incremental_win:
+                        self.assertEqual(scanned_winners, [player_id])
+                        break
+                    self.assertEqual(scanned_winners, [])
+
+                board_list = bitboard.bitboards_to_board_list(geometry, bitboards)
+                self.assertEqual(bitboard.board_list_to_bitboards(board_list), bitboards)
+                self.assertEqual(
+                    bitboard.get_column_heights(geometry, bitboard.get_occupied(bitboards)),
+                    column_heights)
+                self.assertEqual(
+                    scanned_winners,
+                    [pid for pid in player_ids if has_n_in_a_row(board_list, pid, max_to_win)])
+
+    def test_win_is_detected_from_the_last_dropped_chip(self):
+        self.game.archived_players.set([self.player1, self.player2])
+        p1 = self.player1.id
+        p2 = self.player2.id
+        self.board.board_state = cq_lib.board_obj_to_serialized_state({
+            Board.STATE_KEY_NEXT_PLAYER_TO_ACT:self.player1.id,
+            Board.STATE_KEY_BOARD_LIST: [
+                [None for i in range(7)],
+                [None for i in range(7)],
+                [None for i in range(7)],
+                [None, None, None, None, None, None, None],
+                [None, None, p1, p2, None, None, None],
+                [None, p1, p2, p2, None, None, None],
+                [p1, p2, p2, p2, None, None, None],
+            ]})
+        self.board.save()
+        self.assertIsNone(cq_lib.get_winning_player(self.board))
+
+        cq_lib.drop_chip(self.board, self.player1, 3)
+        board_state = cq_lib.board_state_to_obj(self.board)
+        self.assertEqual(board_state[Board.STATE_KEY_LAST_MOVE], [3, 3])
+        self.assertEqual(cq_lib.get_winning_player(self.board), self.player1)
@@ -6,14 +6,15 @@ from collections import Counter
 
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 
-from lobby.models import Player, Game, GameFeedMessage
+from lobby.models import Player, Game, CompletedGame, GameFeedMessage
 from lobby import views
-from connectquatro.models import Board
+from connectquatro.models import Board, Move
 from connectquatro import lib as cq_lib
-from connectquatro import tasks
+from texasholdem.testing import start_patch
 
 class TestConnectquatroAPI(APITestCase):
     def setUp(self):
@@ -24,18 +25,10 @@ class TestConnectquatroAPI(APITestCase):
         self.user3 = User.objects.create_user('testuser3@mail.com', password='password')
         self.player3 = Player.objects.create(user=self.user3, handle="foobar")
 
-        self.mock_alert_game_players_to_new_move = patch.object(
-            cq_lib, 'alert_game_players_to_new_move').start()
-        self.mock_push_new_game_feed_message = patch.object(
-            cq_lib, 'push_new_game_feed_message').start()
-        
-        self.mock_cycle_player_turn_if_inactive = patch.object(
-            tasks.cycle_player_turn_if_inactive, 'delay').start()
-
-    def tearDown(self):
-        self.mock_alert_game_players_to_new_move.stop()
-        self.mock_cycle_player_turn_if_inactive.stop()
-    
+        self.mock_alert_game_players_to_new_move = start_patch(
+            self, cq_lib, 'alert_game_players_to_new_move')
+        self.mock_push_new_game_feed_message = start_patch(
+            self, cq_lib, 'push_new_game_feed_message')
 
     def test_player_can_drop_chip_on_empty_board_when_its_their_turn(self):
         game = Game.objects.create(
@@ -95,15 +88,14 @@ class TestConnectquatroAPI(APITestCase):
         self.assertEqual(len(alert_game_players_calls), 1)
 
         self.assertEqual(alert_game_players_calls[0][0][0], game)
-        passed_game_state = alert_game_players_calls[0][0][1]
-        self.assertEqual(passed_game_state['board_list'][6][3], self.player1.id)
-        self.assertIsNone(passed_game_state['winner'])
-        self.assertFalse(passed_game_state['game_over'])
-        self.assertEqual(len(passed_game_state['players']), 2)
-        passed_player_slugs = [p['slug'] for p in passed_game_state['players']]
-        self.assertTrue(self.player1.slug in passed_player_slugs)
-        self.assertTrue(self.player2.slug in passed_player_slugs)
-        self.assertEqual(passed_game_state['next_player_slug'], self.player2.slug)
+        passed_game_delta = alert_game_players_calls[0][0][1]
+        self.assertEqual(passed_game_delta['move'], [6, 3, self.player1.slug])
+        self.assertEqual(passed_game_delta['tick'], 1)
+        self.assertEqual(passed_game_delta['next_player_slug'], self.player2.slug)
+        self.assertIsNone(passed_game_delta['winner'])
+        self.assertFalse(passed_game_delta['game_over'])
+        self.assertNotIn('board_list', passed_game_delta)
+        self.assertNotIn('players', passed_game_delta)
 
 
     def test_game_feed_message_is_created_when_player_makes_a_move(self):
@@ -183,7 +175,7 @@ class TestConnectquatroAPI(APITestCase):
         self.assertEqual(calls[1][0][0], game_over_gfm)
 
 
-    def test_turn_timeout_task_starts_when_player_makes_non_winning_move(self):
+    def test_turn_deadline_is_set_and_sent_when_player_makes_non_winning_move(self):
         game = Game.objects.create(
             game_type=Game.GAME_TYPE_CHOICE_CONNECT_QUAT, name="fooo", is_started=True, 
             max_players=2)
@@ -204,8 +196,12 @@ class TestConnectquatroAPI(APITestCase):
         response = self.client.post(url, data, format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
-        self.assertEqual(len(self.mock_cycle_player_turn_if_inactive.call_args_list), 1)
-        self.assertEqual(self.mock_cycle_player_turn_if_inactive.call_args_list[0][0][0], game.id)
+        game.refresh_from_db()
+        self.assertGreater(game.turn_deadline, timezone.now())
+        self.assertEqual(response.data['turn_deadline'], game.turn_deadline.isoformat())
+        self.assertIsNotNone(response.data['server_time'])
+        game_delta = self.mock_alert_game_players_to_new_move.call_args[0][1]
+        self.assertEqual(game_delta['turn_deadline'], game.turn_deadline.isoformat())
 
 
     def test_turn_timeout_task_does_not_start_when_player_wins(self):
@@ -245,7 +241,90 @@ class TestConnectquatroAPI(APITestCase):
         self.assertTrue(
             response.data['winner'],
             {'handle':self.player1.slug, 'slug':self.player2.slug})
-        self.mock_cycle_player_turn_if_inactive.assert_not_called()
+        game.refresh_from_db()
+        self.assertIsNone(game.turn_deadline)
+        self.assertIsNone(response.data['turn_deadline'])
+
+
+    def test_game_ends_in_a_draw_when_no_line_can_be_completed(self):
+        game = Game.objects.create(
+            game_type=Game.GAME_TYPE_CHOICE_CONNECT_QUAT, name="fooo", is_started=True, 
+            max_players=2)
+        self.player1.game = game
+        self.player2.game = game
+        self.player1.save()
+        self.player2.save()
+        game.archived_players.set([self.player1, self.player2])
+        p1 = self.player1.id
+        p2 = self.player2.id
+        board_list = [
+            [p1, None, None],
+            [p1, p2, None],
+        ]
+        board_state = cq_lib.board_obj_to_serialized_state({
+            Board.STATE_KEY_NEXT_PLAYER_TO_ACT:self.player2.id,
+            Board.STATE_KEY_BOARD_LIST:board_list
+        })
+        board = Board.objects.create(
+            game=game, board_state=board_state, board_length_x=3, board_length_y=2, max_to_win=3)
+
+        self.client.login(username='testuser2@mail.com', password='password')
+        url = reverse('api-connectquat-move')
+        data = {'column_index':1}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertTrue(response.data['game_over'])
+        self.assertTrue(response.data['draw'])
+        self.assertIsNone(response.data['winner'])
+        self.assertFalse(response.data['player_won'])
+        game.refresh_from_db()
+        self.assertIsNone(game.turn_deadline)
+
+        game.refresh_from_db()
+        self.assertTrue(game.is_over)
+        self.assertTrue(game.completedgame.is_draw)
+        self.assertEqual(game.completedgame.winner_type, CompletedGame.WINNER_TYPE_DRAW)
+        self.assertFalse(game.completedgame.winners.exists())
+        self.assertEqual(
+            GameFeedMessage.objects.filter(
+                game=game, message_type=GameFeedMessage.MESSAGE_TYPE_GAME_STATUS).count(), 1)
+
+
+    def test_mega_board_moves_are_broadcast_as_deltas(self):
+        game = Game.objects.create(
+            game_type=Game.GAME_TYPE_CHOICE_CONNECT_QUAT, name="fooo", is_started=True, 
+            max_players=2)
+        self.player1.game = game
+        self.player2.game = game
+        self.player1.save()
+        self.player2.save()
+        board = Board.objects.create(
+            game=game, mode=Board.BOARD_MODE_MEGA, board_length_x=150, board_length_y=120)
+        cq_game = cq_lib.get_game_class(board)(
+            cq_lib.get_board_geometry(board), [self.player1.id, self.player2.id], self.player1.id)
+        cq_lib.save_game(board, cq_game)
+
+        self.client.login(username='testuser1@mail.com', password='password')
+        url = reverse('api-connectquat-move')
+        response = self.client.post(url, {'column_index':140}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        passed_game_delta = self.mock_alert_game_players_to_new_move.call_args_list[0][0][1]
+        self.assertEqual(passed_game_delta['move'], [119, 140, self.player1.slug])
+        self.assertNotIn('board_list', passed_game_delta)
+        self.assertNotIn('chips', passed_game_delta)
+        self.assertEqual(passed_game_delta['next_player_slug'], self.player2.slug)
+
+        board.refresh_from_db()
+        self.assertLess(len(board.board_state), 200)
+
+        self.client.login(username='testuser2@mail.com', password='password')
+        response = self.client.get(reverse('api-connectquat-ping'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['chips'], [[119, 140, self.player1.id]])
+        self.assertEqual(len(response.data['legal_columns']), 150)
+        self.assertTrue(response.data['active_player'])
 
 
     def test_player_cant_drop_chip_when_it_isnt_their_turn(self):
@@ -326,6 +405,44 @@ class TestConnectquatroAPI(APITestCase):
         self.mock_alert_game_players_to_new_move.assert_not_called()
 
 
+    def test_full_columns_are_not_returned_as_legal_columns(self):
+        game = Game.objects.create(
+            game_type=Game.GAME_TYPE_CHOICE_CONNECT_QUAT, name="fooo", is_started=True, 
+            max_players=2)
+        self.player1.game = game
+        self.player2.game = game
+        self.player1.save()
+        self.player2.save()
+
+        # Column 3 has one open slot left.
+        board_list = [[None for i in range(7)] for j in range(7)]
+        for row_ix in range(1, 7):
+            board_list[row_ix][3] = self.player1.id if row_ix % 2 else self.player2.id
+
+        board_state = cq_lib.board_obj_to_serialized_state({
+            Board.STATE_KEY_NEXT_PLAYER_TO_ACT:self.player1.id,
+            Board.STATE_KEY_BOARD_LIST:board_list
+        })
+        board = Board.objects.create(
+            game=game, board_state=board_state, board_length_x=7, board_length_y=7)
+
+        self.client.login(username='testuser1@mail.com', password='password')
+        response = self.client.get(reverse('api-connectquat-ping'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['legal_columns'], [0, 1, 2, 3, 4, 5, 6])
+
+        response = self.client.post(
+            reverse('api-connectquat-move'), {'column_index':3}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['legal_columns'], [0, 1, 2, 4, 5, 6])
+
+        board.refresh_from_db()
+        board_state = cq_lib.board_state_to_obj(board)
+        self.assertEqual(board_state[Board.STATE_KEY_BOARD_LIST][0][3], self.player1.id)
+        self.assertEqual(
+            board_state[Board.STATE_KEY_COLUMN_HEIGHTS], [0, 0, 0, 7, 0, 0, 0])
+
+
     def test_player_cant_drop_chip_into_column_off_the_board(self):
         game = Game.objects.create(
             game_type=Game.GAME_TYPE_CHOICE_CONNECT_QUAT, name="fooo", is_started=True, 
@@ -349,6 +466,103 @@ class TestConnectquatroAPI(APITestCase):
         self.assertTrue("illegal move" in response.data)
         self.mock_alert_game_players_to_new_move.assert_not_called()
 
+    def test_move_is_rejected_if_the_turn_timed_out_after_it_was_read(self):
+        game = Game.objects.create(
+            game_type=Game.GAME_TYPE_CHOICE_CONNECT_QUAT, name="fooo", is_started=True, 
+            max_players=2)
+        self.player1.game = game
+        self.player2.game = game
+        self.player1.save()
+        self.player2.save()
+        board_state = cq_lib.board_obj_to_serialized_state({
+            Board.STATE_KEY_NEXT_PLAYER_TO_ACT:self.player1.id,
+            Board.STATE_KEY_BOARD_LIST:[[None for i in range(7)] for j in range(7)]
+        })
+        board = Board.objects.create(
+            game=game, board_state=board_state, board_length_x=7, board_length_y=7)
+
+        get_active_player_id_from_board = cq_lib.get_active_player_id_from_board
+        def time_out_turn(board):
+            # The turn timer commits right after the request checked whose turn it is.
+            Game.objects.filter(id=board.game_id).update(tick_count=1)
+            return get_active_player_id_from_board(board)
+
+        self.client.login(username='testuser1@mail.com', password='password')
+        url = reverse('api-connectquat-move')
+        with patch.object(cq_lib, 'get_active_player_id_from_board', side_effect=time_out_turn):
+            response = self.client.post(url, {'column_index':3}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        board.refresh_from_db()
+        game.refresh_from_db()
+        self.assertEqual(game.tick_count, 1)
+        self.assertEqual(board.ply_count, 0)
+        self.assertFalse(any(chain(*cq_lib.board_state_to_obj(board)[Board.STATE_KEY_BOARD_LIST])))
+        self.assertFalse(GameFeedMessage.objects.filter(game=game).exists())
+        self.mock_alert_game_players_to_new_move.assert_not_called()
+
+    def test_move_is_rejected_if_another_player_quit_after_it_was_read(self):
+        game = Game.objects.create(
+            game_type=Game.GAME_TYPE_CHOICE_CONNECT_QUAT, name="fooo", is_started=True,
+            max_players=3)
+        for turn_order, player in enumerate((self.player1, self.player2, self.player3), 1):
+            player.game = game
+            player.turn_order = turn_order
+            player.save()
+        board_state = cq_lib.board_obj_to_serialized_state({
+            Board.STATE_KEY_NEXT_PLAYER_TO_ACT:self.player1.id,
+            Board.STATE_KEY_BOARD_LIST:[[None for i in range(7)] for j in range(7)]
+        })
+        board = Board.objects.create(
+            game=game, board_state=board_state, board_length_x=7, board_length_y=7)
+
+        get_active_player_id_from_board = cq_lib.get_active_player_id_from_board
+        def quit_other_player(board):
+            # player3, who is not on turn, quits right after the request checked whose turn it is.
+            active_player_id = get_active_player_id_from_board(board)
+            quitting_player = Player.objects.get(id=self.player3.id)
+            if quitting_player.game_id:
+                cq_lib.remove_player_from_active_game(quitting_player)
+            return active_player_id
+
+        self.client.login(username='testuser1@mail.com', password='password')
+        url = reverse('api-connectquat-move')
+        with patch.object(cq_lib, 'get_active_player_id_from_board', side_effect=quit_other_player):
+            response = self.client.post(url, {'column_index':3}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        board.refresh_from_db()
+        game.refresh_from_db()
+        self.assertEqual(game.tick_count, 1)
+        self.assertEqual(board.ply_count, 1)
+        self.assertEqual(
+            list(game.moves.values_list('ply', 'move_type')), [(1, Move.MOVE_TYPE_QUIT)])
+        self.assertFalse(any(chain(*cq_lib.board_state_to_obj(board)[Board.STATE_KEY_BOARD_LIST])))
+        self.assertEqual(cq_lib.get_active_player_id_from_board(board), self.player1.id)
+
+    def test_illegal_move_does_not_advance_tick_count(self):
+        game = Game.objects.create(
+            game_type=Game.GAME_TYPE_CHOICE_CONNECT_QUAT, name="fooo", is_started=True, 
+            max_players=2)
+        self.player1.game = game
+        self.player2.game = game
+        self.player1.save()
+        self.player2.save()
+        board_state = cq_lib.board_obj_to_serialized_state({
+            Board.STATE_KEY_NEXT_PLAYER_TO_ACT:self.player1.id,
+            Board.STATE_KEY_BOARD_LIST:[[self.player2.id for i in range(7)] for j in range(7)]
+        })
+        Board.objects.create(
+            game=game, board_state=board_state, board_length_x=7, board_length_y=7)
+
+        self.client.login(username='testuser1@mail.com', password='password')
+        response = self.client.post(
+            reverse('api-connectquat-move'), {'column_index':3}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        game.refresh_from_db()
+        self.assertEqual(game.tick_count, 0)
+        self.assertIsNone(game.turn_deadline)
+
     def test_active_player_and_game_tick_count_cycles_after_each_move(self):
         game = Game.objects.create(
             game_type=Game.GAME_TYPE_CHOICE_CONNECT_QUAT, name="fooo", is_started=True, 
@@ -443,9 +657,96 @@ class TestConnectquatroAPI(APITestCase):
         self.assertEqual(len(alert_game_players_calls), 1)
 
         self.assertEqual(alert_game_players_calls[0][0][0], game)
-        passed_game_state = alert_game_players_calls[0][0][1]
-        self.assertEqual(passed_game_state['winner'], {'handle':self.player1.handle, 'slug':self.player1.slug})
-        self.assertTrue(passed_game_state['game_over'])
+        passed_game_delta = alert_game_players_calls[0][0][1]
+        self.assertEqual(passed_game_delta['winner'], {'handle':self.player1.handle, 'slug':self.player1.slug})
+        self.assertTrue(passed_game_delta['game_over'])
+        self.assertIsNone(passed_game_delta['next_player_slug'])
         self.assertIsNotNone(game.completedgame)
         self.assertEqual(game.completedgame.winners.count(), 1)
         self.assertEqual(game.completedgame.winners.first(), self.player1)
+
+    def test_ping_and_move_load_player_game_and_board_in_one_query(self):
+        game = Game.objects.create(
+            game_type=Game.GAME_TYPE_CHOICE_CONNECT_QUAT, name="fooo", is_started=True, 
+            max_players=2)
+        self.player1.game = game
+        self.player1.turn_order = 1
+        self.player2.game = game
+        self.player2.turn_order = 2
+        self.player1.save()
+        self.player2.save()
+        board_state = cq_lib.board_obj_to_serialized_state({
+            Board.STATE_KEY_NEXT_PLAYER_TO_ACT:self.player1.id,
+            Board.STATE_KEY_BOARD_LIST:[[None for i in range(7)] for j in range(7)]
+        })
+        Board.objects.create(
+            game=game, board_state=board_state, board_length_x=7, board_length_y=7)
+
+        # Authenticated without the session lookups.
+        self.client.force_authenticate(User.objects.get(id=self.user1.id))
+        # player with game and board, players
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('api-connectquat-ping'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['active_player'])
+
+        # The game state is cached until the tick changes.
+        self.client.force_authenticate(User.objects.get(id=self.user2.id))
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('api-connectquat-ping'))
+        self.assertFalse(response.data['active_player'])
+
+        self.client.force_authenticate(User.objects.get(id=self.user1.id))
+        # player with game and board, the 7 queries of commit_move, players
+        with self.assertNumQueries(9):
+            response = self.client.post(
+                reverse('api-connectquat-move'), {'column_index':3}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.client.force_authenticate(User.objects.get(id=self.user2.id))
+        response = self.client.get(reverse('api-connectquat-ping'))
+        self.assertTrue(response.data['active_player'])
+        self.assertEqual(response.data['next_player_slug'], self.player2.slug)
+        self.assertEqual(response.data['board_list'][6][3], self.player1.id)
+        self.assertEqual(response.data['turn_deadline'], Game.objects.get(id=game.id).turn_deadline.isoformat())
+
+    def test_ping_returns_304_while_tick_count_has_not_changed(self):
+        game = Game.objects.create(
+            game_type=Game.GAME_TYPE_CHOICE_CONNECT_QUAT, name="fooo", is_started=True, 
+            max_players=2)
+        self.player1.game = game
+        self.player1.turn_order = 1
+        self.player2.game = game
+        self.player2.turn_order = 2
+        self.player1.save()
+        self.player2.save()
+        board_state = cq_lib.board_obj_to_serialized_state({
+            Board.STATE_KEY_NEXT_PLAYER_TO_ACT:self.player1.id,
+            Board.STATE_KEY_BOARD_LIST:[[None for i in range(7)] for j in range(7)]
+        })
+        Board.objects.create(
+            game=game, board_state=board_state, board_length_x=7, board_length_y=7)
+        self.client.force_authenticate(User.objects.get(id=self.user2.id))
+
+        response = self.client.get(reverse('api-connectquat-ping'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        self.assertEqual(etag, f'"{game.id}-0"')
+
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse('api-connectquat-ping'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+
+        self.client.force_authenticate(User.objects.get(id=self.user1.id))
+        response = self.client.post(
+            reverse('api-connectquat-move'), {'column_index':3}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.client.force_authenticate(User.objects.get(id=self.user2.id))
+        response = self.client.get(
+            reverse('api-connectquat-ping'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['ETag'], f'"{game.id}-1"')
+        self.assertTrue(response.data['active_player'])
@@ -0,0 +1,278 @@
+
+import asyncio
+import json
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser, User
+
+from lobby.models import Player, Game
+from connectquatro.models import Board, Move
+from connectquatro.consumers import (
+    ConnectQuatroConsumer,
+    ConnectQuatroMoveConsumer,
+    ConnectQuatroPingConsumer,
+    splice_json,
+)
+from connectquatro import lib as cq_lib
+from texasholdem import broadcast, event_log
+from texasholdem.testing import ConsumerTestCase, get_http_communicator
+
+
+class ConnectQuatroConsumerTestCase(ConsumerTestCase):
+    """ A started game between player1 and player2, player1 to move.
+    """
+
+    def setUp(self):
+        self.game = Game.objects.create(
+            game_type=Game.GAME_TYPE_CHOICE_CONNECT_QUAT, name="fooo", is_started=True,
+            max_players=2)
+        self.user1 = User.objects.create_user('testuser1@mail.com', password='password')
+        self.player1 = Player.objects.create(
+            user=self.user1, handle="foobar", game=self.game, turn_order=1)
+        self.user2 = User.objects.create_user('testuser2@mail.com', password='password')
+        self.player2 = Player.objects.create(
+            user=self.user2, handle="foobar", game=self.game, turn_order=2)
+        self.board = Board.objects.create(
+            game=self.game, board_length_x=7, board_length_y=7,
+            board_state=cq_lib.board_obj_to_serialized_state({
+                Board.STATE_KEY_NEXT_PLAYER_TO_ACT:self.player1.id,
+                Board.STATE_KEY_BOARD_LIST:[[None for i in range(7)] for j in range(7)],
+            }))
+
+
+class TestConnectQuatroPingConsumer(ConnectQuatroConsumerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.etag = cq_lib.get_game_state_etag(self.game)
+
+    def _communicator(self, user, path, etag=None):
+        headers = [(b"if-none-match", etag.encode())] if etag else []
+        return get_http_communicator(
+            ConnectQuatroPingConsumer, user, "GET", path, headers=headers)
+
+    def _get(self, user, path, etag=None):
+        async def get():
+            return await self._communicator(user, path, etag).get_response(timeout=5)
+        return async_to_sync(get)()
+
+    def test_ping_returns_game_state_and_etag(self):
+        response = self._get(self.user2, "/connectquat/ping/")
+        self.assertEqual(response['status'], 200)
+        self.assertIn((b"ETag", self.etag.encode()), response['headers'])
+        data = json.loads(response['body'])
+        self.assertFalse(data['active_player'])
+        self.assertEqual(data['next_player_slug'], self.player1.slug)
+
+    def test_ping_returns_304_without_waiting_for_matching_etag(self):
+        response = self._get(self.user2, "/connectquat/ping/", self.etag)
+        self.assertEqual(response['status'], 304)
+        self.assertEqual(response['body'], b"")
+
+    def test_ping_requires_authentication(self):
+        response = self._get(AnonymousUser(), "/connectquat/ping/")
+        self.assertEqual(response['status'], 403)
+
+    def test_ping_rejects_invalid_wait(self):
+        response = self._get(self.user2, "/connectquat/ping/?wait=soon")
+        self.assertEqual(response['status'], 400)
+
+    def test_long_poll_returns_304_when_wait_expires(self):
+        response = self._get(self.user2, "/connectquat/ping/?wait=0.2", self.etag)
+        self.assertEqual(response['status'], 304)
+
+    def test_long_poll_returns_new_state_when_tick_advances(self):
+        async def long_poll_then_move():
+            communicator = self._communicator(self.user2, "/connectquat/ping/?wait=5", self.etag)
+            response = asyncio.ensure_future(communicator.get_response(timeout=5))
+            await asyncio.sleep(0.2)
+            self.assertFalse(response.done())
+
+            await database_sync_to_async(cq_lib.commit_move)(
+                self.game, self.board, self.player1, 3)
+            await get_channel_layer().group_send(
+                self.game.channel_layer_name, {"type":"game.move", "game_state":{}})
+            return await response
+
+        response = async_to_sync(long_poll_then_move)()
+        self.assertEqual(response['status'], 200)
+        self.assertIn((b"ETag", f'"{self.game.id}-1"'.encode()), response['headers'])
+        data = json.loads(response['body'])
+        self.assertTrue(data['active_player'])
+        self.assertEqual(data['board_list'][6][3], self.player1.id)
+
+
+class TestConnectQuatroConsumer(ConnectQuatroConsumerTestCase):
+
+    def test_splice_json_adds_fields_to_encoded_object(self):
+        self.assertEqual(
+            json.loads(splice_json('{"tick": 1}', {'active_player':True})),
+            {'tick':1, 'active_player':True})
+        self.assertEqual(json.loads(splice_json('{}', {'player_won':False})), {'player_won':False})
+        self.assertEqual(splice_json('{"tick": 1}', {}), '{"tick": 1}')
+
+    def test_game_move_adds_each_players_fields_to_the_encoded_delta(self):
+        game_delta = {
+            'tick':1, 'move':[6, 3, self.player1.slug], 'quit_player_slug':None,
+            'next_player_slug':self.player2.slug, 'winner':None, 'draw':False,
+            'game_over':False, 'turn_deadline':None, 'server_time':None,
+        }
+
+        async def broadcast_move():
+            communicators = [
+                WebsocketCommunicator(
+                    lambda scope, user=user: ConnectQuatroConsumer(dict(scope, user=user)),
+                    "/connectquatro/")
+                for user in (self.user1, self.user2)]
+            for communicator in communicators:
+                connected, _ = await communicator.connect()
+                self.assertTrue(connected)
+
+            await get_channel_layer().group_send(self.game.channel_layer_name, {
+                "type":"game.move",
+                "delta":json.dumps(game_delta),
+                "next_player_slug":self.player2.slug,
+                "winner_slug":None,
+            })
+            events = [await communicator.receive_json_from() for communicator in communicators]
+            for communicator in communicators:
+                await communicator.disconnect()
+            return events
+
+        event1, event2 = async_to_sync(broadcast_move)()
+        self.assertEqual(event1['type'], "game.move")
+        self.assertEqual(event1['feed_messages'], [])
+        self.assertEqual(event1['delta'], dict(game_delta, active_player=False))
+        self.assertEqual(event2['delta'], dict(game_delta, active_player=True))
+
+    def _connect_and_send(self, user, *payloads, receive_count=1):
+        async def send():
+            communicator = WebsocketCommunicator(
+                lambda scope: ConnectQuatroConsumer(dict(scope, user=user)), "/connectquatro/")
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            events = []
+            for payload in payloads:
+                await communicator.send_json_to(payload)
+                events += [
+                    await communicator.receive_json_from(timeout=5)
+                    for ix in range(receive_count)]
+            await communicator.disconnect()
+            return events
+        return async_to_sync(send)()
+
+    def test_move_is_acked_with_the_game_state_and_broadcast(self):
+        events = self._connect_and_send(
+            self.user1, {'method':'move', 'request_id':7, 'column_index':3}, receive_count=2)
+
+        events_by_type = {event['type']:event for event in events}
+        ack = events_by_type['move.ack']
+        self.assertEqual(ack['request_id'], 7)
+        self.assertTrue(ack['ok'])
+        self.assertEqual(ack['game_state']['board_list'][6][3], self.player1.id)
+        self.assertFalse(ack['game_state']['active_player'])
+        self.assertEqual(events_by_type['game.move']['delta']['move'], [6, 3, self.player1.slug])
+        self.assertEqual(len(events_by_type['game.move']['feed_messages']), 1)
+
+        self.board.refresh_from_db()
+        self.assertEqual(self.board.ply_count, 1)
+
+    def test_rejected_moves_are_acked_with_the_error(self):
+        self.assertEqual(
+            self._connect_and_send(self.user2, {'method':'move', 'request_id':1, 'column_index':-1}),
+            [{'type':'move.ack', 'request_id':1, 'ok':False, 'error':"turn order error"}])
+        self.assertEqual(
+            self._connect_and_send(
+                self.user1,
+                {'method':'move', 'request_id':2, 'column_index':-1},
+                {'method':'move', 'request_id':3, 'column_index':7},
+                {'method':'move', 'request_id':4}),
+            [
+                {'type':'move.ack', 'request_id':2, 'ok':False,
+                    'error':{'column_index':["column_index must be greater than 0."]}},
+                {'type':'move.ack', 'request_id':3, 'ok':False, 'error':"illegal move"},
+                {'type':'move.ack', 'request_id':4, 'ok':False,
+                    'error':{'column_index':["This field is required."]}},
+            ])
+        self.assertFalse(Move.objects.exists())
+
+    def test_resume_replays_the_events_missed(self):
+        seq = async_to_sync(event_log.get_seq)(self.game.channel_layer_name)
+        with broadcast.collect():
+            cq_lib.play_move(self.game, self.board, self.player1, 3)
+
+        move, resumed = self._connect_and_send(
+            self.user2, {'method':'resume', 'seq':seq}, receive_count=2)
+        self.assertEqual(move['type'], "game.move")
+        self.assertEqual(move['seq'], seq + 1)
+        self.assertEqual(move['delta']['move'], [6, 3, self.player1.slug])
+        self.assertTrue(move['delta']['active_player'])
+        self.assertEqual(len(move['feed_messages']), 1)
+        self.assertEqual(resumed, {'type':'session.resumed', 'seq':seq + 1})
+
+    def test_resume_falls_back_to_a_snapshot(self):
+        with broadcast.collect():
+            cq_lib.play_move(self.game, self.board, self.player1, 3)
+        seq = async_to_sync(event_log.get_seq)(self.game.channel_layer_name)
+
+        for resume_seq in (None, seq + 10):
+            snapshot, = self._connect_and_send(
+                self.user2, {'method':'resume', 'seq':resume_seq})
+            self.assertEqual(snapshot['type'], "session.snapshot")
+            self.assertEqual(snapshot['seq'], seq)
+            self.assertEqual(snapshot['game_state']['board_list'][6][3], self.player1.id)
+            self.assertTrue(snapshot['game_state']['active_player'])
+
+
+class TestConnectQuatroMoveConsumer(ConnectQuatroConsumerTestCase):
+
+    def _communicator(self, user, data, csrf_token=True):
+        return get_http_communicator(
+            ConnectQuatroMoveConsumer, user, "POST", "/connectquat/move/", data,
+            csrf_token=csrf_token)
+
+    def _post(self, user, data, csrf_token=True):
+        async def post():
+            return await self._communicator(user, data, csrf_token).get_response(timeout=5)
+        response = async_to_sync(post)()
+        return response['status'], json.loads(response['body'])
+
+    def test_move_is_broadcast_before_the_response(self):
+        async def move():
+            websocket = WebsocketCommunicator(
+                lambda scope: ConnectQuatroConsumer(dict(scope, user=self.user2)),
+                "/connectquatro/")
+            connected, _ = await websocket.connect()
+            self.assertTrue(connected)
+            response = await self._communicator(
+                self.user1, {'column_index':3}).get_response(timeout=5)
+            event = await websocket.receive_json_from(timeout=1)
+            await websocket.disconnect()
+            return response, event
+
+        response, event = async_to_sync(move)()
+        self.assertEqual(response['status'], 200)
+        game_state = json.loads(response['body'])
+        self.assertEqual(game_state['board_list'][6][3], self.player1.id)
+        self.assertFalse(game_state['active_player'])
+        self.assertEqual(event['type'], "game.move")
+        self.assertEqual(event['delta']['move'], [6, 3, self.player1.slug])
+        self.assertTrue(event['delta']['active_player'])
+
+    def test_rejected_moves_answer_like_make_move(self):
+        self.assertEqual(
+            self._post(self.user2, {'column_index':3}), (400, "turn order error"))
+        self.assertEqual(
+            self._post(self.user1, {'column_index':7})[0], 400)
+        self.assertEqual(
+            self._post(AnonymousUser(), {'column_index':3})[0], 403)
+        self.assertFalse(Move.objects.exists())
+
+    def test_move_requires_csrf_token(self):
+        self.assertEqual(
+            self._post(self.user1, {'column_index':3}, csrf_token=False),
+            (403, {'detail':"CSRF Failed: CSRF token missing or incorrect."}))
+        self.assertFalse(Move.objects.exists())
@@ -0,0 +1,94 @@
+""" Turn timer.
+
+    Every running game stores when its active player's turn times out in
+    Game.turn_deadline, an indexed column. It is set whenever a turn starts
+    (game start, move, timeout, the active player quitting) and cleared when
+    the game ends. A single run_turn_timer process sleeps until the next
+    deadline, then skips the turns that are due in batches of BATCH_SIZE.
+
+    A move cancels the pending timeout by bumping tick_count: a timeout only
+    applies if tick_count is still the value read with the deadline, see
+    connectquatro.lib.advance_tick. Pending timers live in the database, so
+    a restarted process picks up where the last one stopped, skipping the
+    turns that went overdue in between.
+"""
+
+from django.db import transaction
+from django.utils import timezone
+
+from connectquatro import lib as cq_lib
+from connectquatro.models import Move
+from lobby.models import Game, Player, GameFeedMessage
+from texasholdem import broadcast
+
+
+BATCH_SIZE = 100
+
+# Turns last at least 10 seconds, so a deadline set while the timer sleeps
+# MAX_SLEEP_SECONDS or less is never missed.
+MAX_SLEEP_SECONDS = 5
+
+
+def get_due_games(now):
+    return (Game.objects
+        .filter(is_over=False, turn_deadline__lte=now)
+        .order_by('turn_deadline'))
+
+
+def get_sleep_seconds(now=None) -> float:
+    """ Seconds until the next deadline, at most MAX_SLEEP_SECONDS.
+    """
+    now = now or timezone.now()
+    next_deadline = (Game.objects
+        .filter(is_over=False, turn_deadline__isnull=False)
+        .order_by('turn_deadline')
+        .values_list('turn_deadline', flat=True)
+        .first())
+    if next_deadline is None:
+        return MAX_SLEEP_SECONDS
+    return min(max((next_deadline - now).total_seconds(), 0), MAX_SLEEP_SECONDS)
+
+
+def expire_turn(game_id:int, tick_count:int, now) -> bool:
+    """ Skip the active player's turn if it is still the turn that was due.
+        Returns False if a move or a quit started a new turn meanwhile.
+    """
+    game = Game.objects.filter(
+        id=game_id, tick_count=tick_count, is_over=False, turn_deadline__lte=now).first()
+    if game is None:
+        return False
+
+    try:
+        with transaction.atomic():
+            board = game.board
+            player = Player.objects.get(id=cq_lib.get_active_player_id_from_board(board))
+
+            cq_lib.start_turn_timer(game)
+            cq_lib.advance_tick(game, tick_count, turn_deadline=game.turn_deadline)
+            board, _ = cq_lib.cycle_player_turn(board)
+            cq_lib.record_move(board, game, Move.MOVE_TYPE_TIMEOUT, player)
+
+            gfm = GameFeedMessage.objects.create(
+                game=game, message_type=GameFeedMessage.MESSAGE_TYPE_GAME_STATUS,
+                message=f"skipping {player.handle}'s turn")
+    except cq_lib.StaleGameStateError:
+        return False
+
+    with broadcast.collect():
+        cq_lib.alert_game_players_to_new_move(game, cq_lib.get_game_delta(game, board))
+        cq_lib.push_new_game_feed_message(gfm)
+    return True
+
+
+def expire_due_turns(now=None) -> int:
+    """ Skip every turn whose deadline has passed. Returns how many were skipped.
+    """
+    now = now or timezone.now()
+    expired_count = 0
+    while True:
+        due = list(get_due_games(now).values_list('id', 'tick_count')[:BATCH_SIZE])
+        batch_expired_count = sum(
+            expire_turn(game_id, tick_count, now) for game_id, tick_count in due)
+        expired_count += batch_expired_count
+        if len(due) < BATCH_SIZE or not batch_expired_count:
+            return expired_count
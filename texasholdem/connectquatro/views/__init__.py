@@ -3,3 +3,4 @@ from .page_views import game_page
 
 from .api_views import make_move
 from .api_views import ping
+from .api_views import export_replays
@@ -2,22 +2,19 @@
 
 from functools import wraps
 
-from django.db.models import F
+from django.http import StreamingHttpResponse
 from rest_framework.decorators import (
     api_view,
     permission_classes,
 )
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
 
-from lobby.models import Game, CompletedGame, GameFeedMessage
+from lobby.models import Game
 from connectquatro import lib as cq_lib
-from connectquatro.forms import ConnectQuatroMoveForm
-from connectquatro.models import Board
-from connectquatro import tasks
-from django.db import transaction
-from texasholdem.utils import get_user_player_game
+from connectquatro import replay
+from texasholdem.utils import get_user_player_game, load_game_context
 
 
 def is_playing_active_connect_quatro_game(function):
@@ -38,6 +35,7 @@ def is_playing_active_connect_quatro_game(function):
     
     return decorated_function
 
+
 def is_active_player_in_connect_quatro(function):
     @wraps(function)
     def decorated_function(request, *args, **kwargs):
@@ -47,19 +45,9 @@ def is_active_player_in_connect_quatro(function):
             print(e)
             return  Response("game not found", status.HTTP_404_NOT_FOUND)
         
-        if not game:
-            return  Response("game not found", status.HTTP_404_NOT_FOUND)
-        
-        if game.game_type != Game.GAME_TYPE_CHOICE_CONNECT_QUAT or not game.is_started:
-            return Response("invalid game state", status.HTTP_400_BAD_REQUEST)
-        
-        if game.is_over:
-            return Response("game over", status.HTTP_400_BAD_REQUEST)
-        
-        board_state = cq_lib.board_state_to_obj(game.board)
-        next_player_id = board_state[Board.STATE_KEY_NEXT_PLAYER_TO_ACT]
-        if next_player_id != player.id:
-            return Response("turn order error", status.HTTP_400_BAD_REQUEST)
+        error_response = cq_lib.get_move_error_response(player, game)
+        if error_response:
+            return Response(*error_response)
         
         return function(request, *args, **kwargs)
         
@@ -69,73 +57,58 @@ def is_active_player_in_connect_quatro(function):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@load_game_context
 @is_active_player_in_connect_quatro
 def make_move(request):
+    """ Under ASGI this path is served by consumers.ConnectQuatroMoveConsumer
+    """
     user, player, game = get_user_player_game(request)
-    board = game.board
-    form = ConnectQuatroMoveForm(
-        request.data, max_column_index=board.board_length_x - 1)
-    if not form.is_valid():
-        return Response(form.errors, status.HTTP_400_BAD_REQUEST)
-    
-    user, player, game = get_user_player_game(request)
-    column_index = form.cleaned_data['column_index']
-
-    with transaction.atomic():
-        try:
-            board = cq_lib.drop_chip(
-                board, player, column_index)
-        except (cq_lib.ColumnIsFullError,
-                cq_lib.ColumnOutOfRangeError):
-            return Response(
-                "illegal move", status.HTTP_400_BAD_REQUEST)
-
-        game.tick_count = game.tick_count + 1
-        game.save(update_fields=['tick_count'])
-
-        board, new_player_to_act = cq_lib.cycle_player_turn(board)
-        
-        game_over, winning_player = cq_lib.get_game_over_state(board)
-        if game_over:
-            game.is_over = True
-            game.save(update_fields=['is_over'])
-            cq = CompletedGame.objects.create(game=game)
-            cq.winners.set([winning_player])
-        
-        game_over_gfm = None
-        move_gfm = GameFeedMessage.objects.create(
-            game=game,
-            message_type=GameFeedMessage.MESSAGE_TYPE_PLAYER_MOVE_DROP_CHIP,
-            message=f"{player.handle} dropped in column {column_index + 1}")
-        if game_over:
-            game_over_gfm = GameFeedMessage.objects.create(
-                game=game,
-                message_type=GameFeedMessage.MESSAGE_TYPE_GAME_STATUS,
-                message=f"{winning_player.handle} wins")
-    
-    game_state, _ = cq_lib.get_game_state(board, player)
-    cq_lib.alert_game_players_to_new_move(game, game_state)
-
-    game_state['active_player'] = False
-    if game_state['winner']:
-        game_state['player_won'] = game_state['winner']['slug'] == player.slug
-    else:
-        tasks.cycle_player_turn_if_inactive.delay(game.id, new_player_to_act, game.tick_count)
-
-    cq_lib.push_new_game_feed_message(move_gfm)
-    if game_over_gfm:
-        cq_lib.push_new_game_feed_message(game_over_gfm)
-
-    return Response(game_state, status.HTTP_200_OK)
+    return Response(*cq_lib.get_make_move_response(player, game, request.data))
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@load_game_context
 @is_playing_active_connect_quatro_game
 def ping(request):
+    """ Answers 304 if If-None-Match has the current ETag. Under ASGI this
+        path is served by consumers.ConnectQuatroPingConsumer, which can
+        also long-poll (?wait=<seconds>).
+    """
     user, player, game = get_user_player_game(request)
-    data, _ = cq_lib.get_game_state(
-        game.board, requesting_player=player)
-    if data['winner']:
-        data['player_won'] = data['winner']['slug'] == player.slug
-    return Response(data, status.HTTP_200_OK)
+    etag = cq_lib.get_game_state_etag(game)
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag':etag})
+    data = cq_lib.get_cached_game_state(game.board, player)
+    return Response(data, status.HTTP_200_OK, headers={'ETag':etag})
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_replays(request):
+    """ Stream completed games.
+        ?output=ndjson|binary&since=<ISO 8601>&since_game=<game id>
+        see replay.get_completed_games
+    """
+    export_format = request.query_params.get('output', replay.EXPORT_FORMAT_NDJSON)
+    if export_format not in replay.EXPORT_FORMATS:
+        return Response("invalid output", status.HTTP_400_BAD_REQUEST)
+
+    raw_since = request.query_params.get('since')
+    try:
+        since = replay.parse_since(raw_since) if raw_since else None
+    except ValueError:
+        return Response("invalid since", status.HTTP_400_BAD_REQUEST)
+
+    raw_since_game_id = request.query_params.get('since_game')
+    if raw_since_game_id and not raw_since_game_id.isdigit():
+        return Response("invalid since_game", status.HTTP_400_BAD_REQUEST)
+    since_game_id = int(raw_since_game_id) if raw_since_game_id else None
+
+    content_type = (
+        'application/octet-stream' if export_format == replay.EXPORT_FORMAT_BINARY
+        else 'application/x-ndjson')
+    return StreamingHttpResponse(
+        replay.iter_export(export_format, since=since, since_game_id=since_game_id),
+        content_type=content_type)
+
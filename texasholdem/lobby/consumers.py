@@ -3,19 +3,18 @@
 import asyncio
 import json
 
-from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 
+from texasholdem.consumers import PlayerContextMixin
 
-class LobbyChatConsumer(AsyncJsonWebsocketConsumer):
+
+class LobbyChatConsumer(PlayerContextMixin, AsyncJsonWebsocketConsumer):
 
     ROOM_NAME_DEFAULT = "default_chat_room"
 
     async def connect(self):
-        user = self.scope['user']
-        player = await database_sync_to_async(lambda: user.player)()
-        game = await database_sync_to_async(lambda: player.game)()
-        if game:
+        context = await self.get_context()
+        if context.game_id:
             await self.send({
                 'error':'player already in a game'
             })
@@ -23,6 +22,7 @@ class LobbyChatConsumer(AsyncJsonWebsocketConsumer):
             return await self.close(code=CLOSE_PROTOCOL_ERROR)
 
         await self.accept()
+        await self.connect_context()
         await self.channel_layer.group_add(
             self.ROOM_NAME_DEFAULT, self.channel_name)
 
@@ -30,27 +30,27 @@ class LobbyChatConsumer(AsyncJsonWebsocketConsumer):
             self.ROOM_NAME_DEFAULT,
             {
                 "type":"chat.announcement",
-                "announcement":f"{player.handle} has joined",
+                "announcement":f"{context.handle} has joined",
             })
 
 
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(
             self.ROOM_NAME_DEFAULT, self.channel_name)
+        await self.disconnect_context()
         
-        user = self.scope['user']
-        player = await database_sync_to_async(lambda: user.player)()
+        context = await self.get_context()
         await self.channel_layer.group_send(
             self.ROOM_NAME_DEFAULT,
             {
                 "type":"chat.announcement",
-                "announcement":f"{player.handle} has left",
+                "announcement":f"{context.handle} has left",
             })
 
     async def receive_json(self, data):
         method = data['method']
         user = self.scope['user']
-        player = await database_sync_to_async(lambda: user.player)()
+        context = await self.get_context()
 
         if method == 'chat.message':
             message = data['message']
@@ -59,7 +59,7 @@ class LobbyChatConsumer(AsyncJsonWebsocketConsumer):
                 {
                     "type":"chat.message",
                     "message":message,
-                    "handle":player.handle,
+                    "handle":context.handle,
                     "username":user.username,
                     'is_lobby_owner':user.is_superuser,
                 })
@@ -79,12 +79,13 @@ class LobbyChatConsumer(AsyncJsonWebsocketConsumer):
         await self.send_json(data)
 
 
-class GameLobbyChatConsumer(AsyncJsonWebsocketConsumer):
+class GameLobbyChatConsumer(PlayerContextMixin, AsyncJsonWebsocketConsumer):
+
+    chat_channel_layer_name = None
+
     async def connect(self):
-        user = self.scope['user']
-        player = await database_sync_to_async(lambda: user.player)()
-        game = await database_sync_to_async(lambda: player.game)()
-        if not game:
+        context = await self.get_context()
+        if not context.game_id:
             await self.send({
                 'error':'player not in a game'
             })
@@ -92,37 +93,39 @@ class GameLobbyChatConsumer(AsyncJsonWebsocketConsumer):
             return await self.close(code=CLOSE_PROTOCOL_ERROR)
 
         await self.accept()
+        await self.connect_context()
+        self.chat_channel_layer_name = context.game_chat_channel_layer_name
         await self.channel_layer.group_add(
-            game.chat_channel_layer_name, self.channel_name)
+            self.chat_channel_layer_name, self.channel_name)
         await self.channel_layer.group_send(
-            game.chat_channel_layer_name,
+            self.chat_channel_layer_name,
             {
                 "type":"chat.announcement",
-                "announcement":f"{player.handle} has joined",
+                "announcement":f"{context.handle} has joined",
             })
 
 
     async def disconnect(self, close_code):
-        user = self.scope['user']
-        player = await database_sync_to_async(lambda: user.player)()
-        game = await database_sync_to_async(lambda: player.game)()
+        await self.disconnect_context()
+        if not self.chat_channel_layer_name:
+            return
 
+        context = await self.get_context()
         await self.channel_layer.group_discard(
-            game.chat_channel_layer_name, self.channel_name)
+            self.chat_channel_layer_name, self.channel_name)
         
         await self.channel_layer.group_send(
-            game.chat_channel_layer_name,
+            self.chat_channel_layer_name,
             {
                 "type":"chat.announcement",
-                "announcement":f"{player.handle} has left",
+                "announcement":f"{context.handle} has left",
             })
 
     async def receive_json(self, data):
         method = data['method']
         user = self.scope['user']
-        player = await database_sync_to_async(lambda: user.player)()
-        game = await database_sync_to_async(lambda: player.game)()
-        if not game:
+        context = await self.get_context()
+        if not context.game_id:
             return await self.send({'error':'user not in a game'})
             CLOSE_PROTOCOL_ERROR = 1002
             return await self.close(code=CLOSE_PROTOCOL_ERROR)
@@ -130,13 +133,13 @@ class GameLobbyChatConsumer(AsyncJsonWebsocketConsumer):
         if method == 'chat.message':
             message = data['message']
             await self.channel_layer.group_send(
-                game.chat_channel_layer_name,
+                context.game_chat_channel_layer_name,
                 {
                     "type":"chat.message",
                     "message":message,
-                    "handle":player.handle,
+                    "handle":context.handle,
                     "username":user.username,
-                    "is_lobby_owner":player.is_lobby_owner
+                    "is_lobby_owner":context.is_lobby_owner
                 })
 
     async def chat_message(self, data):
@@ -152,14 +155,13 @@ class GameLobbyChatConsumer(AsyncJsonWebsocketConsumer):
         await self.send_json(data)
 
 
-class LobbyRoomsConsumer(AsyncJsonWebsocketConsumer):
+class LobbyRoomsConsumer(PlayerContextMixin, AsyncJsonWebsocketConsumer):
 
     ROOM_NAME_DEFAULT = "default_status_room"
 
     async def connect(self):
-        user = self.scope['user']
-        player = await database_sync_to_async(lambda: user.player)()
-        if player.game:
+        context = await self.get_context()
+        if context.game_id:
             await self.send({
                 'error':'player already in a game'
             })
@@ -167,12 +169,13 @@ class LobbyRoomsConsumer(AsyncJsonWebsocketConsumer):
             return await self.close(code=CLOSE_PROTOCOL_ERROR)
 
         await self.accept()
+        await self.connect_context()
         await self.channel_layer.group_add(
             self.ROOM_NAME_DEFAULT, self.channel_name)
 
 
     async def disconnect(self, close_code):
-        pass
+        await self.disconnect_context()
         
     async def receive_json(self, data):
         pass
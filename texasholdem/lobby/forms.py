@@ -2,6 +2,7 @@
 from django import forms
 
 from lobby.models import Game, Player
+from connectquatro.models import Board as CQBoard
 
 # TODO: DELETE
 class NewGameForm(forms.ModelForm):
@@ -43,24 +44,37 @@ class GamePrivacySettingsForm(forms.Form):
 
 class NewConnectQuatroRoomForm(forms.Form):
     roomname = forms.CharField(required=True)
+    boardmode = forms.ChoiceField(choices=CQBoard.BOARD_MODE_CHOICES, required=False)
     boarddimx = forms.IntegerField(required=True)
     boarddimy = forms.IntegerField(required=True)
     boardplayercount = forms.IntegerField(required=True)
     boardwincount = forms.IntegerField(required=True)
     max_seconds_per_turn = forms.IntegerField(required=True)
 
+    # (min, max) board side length per board mode.
+    BOARD_DIMENSION_LIMITS = {
+        CQBoard.BOARD_MODE_CLASSIC:(5, 20),
+        CQBoard.BOARD_MODE_MEGA:(20, 200),
+    }
+
     def clean(self):
         cleaned_data = super().clean()
-        if 5 > cleaned_data['boarddimx'] > 20:
+        if self.errors:
+            return cleaned_data
+
+        if not cleaned_data.get('boardmode'):
+            cleaned_data['boardmode'] = CQBoard.BOARD_MODE_CLASSIC
+        min_dim, max_dim = self.BOARD_DIMENSION_LIMITS[cleaned_data['boardmode']]
+        if not min_dim <= cleaned_data['boarddimx'] <= max_dim:
             raise forms.ValidationError(
-                "boarddimx must be between 5 and 20")
-        if 5 > cleaned_data['boarddimy'] > 20:
+                f"boarddimx must be between {min_dim} and {max_dim}")
+        if not min_dim <= cleaned_data['boarddimy'] <= max_dim:
             raise forms.ValidationError(
-                "boarddimy must be between 5 and 20")
+                f"boarddimy must be between {min_dim} and {max_dim}")
 
-        if 3 > cleaned_data['boardwincount'] > 15:
+        if not 3 <= cleaned_data['boardwincount'] <= 15:
             raise forms.ValidationError(
-                "boardwincount must be between 3 and 13")
+                "boardwincount must be between 3 and 15")
         
         if max(cleaned_data['boarddimx'], cleaned_data['boarddimy']) < cleaned_data['boardwincount']:
             raise forms.ValidationError(
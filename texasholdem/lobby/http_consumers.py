@@ -0,0 +1,30 @@
+
+from lobby import lib as lobby_lib
+from texasholdem.consumers import AsyncApiConsumer
+from texasholdem.utils import get_player_with_game
+
+
+def join_lobby_for_user(user, slug:str, data:dict) -> tuple:
+    return lobby_lib.get_join_lobby_response(get_player_with_game(user), slug, data)
+
+
+def leave_lobby_for_user(user) -> tuple:
+    return lobby_lib.get_leave_lobby_response(get_player_with_game(user))
+
+
+class JoinLobbyConsumer(AsyncApiConsumer):
+    """ api/lobby/join/<slug>/ under ASGI, see views.api_views.join_lobby
+    """
+
+    async def respond(self, user, data:dict, slug:str):
+        response_data, status = await self.run_sync(join_lobby_for_user, user, slug, data)
+        await self.send_json_response(response_data, status)
+
+
+class LeaveLobbyConsumer(AsyncApiConsumer):
+    """ api/lobby/leave/ under ASGI, see views.api_views.leave_lobby
+    """
+
+    async def respond(self, user, data:dict):
+        response_data, status = await self.run_sync(leave_lobby_for_user, user)
+        await self.send_json_response(response_data, status)
@@ -2,14 +2,15 @@
 import uuid
 import random
 
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
 from django.db import transaction
+from rest_framework import status
 
 from lobby.consumers import LobbyRoomsConsumer
+from lobby.forms import GameJoinIdForm
 from lobby.models import Game, Player
 from connectquatro.models import Board
 from connectquatro import lib as cq_lib
+from texasholdem import broadcast
 
 
 def new_join_game_id() -> str:
@@ -23,7 +24,8 @@ def new_join_game_id() -> str:
 @transaction.atomic
 def player_create_connectquat_lobby(
     player, game_name:str, board_length_x:int, board_length_y:int, 
-    max_players:int, max_to_win:int, max_seconds_per_turn:int, is_public=True):
+    max_players:int, max_to_win:int, max_seconds_per_turn:int, is_public=True,
+    board_mode=Board.BOARD_MODE_CLASSIC):
 
     game = Game.objects.create(
         game_type=Game.GAME_TYPE_CHOICE_CONNECT_QUAT,
@@ -33,12 +35,13 @@ def player_create_connectquat_lobby(
         join_game_id=new_join_game_id())
 
     board = Board.objects.create(
-        game=game, max_to_win=max_to_win,
+        game=game, max_to_win=max_to_win, mode=board_mode,
         board_length_x=board_length_x, board_length_y=board_length_y)
 
     player.game = game
     player.is_lobby_owner = True
     player.save(update_fields=['game', 'is_lobby_owner'])
+    invalidate_player_connections(player)
 
     if is_public:
         update_lobby_list_add_connect_quatro(game, board)
@@ -50,6 +53,7 @@ def player_join_lobby(player, game):
     player.game = game
     player.lobby_status = Player.LOBBY_STATUS_JOINED
     player.save(update_fields=['game', 'lobby_status'])
+    invalidate_player_connections(player)
     alert_game_lobby_player_joined(game, player)
     if game.is_public:
         if game.is_full:
@@ -68,6 +72,7 @@ def player_leave_lobby(player):
     player.game = None
     player.is_lobby_owner = False
     player.save(update_fields=['game', 'is_lobby_owner'])
+    invalidate_player_connections(player)
     if not game.players.exclude(id=player.id).exists():
         # This lobby is now empty
         update_lobby_list_remove_game(game)
@@ -88,6 +93,7 @@ def player_leave_lobby(player):
             new_leader = sorted(game.players.all(), key=lambda p: random.random())[0]
             new_leader.is_lobby_owner = True
             new_leader.save(update_fields=['is_lobby_owner'])
+            invalidate_player_connections(new_leader)
             push_player_promoted_to_lobby_leader(new_leader, game)
 
 
@@ -98,46 +104,101 @@ def set_player_lobby_status_to_ready(player):
     push_player_ready_status_update(player)
 
 
-# async channel layer functions
+def get_join_lobby_response(player, slug:str, data:dict) -> tuple:
+    """ views.api_views.join_lobby's (data, status). Also answers
+        http_consumers.JoinLobbyConsumer
+    """
+    if player.game:
+        return "You are already in game", status.HTTP_400_BAD_REQUEST
+    
+    game = Game.objects.filter(slug=slug).first()
+    if game is None:
+        return {'detail':"Not found."}, status.HTTP_404_NOT_FOUND
+    if game.is_started:
+        return "Lobby is no longer joinable", status.HTTP_400_BAD_REQUEST
+    if game.is_full:
+        return "Lobby is full", status.HTTP_400_BAD_REQUEST
+
+    if game.is_over:
+        return "game is over", status.HTTP_400_BAD_REQUEST
+    
+    if not game.is_public:
+        join_id_form = GameJoinIdForm(data)
+        if not join_id_form.is_valid():
+            return join_id_form.errors, status.HTTP_400_BAD_REQUEST
+
+        join_game_id = join_id_form.cleaned_data["join_game_id"]
+        if join_game_id != game.join_game_id:
+            return "invalid join_game_id", status.HTTP_400_BAD_REQUEST
+
+    player_join_lobby(player, game)
+    return {}, status.HTTP_200_OK
+
+
+def get_leave_lobby_response(player) -> tuple:
+    """ views.api_views.leave_lobby's (data, status). Also answers
+        http_consumers.LeaveLobbyConsumer
+    """
+    if not player.game:
+        return "player not in a game", status.HTTP_400_BAD_REQUEST
+    
+    if not player.game.is_started:
+        player_leave_lobby(player)
+
+    elif not player.game.is_over:
+        if player.game.game_type == Game.GAME_TYPE_CHOICE_CONNECT_QUAT:
+            cq_lib.remove_player_from_active_game(player)
+
+    else:
+        if player.game.game_type == Game.GAME_TYPE_CHOICE_CONNECT_QUAT:
+            cq_lib.remove_player_from_completed_game(player)
+
+    return {}, status.HTTP_200_OK
+
+# channel layer functions
 
-@async_to_sync
-async def alert_game_lobby_player_joined(game, player):
-    channel_layer = get_channel_layer()
-    await channel_layer.group_send(
+def invalidate_player_connections(*players):
+    """ Make the players' websocket connections reload their context, see
+        texasholdem.consumers.PlayerContextMixin. Sent once the current
+        transaction commits, so the reload sees what it wrote.
+    """
+    for player in players:
+        broadcast.group_send(
+            player.channel_layer_name, {"type":"context.invalidate"})
+
+def alert_game_lobby_player_joined(game, player):
+    broadcast.group_send(
         game.channel_layer_name,
         {
             "type":"player.joined",
             "playerSlug":player.slug,
             "playerHandle":player.handle,
-        }
+        },
+        resumable=True,
     )
 
-@async_to_sync
-async def push_player_quit_game_event(game, player):
-    channel_layer = get_channel_layer()
-    await channel_layer.group_send(
+def push_player_quit_game_event(game, player):
+    broadcast.group_send(
         game.channel_layer_name,
         {
             "type":"player.quit",
             "playerSlug":player.slug,
-        }
+        },
+        resumable=True,
     )
 
-@async_to_sync
-async def push_player_promoted_to_lobby_leader(player, game):
-    channel_layer = get_channel_layer()
-    await channel_layer.group_send(
+def push_player_promoted_to_lobby_leader(player, game):
+    broadcast.group_send(
         game.channel_layer_name,
         {
             "type":"player.promoted",
             "playerSlug":player.slug,
-        }
+        },
+        resumable=True,
     )
 
-@async_to_sync
-async def update_lobby_list_player_count(game, new_count):
-    channel_layer = get_channel_layer()
-    await channel_layer.group_send(
+def update_lobby_list_player_count(game, new_count):
+    broadcast.group_send(
         LobbyRoomsConsumer.ROOM_NAME_DEFAULT,
         {
             "type":"room.player.count.update",
@@ -146,10 +207,8 @@ async def update_lobby_list_player_count(game, new_count):
         }
     )
 
-@async_to_sync
-async def update_lobby_list_remove_game(game):
-    channel_layer = get_channel_layer()
-    await channel_layer.group_send(
+def update_lobby_list_remove_game(game):
+    broadcast.group_send(
         LobbyRoomsConsumer.ROOM_NAME_DEFAULT,
         {
             "type":"room.remove",
@@ -157,10 +216,8 @@ async def update_lobby_list_remove_game(game):
         }
     )
 
-@async_to_sync
-async def update_lobby_list_add_connect_quatro(game, board):
-    channel_layer = get_channel_layer()
-    await channel_layer.group_send(
+def update_lobby_list_add_connect_quatro(game, board):
+    broadcast.group_send(
         LobbyRoomsConsumer.ROOM_NAME_DEFAULT,
         {
             "type":"room.add",
@@ -171,18 +228,18 @@ async def update_lobby_list_add_connect_quatro(game, board):
             "connect_quatro_board":{
                 'board_length_x':board.board_length_x,
                 'board_length_y':board.board_length_y,
+                'mode':board.mode,
             }
         }
     )
 
-@async_to_sync
-async def push_player_ready_status_update(player):
-    channel_layer = get_channel_layer()
+def push_player_ready_status_update(player):
     game = player.game
-    await channel_layer.group_send(
+    broadcast.group_send(
         game.channel_layer_name,
         {
             "type":"player.ready",
             "player_slug":player.slug,
-        }
+        },
+        resumable=True,
     )
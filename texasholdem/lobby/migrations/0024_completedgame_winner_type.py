@@ -0,0 +1,18 @@
+# Generated by Django 3.0.6 on 2026-10-18 19:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lobby', '0023_auto_20200607_2307'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='completedgame',
+            name='winner_type',
+            field=models.CharField(blank=True, default=None, max_length=24, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.6 on 2026-10-18 19:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lobby', '0024_completedgame_winner_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='turn_deadline',
+            field=models.DateTimeField(blank=True, db_index=True, default=None, null=True),
+        ),
+    ]
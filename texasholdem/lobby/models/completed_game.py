@@ -11,8 +11,13 @@ class CompletedGame(AbstractBaseModel):
 
     WINNER_TYPE_DRAW = "<< DRAW >>"
     winners = models.ManyToManyField("lobby.Player")
+    winner_type = models.CharField(max_length=24, default=None, null=True, blank=True)
+
+    @property
+    def is_draw(self):
+        return self.winner_type == self.WINNER_TYPE_DRAW
 
     def winners_list(self):
-        if self.winners == self.WINNER_TYPE_DRAW:
+        if self.is_draw:
             return []
-        return winners.replace(" ", "").split(",")
+        return list(self.winners.all())
@@ -47,6 +47,9 @@ class Game(AbstractBaseModel):
 
     tick_count = models.PositiveIntegerField(blank=True, default=0)
     max_seconds_per_turn = models.PositiveIntegerField(default=30)
+    # When the active player's turn times out. Null while no turn is running.
+    turn_deadline = models.DateTimeField(
+        default=None, null=True, blank=True, db_index=True)
 
     archived_players = models.ManyToManyField(
         'lobby.Player', related_name="archived_games")
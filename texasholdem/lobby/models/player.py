@@ -51,3 +51,7 @@ class Player(models.Model):
     @property
     def is_ready(self):
         return self.lobby_status == self.LOBBY_STATUS_READY
+
+    @property
+    def channel_layer_name(self):
+        return f"player-{self.slug}"
@@ -1,10 +1,17 @@
 
+from channels.auth import AuthMiddlewareStack
 from django.urls import re_path
 
 from . import consumers
+from . import http_consumers
 
 websocket_urlpatterns = [
     re_path(r'lobby/chat/?$', consumers.LobbyChatConsumer),
     re_path(r'game/chat/?$', consumers.GameLobbyChatConsumer),
     re_path(r'lobby/rooms/?$', consumers.LobbyRoomsConsumer),
 ]
+
+http_urlpatterns = [
+    re_path(r'^api/lobby/join/(?P<slug>[0-9a-zA-Z]+)/$', AuthMiddlewareStack(http_consumers.JoinLobbyConsumer)),
+    re_path(r'^api/lobby/leave/?$', AuthMiddlewareStack(http_consumers.LeaveLobbyConsumer)),
+]
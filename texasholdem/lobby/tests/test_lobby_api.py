@@ -1,8 +1,9 @@
 
-from unittest.mock import patch, Mock
+from unittest.mock import Mock
 
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 
@@ -11,7 +12,7 @@ from lobby import views
 from lobby import lib as lobby_lib
 from connectquatro.models import Board
 from connectquatro import lib as cq_lib
-from connectquatro import tasks as cq_tasks
+from texasholdem.testing import start_patch
 
 class TestLobbyTest(APITestCase):
 
@@ -19,36 +20,25 @@ class TestLobbyTest(APITestCase):
         self.user1 = User.objects.create_user('testuser1@mail.com', password='password')
         self.player1 = Player.objects.create(user=self.user1, handle="foobar")
 
-        self.mock_push_player_ready_status_update = patch.object(
-            lobby_lib, 'push_player_ready_status_update').start()
-        self.mock_update_lobby_list_add_connect_quatro = patch.object(
-            lobby_lib, 'update_lobby_list_add_connect_quatro').start()
-        self.mock_update_lobby_list_remove_game = patch.object(
-            lobby_lib, 'update_lobby_list_remove_game').start()
-        self.mock_update_lobby_list_player_count = patch.object(
-            lobby_lib, 'update_lobby_list_player_count').start()
-        self.mock_push_player_quit_game_event = patch.object(
-            lobby_lib, 'push_player_quit_game_event').start()
-        self.mock_push_player_promoted_to_lobby_leader = patch.object(
-            lobby_lib, 'push_player_promoted_to_lobby_leader').start()
-
-        self.mock_alert_game_lobby_game_started = patch.object(
-            cq_lib, 'alert_game_lobby_game_started').start()
-        self.mock_alert_game_players_to_new_move = patch.object(
-            cq_lib, 'alert_game_players_to_new_move').start()
-
-        self.mock_cycle_player_turn_if_inactive = patch.object(
-            cq_tasks.cycle_player_turn_if_inactive, 'delay').start()
-
-    def tearDown(self):
-        self.mock_update_lobby_list_add_connect_quatro.stop()
-        self.mock_update_lobby_list_remove_game.stop()
-        self.mock_alert_game_lobby_game_started.stop()
-        self.mock_push_player_quit_game_event.stop()
-        self.mock_update_lobby_list_player_count.stop()
-        self.mock_push_player_promoted_to_lobby_leader.stop()
-        self.mock_cycle_player_turn_if_inactive.stop()
-    
+        self.mock_push_player_ready_status_update = start_patch(
+            self, lobby_lib, 'push_player_ready_status_update')
+        self.mock_update_lobby_list_add_connect_quatro = start_patch(
+            self, lobby_lib, 'update_lobby_list_add_connect_quatro')
+        self.mock_update_lobby_list_remove_game = start_patch(
+            self, lobby_lib, 'update_lobby_list_remove_game')
+        self.mock_update_lobby_list_player_count = start_patch(
+            self, lobby_lib, 'update_lobby_list_player_count')
+        self.mock_push_player_quit_game_event = start_patch(
+            self, lobby_lib, 'push_player_quit_game_event')
+        self.mock_push_player_promoted_to_lobby_leader = start_patch(
+            self, lobby_lib, 'push_player_promoted_to_lobby_leader')
+        self.mock_invalidate_player_connections = start_patch(
+            self, lobby_lib, 'invalidate_player_connections')
+
+        self.mock_alert_game_lobby_game_started = start_patch(
+            self, cq_lib, 'alert_game_lobby_game_started')
+        self.mock_alert_game_players_to_new_move = start_patch(
+            self, cq_lib, 'alert_game_players_to_new_move')
 
     def test_player_not_in_a_lobby_can_see_the_lobby_list(self):
 
@@ -162,6 +152,39 @@ class TestLobbyTest(APITestCase):
         self.mock_update_lobby_list_add_connect_quatro.assert_not_called()
 
 
+    def test_player_can_create_a_mega_board_game(self):
+        self.client.login(username='testuser1@mail.com', password='password')
+        data = {
+            'roomtype':Game.GAME_TYPE_CHOICE_CONNECT_QUAT,
+            'roomname':'foo0 barR',
+            'boardmode':Board.BOARD_MODE_MEGA,
+            'boarddimx':200,
+            'boarddimy':150,
+            'boardplayercount':8,
+            'boardwincount':5,
+            'privacy':'public',
+            'max_seconds_per_turn':10,
+        }
+        url = reverse('api-lobby-create')
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        board = Board.objects.get(game_id=response.data['id'])
+        self.assertTrue(board.is_mega)
+        self.assertEqual(board.board_length_x, 200)
+        self.assertEqual(board.board_length_y, 150)
+        self.assertEqual(board.game.max_players, 8)
+
+        self.player1.game = None
+        self.player1.save(update_fields=['game'])
+        data['boarddimx'] = 201
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        data['boardmode'] = Board.BOARD_MODE_CLASSIC
+        data['boarddimx'] = 21
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_anonymous_player_cannot_create_a_game(self):
         """ Test anon user cannot create a game.
         """
@@ -254,8 +277,10 @@ class TestLobbyTest(APITestCase):
         
         self.mock_alert_game_lobby_game_started.assert_called_once_with(game)
         self.mock_update_lobby_list_remove_game.assert_called_once_with(game)
-        active_player_id = cq_lib.get_active_player_id_from_board(game.board)
-        self.mock_cycle_player_turn_if_inactive.assert_called_once_with(game.id, active_player_id, game.tick_count)
+        self.assertGreater(game.turn_deadline, timezone.now())
+        self.assertEqual(
+            set(self.mock_invalidate_player_connections.call_args[0]),
+            {self.player1, self.player2})
 
 
     def test_player_cant_start_connect_quatro_with_players_who_are_not_ready(self):
@@ -305,7 +330,8 @@ class TestLobbyTest(APITestCase):
         self.assertTrue("Game needs at least 2 players to start" in response.data)
         self.mock_alert_game_lobby_game_started.assert_not_called()
         self.mock_update_lobby_list_remove_game.assert_not_called()
-        self.mock_cycle_player_turn_if_inactive.assert_not_called()
+        game.refresh_from_db()
+        self.assertIsNone(game.turn_deadline)
 
 
     def test_player_cant_start_game_if_theyre_not_in_a_game(self):
@@ -331,7 +357,8 @@ class TestLobbyTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.mock_alert_game_lobby_game_started.assert_not_called()
         self.mock_update_lobby_list_remove_game.assert_not_called()
-        self.mock_cycle_player_turn_if_inactive.assert_not_called()
+        game.refresh_from_db()
+        self.assertIsNone(game.turn_deadline)
 
 
     def test_player_cant_start_game_if_theyre_not_lobby_owner(self):
@@ -360,7 +387,8 @@ class TestLobbyTest(APITestCase):
         self.assertTrue("Player not lobby owner" in response.data)
         self.mock_alert_game_lobby_game_started.assert_not_called()
         self.mock_update_lobby_list_remove_game.assert_not_called()
-        self.mock_cycle_player_turn_if_inactive.assert_not_called()
+        game.refresh_from_db()
+        self.assertIsNone(game.turn_deadline)
 
 
     def test_player_can_join_a_lobby_which_then_becomes_full(self):
@@ -390,6 +418,7 @@ class TestLobbyTest(APITestCase):
         self.mock_update_lobby_list_remove_game.assert_called_once_with(
             other_game)
         self.mock_update_lobby_list_player_count.assert_not_called()
+        self.mock_invalidate_player_connections.assert_called_once_with(self.player1)
 
     def test_player_can_join_a_lobby_which_is_still_not_full(self):
         """ Test player can join a game
@@ -609,6 +638,9 @@ class TestLobbyTest(APITestCase):
         self.mock_push_player_promoted_to_lobby_leader.assert_called_once_with(self.player2, game)
         self.mock_update_lobby_list_player_count.assert_not_called()
         self.mock_update_lobby_list_remove_game.assert_not_called()
+        self.assertEqual(
+            [c[0] for c in self.mock_invalidate_player_connections.call_args_list],
+            [(self.player1,), (self.player2,)])
 
 
     def test_lobby_leadership_is_not_passed_when_non_lobby_leader_leaves(self):
@@ -702,6 +734,38 @@ class TestLobbyTest(APITestCase):
         self.mock_update_lobby_list_remove_game.assert_called_once()
 
 
+    def test_quit_is_retried_when_a_turn_ends_while_it_runs(self):
+        """ Test a quit that read the game before another tick was committed starts over.
+        """
+        self.user2 = User.objects.create_user('testuser2@mail.com', password='password')
+        self.player2 = Player.objects.create(user=self.user2, handle="duuude")
+        self.user3 = User.objects.create_user('testuser3@mail.com', password='password')
+        self.player3 = Player.objects.create(user=self.user3, handle="yoo-duuuude")
+
+        game = Game.objects.create(
+            game_type=Game.GAME_TYPE_CHOICE_CONNECT_QUAT, name="foo", max_players=3,
+            is_started=True, is_over=False)
+        board_state = cq_lib.board_obj_to_serialized_state({
+            Board.STATE_KEY_NEXT_PLAYER_TO_ACT:self.player1.id,
+            Board.STATE_KEY_BOARD_LIST:[[None for i in range(7)] for j in range(7)]
+        })
+        board = Board.objects.create(game=game, board_state=board_state)
+        for player in (self.player1, self.player2, self.player3):
+            player.game = game
+            player.save(update_fields=['game'])
+
+        quitting_player = Player.objects.get(id=self.player1.id)
+        self.assertEqual(quitting_player.game.tick_count, 0)
+        Game.objects.filter(id=game.id).update(tick_count=5)
+
+        cq_lib.remove_player_from_active_game(quitting_player)
+
+        game.refresh_from_db()
+        board.refresh_from_db()
+        self.assertEqual(game.tick_count, 6)
+        self.assertTrue(self.player1 not in game.players.all())
+        self.assertEqual(cq_lib.get_active_player_id_from_board(board), self.player2.id)
+
     def test_active_player_can_leave_a_started_connect_quatrogame_still_others_left_in_the_game(self):
         """ Test player can leave a started game that will still have > 1 players leftover.
         """
@@ -748,22 +812,19 @@ class TestLobbyTest(APITestCase):
         self.mock_update_lobby_list_remove_game.assert_not_called()
         self.mock_update_lobby_list_add_connect_quatro.assert_not_called()
 
-        active_player_id = cq_lib.get_active_player_id_from_board(board)
-        self.mock_cycle_player_turn_if_inactive.assert_called_once_with(
-            game.id, active_player_id, game.tick_count)
+        self.assertGreater(game.turn_deadline, timezone.now())
 
         calls = self.mock_alert_game_players_to_new_move.call_args_list
         self.assertEqual(len(calls), 1)
         self.assertEqual(calls[0][0][0], game)
 
-        passed_game_state = calls[0][0][1]
-        self.assertFalse(passed_game_state['game_over'])
+        passed_game_delta = calls[0][0][1]
+        self.assertFalse(passed_game_delta['game_over'])
         self.assertTrue(
-            passed_game_state['next_player_slug'] in [self.player2.slug], self.player3.slug)
-        self.assertEqual(len(passed_game_state['players']), 2)
-        passed_player_slugs = [p['slug'] for p in passed_game_state['players']]
-        self.assertTrue(self.player2.slug in passed_player_slugs)
-        self.assertTrue(self.player3.slug in passed_player_slugs)
+            passed_game_delta['next_player_slug'] in [self.player2.slug, self.player3.slug])
+        self.assertEqual(passed_game_delta['quit_player_slug'], self.player1.slug)
+        self.assertEqual(passed_game_delta['tick'], 1)
+        self.assertIsNone(passed_game_delta['move'])
         self.assertFalse(CompletedGame.objects.filter(game=game).exists())
 
 
@@ -802,7 +863,7 @@ class TestLobbyTest(APITestCase):
         self.player1.refresh_from_db()
         self.assertTrue(Game.objects.filter(id=game_id).exists())
         self.assertFalse(game.is_over)
-        self.assertEqual(game.tick_count, 0)
+        self.assertEqual(game.tick_count, 1)
         self.assertTrue(self.player1 not in game.players.all())
         self.assertTrue(self.player2 in game.players.all())
         self.assertTrue(self.player3 in game.players.all())
@@ -813,20 +874,20 @@ class TestLobbyTest(APITestCase):
         self.mock_update_lobby_list_remove_game.assert_not_called()
         self.mock_update_lobby_list_add_connect_quatro.assert_not_called()
 
-        self.mock_cycle_player_turn_if_inactive.assert_not_called()
+        game.refresh_from_db()
+        self.assertIsNone(game.turn_deadline)
 
         calls = self.mock_alert_game_players_to_new_move.call_args_list
         self.assertEqual(len(calls), 1)
         self.assertEqual(calls[0][0][0], game)
 
-        passed_game_state = calls[0][0][1]
-        self.assertFalse(passed_game_state['game_over'])
+        passed_game_delta = calls[0][0][1]
+        self.assertFalse(passed_game_delta['game_over'])
         self.assertTrue(
-            passed_game_state['next_player_slug'] in [self.player2.slug], self.player3.slug)
-        self.assertEqual(len(passed_game_state['players']), 2)
-        passed_player_slugs = [p['slug'] for p in passed_game_state['players']]
-        self.assertTrue(self.player2.slug in passed_player_slugs)
-        self.assertTrue(self.player3.slug in passed_player_slugs)
+            passed_game_delta['next_player_slug'] in [self.player2.slug, self.player3.slug])
+        self.assertEqual(passed_game_delta['quit_player_slug'], self.player1.slug)
+        self.assertEqual(passed_game_delta['tick'], 1)
+        self.assertIsNone(passed_game_delta['move'])
         self.assertFalse(CompletedGame.objects.filter(game=game).exists())
 
 
@@ -870,16 +931,17 @@ class TestLobbyTest(APITestCase):
         self.mock_update_lobby_list_remove_game.assert_not_called()
         self.mock_update_lobby_list_add_connect_quatro.assert_not_called()
 
-        self.mock_cycle_player_turn_if_inactive.assert_not_called()
+        game.refresh_from_db()
+        self.assertIsNone(game.turn_deadline)
 
         calls = self.mock_alert_game_players_to_new_move.call_args_list
         self.assertEqual(len(calls), 1)
         self.assertEqual(calls[0][0][0], game)
 
-        passed_game_state = calls[0][0][1]
-        self.assertTrue(passed_game_state['game_over'])
+        passed_game_delta = calls[0][0][1]
+        self.assertTrue(passed_game_delta['game_over'])
         self.assertEqual(
-            passed_game_state['winner'],
+            passed_game_delta['winner'],
             {'slug':self.player2.slug, 'handle':self.player2.handle})
 
         self.assertIsNotNone(game.completedgame)
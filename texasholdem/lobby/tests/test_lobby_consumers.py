@@ -0,0 +1,152 @@
+
+import asyncio
+import json
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from lobby import lib as lobby_lib
+from lobby.consumers import GameLobbyChatConsumer
+from lobby.http_consumers import JoinLobbyConsumer, LeaveLobbyConsumer
+from lobby.models import Player, Game
+from connectquatro.models import Board
+from texasholdem import broadcast
+from texasholdem import consumers
+from texasholdem.testing import ConsumerTestCase, get_http_communicator
+
+
+class TestGameLobbyChatConsumer(ConsumerTestCase):
+
+    def setUp(self):
+        self.game = Game.objects.create(
+            game_type=Game.GAME_TYPE_CHOICE_CONNECT_QUAT, name="fooo", max_players=2)
+        self.user1 = User.objects.create_user('testuser1@mail.com', password='password')
+        self.player1 = Player.objects.create(
+            user=self.user1, handle="foobar", game=self.game)
+
+    def test_context_is_kept_until_invalidated(self):
+        async def chat():
+            communicator = WebsocketCommunicator(
+                lambda scope: GameLobbyChatConsumer(dict(scope, user=self.user1)),
+                "/game/chat/")
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            events = [await communicator.receive_json_from()]
+            # The context loaded to connect is dropped once the player group is joined.
+            await communicator.send_json_to({'method':'chat.message', 'message':"hi"})
+            await communicator.receive_json_from()
+
+            await database_sync_to_async(
+                Player.objects.filter(id=self.player1.id).update)(is_lobby_owner=True)
+            await communicator.send_json_to({'method':'chat.message', 'message':"hi"})
+            events.append(await communicator.receive_json_from())
+
+            await get_channel_layer().group_send(
+                self.player1.channel_layer_name, {"type":"context.invalidate"})
+            # Let the consumer pick the event up from the channel layer.
+            await asyncio.sleep(0.1)
+            await communicator.send_json_to({'method':'chat.message', 'message':"hi"})
+            events.append(await communicator.receive_json_from())
+
+            await communicator.disconnect()
+            return events
+
+        joined, before, after = async_to_sync(chat)()
+        self.assertEqual(joined['announcement'], "foobar has joined")
+        self.assertEqual(before['handle'], "foobar")
+        self.assertFalse(before['is_lobby_owner'])
+        self.assertTrue(after['is_lobby_owner'])
+
+    def test_context_changed_while_connecting_is_reloaded(self):
+        load_connection_context = consumers.load_connection_context
+        def promote_after_load(user):
+            # Promoted, and invalidated, before the consumer joined the player group.
+            context = load_connection_context(user)
+            Player.objects.filter(id=self.player1.id).update(is_lobby_owner=True)
+            return context
+
+        async def chat():
+            communicator = WebsocketCommunicator(
+                lambda scope: GameLobbyChatConsumer(dict(scope, user=self.user1)),
+                "/game/chat/")
+            with patch.object(consumers, 'load_connection_context', side_effect=promote_after_load):
+                connected, _ = await communicator.connect()
+                self.assertTrue(connected)
+                await communicator.receive_json_from()
+            await communicator.send_json_to({'method':'chat.message', 'message':"hi"})
+            event = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return event
+
+        self.assertTrue(async_to_sync(chat)()['is_lobby_owner'])
+
+    def test_invalidate_is_sent_once_the_transaction_commits(self):
+        with patch.object(broadcast, 'send_messages') as mock_send_messages:
+            with transaction.atomic():
+                lobby_lib.invalidate_player_connections(self.player1)
+                mock_send_messages.assert_not_called()
+        mock_send_messages.assert_called_once_with([
+            (self.player1.channel_layer_name, {"type":"context.invalidate"}),
+        ])
+
+
+class TestLobbyHttpConsumers(ConsumerTestCase):
+
+    def setUp(self):
+        self.game = Game.objects.create(
+            game_type=Game.GAME_TYPE_CHOICE_CONNECT_QUAT, name="fooo", max_players=2,
+            join_game_id="abc123")
+        Board.objects.create(game=self.game, board_length_x=7, board_length_y=7)
+        self.user1 = User.objects.create_user('testuser1@mail.com', password='password')
+        self.player1 = Player.objects.create(
+            user=self.user1, handle="foobar", game=self.game, is_lobby_owner=True)
+        self.user2 = User.objects.create_user('testuser2@mail.com', password='password')
+        self.player2 = Player.objects.create(user=self.user2, handle="foobaz")
+
+    async def _apost(self, consumer_class, path, data=None, **url_kwargs):
+        communicator = get_http_communicator(
+            consumer_class, self.user2, "POST", path, data or {}, url_kwargs=url_kwargs)
+        response = await communicator.get_response(timeout=5)
+        return response['status'], json.loads(response['body'])
+
+    def _post(self, *args, **kwargs):
+        return async_to_sync(self._apost)(*args, **kwargs)
+
+    def test_join_then_leave_lobby(self):
+        async def join_and_leave():
+            channel_layer = get_channel_layer()
+            channel_name = await channel_layer.new_channel()
+            await channel_layer.group_add(self.game.channel_layer_name, channel_name)
+
+            joined = await self._apost(
+                JoinLobbyConsumer, f"/api/lobby/join/{self.game.slug}/", slug=self.game.slug)
+            joined_event = await channel_layer.receive(channel_name)
+            left = await self._apost(LeaveLobbyConsumer, "/api/lobby/leave/")
+            left_event = await channel_layer.receive(channel_name)
+            return joined, joined_event, left, left_event
+
+        joined, joined_event, left, left_event = async_to_sync(join_and_leave)()
+        self.assertEqual(joined, (200, {}))
+        self.assertEqual(joined_event['type'], "player.joined")
+        self.assertEqual(left, (200, {}))
+        self.assertEqual(left_event['type'], "player.quit")
+        self.player2.refresh_from_db()
+        self.assertIsNone(self.player2.game)
+
+    def test_join_errors_answer_like_join_lobby(self):
+        self.assertEqual(
+            self._post(JoinLobbyConsumer, "/api/lobby/join/nope/", slug="nope")[0], 404)
+        Game.objects.filter(id=self.game.id).update(is_public=False)
+        self.assertEqual(
+            self._post(
+                JoinLobbyConsumer, f"/api/lobby/join/{self.game.slug}/",
+                {'join_game_id':"xyz789"}, slug=self.game.slug),
+            (400, "invalid join_game_id"))
+        self.assertEqual(
+            self._post(LeaveLobbyConsumer, "/api/lobby/leave/"),
+            (400, "player not in a game"))
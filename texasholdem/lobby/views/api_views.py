@@ -15,16 +15,16 @@ from lobby.forms import (
     NewConnectQuatroRoomForm,
     GameTypeSelectionForm,
     GamePrivacySettingsForm,
-    GameJoinIdForm,
 )
 from lobby import lib as lobby_lib
 from connectquatro import lib as cq_lib
 from connectquatro.models import Board as CQboard
-from connectquatro import tasks as cq_tasks
+from texasholdem.utils import load_game_context
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@load_game_context
 def create_lobby(request):
     user = request.user
     player = user.player
@@ -56,10 +56,11 @@ def create_lobby(request):
         max_players = cq_form.cleaned_data['boardplayercount']
         max_to_win = cq_form.cleaned_data['boardwincount']
         max_seconds_per_turn = cq_form.cleaned_data['max_seconds_per_turn']
+        board_mode = cq_form.cleaned_data['boardmode']
 
         game = lobby_lib.player_create_connectquat_lobby(
             player, game_name, board_length_x, board_length_y, max_players, max_to_win,
-            max_seconds_per_turn, is_public=is_public)
+            max_seconds_per_turn, is_public=is_public, board_mode=board_mode)
         data = {
             'id':game.id,
             'slug':game.slug,
@@ -70,6 +71,7 @@ def create_lobby(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@load_game_context
 def start_game(request):
     user = request.user
     player = user.player
@@ -97,9 +99,6 @@ def start_game(request):
 
     if game.game_type == Game.GAME_TYPE_CHOICE_CONNECT_QUAT:
         cq_lib.start_game(game)
-        active_player_id = cq_lib.get_active_player_id_from_board(game.board)
-        cq_tasks.cycle_player_turn_if_inactive.delay(
-            game.id, active_player_id, game.tick_count)
     else:
         raise NotImplementedError()
     
@@ -108,6 +107,7 @@ def start_game(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@load_game_context
 def player_ready(request):
     user = request.user
     player = user.player
@@ -129,6 +129,7 @@ def player_ready(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@load_game_context
 def initialize_game_start_downdown(request):
     user = request.user
     player = user.player
@@ -157,68 +158,23 @@ def initialize_game_start_downdown(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@load_game_context
 def join_lobby(request, slug):
-    user = request.user
-    player = user.player
-
-    if player.game:
-        return Response(
-            "You are already in game",
-            status.HTTP_400_BAD_REQUEST)
-    
-    game = get_object_or_404(Game, slug=slug)
-    if game.is_started:
-        return Response(
-            "Lobby is no longer joinable", status.HTTP_400_BAD_REQUEST)  
-    if game.is_full:
-        return Response(
-            "Lobby is full", status.HTTP_400_BAD_REQUEST)
-
-    if game.is_over:
-        return Response(
-            "game is over", status.HTTP_400_BAD_REQUEST)
-    
-    if not game.is_public:
-        join_id_form = GameJoinIdForm(request.data)
-        if not join_id_form.is_valid():
-            return Response(join_id_form.errors, status.HTTP_400_BAD_REQUEST)
-
-        join_game_id = join_id_form.cleaned_data["join_game_id"]
-        if join_game_id != game.join_game_id:
-            return Response(
-                "invalid join_game_id", status.HTTP_400_BAD_REQUEST)
-
-
-
-    lobby_lib.player_join_lobby(player, game)
-    return Response({}, status.HTTP_200_OK)
+    player = request.user.player
+    return Response(*lobby_lib.get_join_lobby_response(player, slug, request.data))
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@load_game_context
 def leave_lobby(request):
-    user = request.user
-    player = user.player
-    if not player.game:
-        return Response(
-            "player not in a game", status.HTTP_400_BAD_REQUEST) 
-    
-    if not player.game.is_started:
-        lobby_lib.player_leave_lobby(player)
-
-    elif not player.game.is_over:
-        if player.game.game_type == Game.GAME_TYPE_CHOICE_CONNECT_QUAT:
-            cq_lib.remove_player_from_active_game(player)
-
-    else:
-        if player.game.game_type == Game.GAME_TYPE_CHOICE_CONNECT_QUAT:
-            cq_lib.remove_player_from_completed_game(player)
-
-    return Response({}, status.HTTP_200_OK)
+    player = request.user.player
+    return Response(*lobby_lib.get_leave_lobby_response(player))
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@load_game_context
 def see_lobbies(request):
     user = request.user
     player = user.player
@@ -235,7 +191,7 @@ def see_lobbies(request):
 
     cq_boards = (CQboard.objects
         .filter(game__in=games)
-        .values('game_id', 'board_length_x', 'board_length_y',))
+        .values('game_id', 'board_length_x', 'board_length_y', 'mode',))
     cq_boards = {b['game_id']:b for b in cq_boards}
 
     games = games.values("id", "name", "slug", "game_type", "max_players",)
@@ -251,6 +207,7 @@ def see_lobbies(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@load_game_context
 def see_game_feed_messages(request, slug):
     user = request.user
     player = user.player
@@ -270,6 +227,7 @@ def see_game_feed_messages(request, slug):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@load_game_context
 def see_game_history(request):
     try:
         page = int(request.query_params.get('page', 1))
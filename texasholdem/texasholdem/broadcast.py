@@ -0,0 +1,225 @@
+""" Channel layer sends, queued on commit and delivered off the request.
+
+    group_send registers the message with transaction.on_commit, so
+    nothing is sent for a transaction that rolls back, and nothing is sent
+    while one holds the database. Committed messages are queued; inside
+    collect() they wait until the outermost collect() exits.
+    BroadcastMiddleware collects for every request.
+
+    Queued batches go to a dispatcher thread with its own event loop,
+    which sends whatever has piled up in one go: groups concurrently, each
+    group's messages in order. Requests never wait on the channel layer.
+    With settings.BROADCAST_IN_BACKGROUND off (tests) batches are sent
+    right away instead.
+
+    Delivery is at most once. The dispatcher is waited on when the process
+    exits normally, for up to EXIT_WAIT_SECONDS, but batches still queued
+    when a process is killed, or when the wait runs out, are lost.
+
+    capture() is collect() for async callers: the folded messages are
+    handed back so they can be awaited with send_messages on the caller's
+    loop.
+
+    A new.game.feed.message queued after a game.move to the same group
+    rides inside that game.move as 'feed_messages', a JSON encoded list,
+    so clients get a single frame.
+
+    Resumable messages are numbered and kept by event_log right before
+    they are sent, and carry their 'seq'.
+"""
+
+import asyncio
+import atexit
+import json
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from texasholdem import event_log
+
+
+logger = logging.getLogger(__name__)
+
+# How long an exiting process waits for the dispatcher to send what's queued.
+EXIT_WAIT_SECONDS = 5
+
+_local = threading.local()
+
+
+def group_send(group:str, message:dict, resumable=False):
+    """ Send once the current transaction commits, after the current
+        collect() exits. Game groups send resumable messages, see
+        connectquatro.consumers.ConnectQuatroConsumer.resume
+    """
+    if resumable:
+        message = dict(message, resumable=True)
+    transaction.on_commit(lambda: _queue_message(group, message))
+
+
+def _queue_message(group:str, message:dict):
+    queued = getattr(_local, 'queue', None)
+    if queued is None:
+        dispatch([(group, message)])
+    else:
+        queued.append((group, message))
+
+
+@contextmanager
+def collect():
+    if getattr(_local, 'queue', None) is not None:
+        # Flushed by the outermost collect().
+        yield
+        return
+
+    _local.queue = []
+    try:
+        yield
+    finally:
+        queued, _local.queue = _local.queue, None
+        if queued:
+            dispatch(fold_feed_messages(queued))
+
+
+@contextmanager
+def capture():
+    """ Collect into the yielded list instead of dispatching. If the block
+        raises, whatever was committed is dispatched as usual.
+    """
+    if getattr(_local, 'queue', None) is not None:
+        raise RuntimeError("capture() inside collect()")
+
+    messages = []
+    _local.queue = []
+    try:
+        yield messages
+    except BaseException:
+        queued, _local.queue = _local.queue, None
+        if queued:
+            dispatch(fold_feed_messages(queued))
+        raise
+    else:
+        queued, _local.queue = _local.queue, None
+        messages.extend(fold_feed_messages(queued))
+
+
+def fold_feed_messages(queued:list) -> list:
+    messages = []
+    last_move_messages = {}
+    for group, message in queued:
+        if message['type'] == 'game.move':
+            message = dict(message, feed_messages=[])
+            last_move_messages[group] = message
+        elif message['type'] == 'new.game.feed.message' and group in last_move_messages:
+            feed_message = dict(message)
+            feed_message.pop('resumable', None)
+            last_move_messages[group]['feed_messages'].append(feed_message)
+            continue
+        messages.append((group, message))
+
+    for group, message in messages:
+        if message['type'] == 'game.move':
+            message['feed_messages'] = json.dumps(message['feed_messages'])
+    return messages
+
+
+async def send_messages(messages:list):
+    messages_by_group = {}
+    for group, message in messages:
+        messages_by_group.setdefault(group, []).append(message)
+
+    channel_layer = get_channel_layer()
+    async def send_group(group, group_messages):
+        for message in group_messages:
+            if message.get('resumable'):
+                message = dict(message)
+                del message['resumable']
+                try:
+                    message['seq'] = await event_log.append(group, message)
+                except Exception:
+                    # Sent without a seq, so it can't be replayed.
+                    logger.exception("event log append to %s failed", group)
+            await channel_layer.group_send(group, message)
+
+    await asyncio.gather(*(
+        send_group(group, group_messages)
+        for group, group_messages in messages_by_group.items()))
+
+
+def dispatch(messages:list):
+    if settings.BROADCAST_IN_BACKGROUND:
+        _dispatcher.put(messages)
+    else:
+        async_to_sync(send_messages)(messages)
+
+
+class Dispatcher:
+    """ Sends queued batches from a daemon thread, started on first use.
+        Starting it registers wait_for_dispatcher to run at exit.
+    """
+
+    def __init__(self):
+        self.batches = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def put(self, messages:list):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name="broadcast-dispatcher", daemon=True)
+                self.thread.start()
+                atexit.register(wait_for_dispatcher, EXIT_WAIT_SECONDS)
+        self.batches.put(messages)
+
+    def run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        while True:
+            batches = [self.batches.get()]
+            while not self.batches.empty():
+                batches.append(self.batches.get_nowait())
+            messages = [message for batch in batches for message in batch]
+            try:
+                loop.run_until_complete(send_messages(messages))
+            except Exception:
+                logger.exception("broadcast of %s messages failed", len(messages))
+            for batch in batches:
+                self.batches.task_done()
+
+    def join(self, timeout:float=None) -> bool:
+        """ Block until every queued batch was sent, or timeout seconds
+            passed. Returns False if batches are left.
+        """
+        with self.batches.all_tasks_done:
+            return self.batches.all_tasks_done.wait_for(
+                lambda: not self.batches.unfinished_tasks, timeout)
+
+
+_dispatcher = Dispatcher()
+
+
+def wait_for_dispatcher(timeout:float=None):
+    """ Block until every queued batch was sent, for processes that exit.
+    """
+    if not _dispatcher.join(timeout):
+        logger.warning(
+            "exiting with %s broadcast batches unsent",
+            _dispatcher.batches.unfinished_tasks)
+
+
+class BroadcastMiddleware:
+    """ Send a request's channel layer messages together, after the view.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with collect():
+            return self.get_response(request)
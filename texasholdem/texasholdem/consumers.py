@@ -0,0 +1,187 @@
+import asyncio
+import json
+import logging
+from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+
+from channels.db import database_sync_to_async
+from channels.generic.http import AsyncHttpConsumer
+from channels.http import AsgiRequest
+from django.conf import settings
+from django.db import close_old_connections
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.exceptions import PermissionDenied
+
+from lobby.models import Player
+from texasholdem import broadcast
+
+
+logger = logging.getLogger('django.request')
+
+
+class ConnectionContext:
+    """ What a websocket connection knows about its player and their game.
+    """
+    __slots__ = (
+        'player_id',
+        'player_slug',
+        'handle',
+        'is_lobby_owner',
+        'player_channel_layer_name',
+        'game_id',
+        'game_slug',
+        'game_channel_layer_name',
+        'game_chat_channel_layer_name',
+    )
+
+    def __init__(self, player:Player):
+        self.player_id = player.id
+        self.player_slug = player.slug
+        self.handle = player.handle
+        self.is_lobby_owner = player.is_lobby_owner
+        self.player_channel_layer_name = player.channel_layer_name
+        game = player.game
+        self.game_id = game.id if game else None
+        self.game_slug = game.slug if game else None
+        self.game_channel_layer_name = game.channel_layer_name if game else None
+        self.game_chat_channel_layer_name = game.chat_channel_layer_name if game else None
+
+
+def load_connection_context(user) -> ConnectionContext:
+    return ConnectionContext(Player.objects.select_related('game').get(user=user))
+
+
+class PlayerContextMixin:
+    """ Resolves the connection's ConnectionContext once it has joined the
+        player's group, so messages and events are handled without a
+        database query. The
+        context is reloaded after a context.invalidate event, sent to the
+        player's group by lobby.lib.invalidate_player_connections once they
+        join or leave a game, are promoted, or their game starts.
+    """
+
+    context = None
+    player_channel_layer_name = None
+
+    async def connect_context(self):
+        context = await self.get_context()
+        self.player_channel_layer_name = context.player_channel_layer_name
+        await self.channel_layer.group_add(
+            self.player_channel_layer_name, self.channel_name)
+        # An invalidate sent before group_add never reached this connection,
+        # so the context loaded until now can't be trusted.
+        self.context = None
+
+    async def disconnect_context(self):
+        if self.player_channel_layer_name is not None:
+            await self.channel_layer.group_discard(
+                self.player_channel_layer_name, self.channel_name)
+
+    async def get_context(self) -> ConnectionContext:
+        if self.context is None:
+            self.context = await database_sync_to_async(load_connection_context)(
+                self.scope['user'])
+        return self.context
+
+    async def context_invalidate(self, data):
+        self.context = None
+
+
+_executor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """ The pool AsyncApiConsumer runs database work in. Its size bounds
+        the database connections the async views hold.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.ASYNC_API_MAX_THREADS,
+            thread_name_prefix="async-api")
+    return _executor
+
+
+def _run_in_pool(function, *args) -> tuple:
+    close_old_connections()
+    try:
+        with broadcast.capture() as messages:
+            result = function(*args)
+        return result, messages
+    finally:
+        close_old_connections()
+
+
+def enforce_csrf(scope, body:bytes):
+    """ The CSRF check DRF's SessionAuthentication makes for the sync views,
+        run on an HttpRequest built from the scope. Raises PermissionDenied.
+    """
+    SessionAuthentication().enforce_csrf(AsgiRequest(scope, BytesIO(body)))
+
+
+class AsyncApiConsumer(AsyncHttpConsumer, metaclass=ABCMeta):
+    """ An API view served on the event loop, for paths routed ahead of
+        AsgiHandler in texasholdem.routing. Subclasses implement respond().
+
+        Database work goes through run_sync, which runs it on the bounded
+        get_executor() pool, then awaits the channel layer sends it queued
+        instead of handing them to the broadcast dispatcher. Answers match
+        the sync DRF view serving the same path under WSGI.
+    """
+
+    method = 'POST'
+
+    async def handle(self, body):
+        user = self.scope['user']
+        if not user.is_authenticated:
+            return await self.send_json_response(
+                {'detail':"Authentication credentials were not provided."}, 403)
+        if self.scope['method'] != self.method:
+            return await self.send_json_response(
+                {'detail':f'Method "{self.scope["method"]}" not allowed.'}, 405)
+        if self.method != 'GET':
+            try:
+                await self.run_sync(enforce_csrf, self.scope, body)
+            except PermissionDenied as e:
+                return await self.send_json_response({'detail':e.detail}, 403)
+
+        data = {}
+        if body:
+            try:
+                data = json.loads(body)
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                return await self.send_json_response(
+                    {'detail':"JSON parse error"}, 400)
+
+        kwargs = self.scope.get('url_route', {}).get('kwargs', {})
+        try:
+            await self.respond(user, data, **kwargs)
+        except Exception:
+            # As Django's handler would, instead of leaving the request hanging.
+            logger.exception("Internal Server Error: %s", self.scope['path'])
+            await self.send_json_response({'detail':"A server error occurred."}, 500)
+
+    @abstractmethod
+    async def respond(self, user, data:dict, **kwargs):
+        """ Answer the request, usually with send_json_response. data is the
+            parsed JSON body, {} if there was none. kwargs are the url_route
+            kwargs. Runs on the event loop, so database work goes through
+            run_sync. Exceptions are logged and answered with a 500.
+        """
+
+    async def run_sync(self, function, *args):
+        loop = asyncio.get_event_loop()
+        result, messages = await loop.run_in_executor(
+            get_executor(), partial(_run_in_pool, function, *args))
+        if messages:
+            await broadcast.send_messages(messages)
+        return result
+
+    async def send_json_response(self, data, status:int, headers=None):
+        await self.send_response(
+            status, json.dumps(data).encode(),
+            headers=[(b"Content-Type", b"application/json")] + (headers or []))
@@ -0,0 +1,92 @@
+""" Recent events of each game group, kept in Redis so a websocket session
+    can resume where it dropped.
+
+    A resumable message (see broadcast.group_send) gets the group's next
+    seq when it is sent. The last settings.EVENT_LOG['SIZE'] of them are
+    kept in a list next to the seq counter, as "<seq> <message JSON>".
+    Resuming from a seq returns the events after it, or None when some of
+    them are no longer kept and the session needs a snapshot instead.
+"""
+
+import asyncio
+import json
+import weakref
+
+import aioredis
+from django.conf import settings
+
+
+# Runs atomically, so concurrent senders can't interleave a seq and its
+# event.
+APPEND_SCRIPT = """
+local seq = redis.call('INCR', KEYS[1])
+redis.call('RPUSH', KEYS[2], seq .. ' ' .. ARGV[1])
+redis.call('LTRIM', KEYS[2], -tonumber(ARGV[2]), -1)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return seq
+"""
+
+# A pool per event loop: the broadcast dispatcher and the ASGI server
+# each run their own.
+_pools = weakref.WeakKeyDictionary()
+
+
+async def get_redis():
+    loop = asyncio.get_event_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        new_pool = await aioredis.create_redis_pool(settings.EVENT_LOG['ADDRESS'])
+        pool = _pools.setdefault(loop, new_pool)
+        if pool is not new_pool:
+            new_pool.close()
+    return pool
+
+
+def _get_keys(group:str) -> list:
+    prefix = settings.EVENT_LOG['PREFIX']
+    return [f"{prefix}:{group}:seq", f"{prefix}:{group}:events"]
+
+
+async def append(group:str, message:dict) -> int:
+    """ Keep message as the group's next event. Returns its seq.
+    """
+    redis = await get_redis()
+    return await redis.eval(
+        APPEND_SCRIPT,
+        keys=_get_keys(group),
+        args=[json.dumps(message), settings.EVENT_LOG['SIZE'], settings.EVENT_LOG['TTL_SECONDS']])
+
+
+async def get_seq(group:str) -> int:
+    """ The seq of the group's last event, 0 before the first.
+    """
+    redis = await get_redis()
+    seq_key, events_key = _get_keys(group)
+    return int(await redis.get(seq_key) or 0)
+
+
+async def read_since(group:str, seq:int):
+    """ The group's events after seq, oldest first, each with its 'seq'.
+        None if any of them was evicted, or seq is from a log since lost.
+    """
+    redis = await get_redis()
+    seq_key, events_key = _get_keys(group)
+    transaction = redis.multi_exec()
+    current_seq = transaction.get(seq_key)
+    entries = transaction.lrange(events_key, 0, -1)
+    await transaction.execute()
+    current_seq = int(await current_seq or 0)
+    entries = await entries
+
+    if seq > current_seq:
+        return None
+    events = []
+    for entry in entries:
+        entry_seq, encoded_message = entry.split(b' ', 1)
+        entry_seq = int(entry_seq)
+        if entry_seq > seq:
+            events.append(dict(json.loads(encoded_message), seq=entry_seq))
+    if len(events) != current_seq - seq:
+        return None
+    return events
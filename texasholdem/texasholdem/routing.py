@@ -1,11 +1,18 @@
 
 from channels.auth import AuthMiddlewareStack
+from channels.http import AsgiHandler
 from channels.routing import ProtocolTypeRouter, URLRouter
+from django.urls import re_path
 
 import lobby.routing
 import connectquatro.routing
 
 application = ProtocolTypeRouter({
+    'http': URLRouter(
+        lobby.routing.http_urlpatterns
+        + connectquatro.routing.http_urlpatterns
+        + [re_path(r'', AsgiHandler)]
+    ),
     'websocket': AuthMiddlewareStack(
         URLRouter(
             lobby.routing.websocket_urlpatterns
@@ -53,6 +53,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'texasholdem.broadcast.BroadcastMiddleware',
 ]
 
 ROOT_URLCONF = 'texasholdem.urls'
@@ -95,6 +96,32 @@ DATABASES = {
     }
 }
 
+# Game states cached for polling are versioned by tick_count, so a per
+# process cache stays consistent. See connectquatro.lib.get_cached_game_state
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Channel layer messages are sent from a background thread, see
+# texasholdem.broadcast
+BROADCAST_IN_BACKGROUND = True
+
+# Recent game group events, replayed to websocket sessions that resume.
+# See texasholdem.event_log
+EVENT_LOG = {
+    'ADDRESS': "redis://127.0.0.1:6379",
+    'PREFIX': "event-log",
+    'SIZE': 200,
+    'TTL_SECONDS': 60 * 60 * 24,
+}
+
+# Threads (and so database connections) the async API views run queries
+# in, see texasholdem.consumers.AsyncApiConsumer. SQLite takes one writer
+# at a time, more threads turn the wait into "database is locked" errors.
+ASYNC_API_MAX_THREADS = 1
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         # 'rest_framework.permissions.IsAdminUser'
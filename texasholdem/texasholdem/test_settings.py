@@ -2,3 +2,5 @@
 from .settings import *
 
 IS_TESTING = True
+BROADCAST_IN_BACKGROUND = False
+EVENT_LOG = dict(EVENT_LOG, PREFIX="test-event-log")
@@ -0,0 +1,44 @@
+""" Shared by the tests of each app.
+"""
+
+import json
+from unittest.mock import patch
+
+from channels.testing import HttpCommunicator
+from django.middleware.csrf import _get_new_csrf_token
+from django.test import TransactionTestCase, override_settings
+
+
+def start_patch(test_case, target, attribute:str):
+    """ Start patch.object(target, attribute) until test_case is cleaned up.
+        Returns the mock.
+    """
+    patcher = patch.object(target, attribute)
+    test_case.addCleanup(patcher.stop)
+    return patcher.start()
+
+
+@override_settings(CHANNEL_LAYERS={
+    'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ConsumerTestCase(TransactionTestCase):
+    """ Broadcasts go out on commit, so consumer tests commit for real, and
+        through an in memory channel layer.
+    """
+
+
+def get_http_communicator(consumer_class, user, method:str, path:str, data=None,
+        headers=None, csrf_token=True, url_kwargs=None) -> HttpCommunicator:
+    """ A communicator for an AsyncApiConsumer, as user. data is sent as the
+        JSON body. Requests other than GET carry a csrftoken cookie, and the
+        matching X-CSRFToken header unless csrf_token is False.
+    """
+    headers = list(headers or [])
+    if method != 'GET':
+        token = _get_new_csrf_token()
+        headers.append((b"cookie", f"csrftoken={token}".encode()))
+        if csrf_token:
+            headers.append((b"x-csrftoken", token.encode()))
+    body = json.dumps(data).encode() if data is not None else b""
+    return HttpCommunicator(
+        lambda scope: consumer_class(dict(scope, user=user, url_route={'kwargs':url_kwargs or {}})),
+        method, path, body=body, headers=headers)
@@ -1,3 +1,34 @@
+from functools import wraps
+
+from lobby.models import Player
+
+
+def load_game_context(function):
+    """ Load the request user's player, their game and its board in one
+        query before the view runs. user.player, player.game and game.board
+        are cached from then on, for the permission decorators and the view.
+        The parsed board state is cached on the board, see
+        connectquatro.lib.load_board_state
+    """
+    @wraps(function)
+    def decorated_function(request, *args, **kwargs):
+        user = request.user
+        player = get_player_with_game(user)
+        if player:
+            user.player = player
+        return function(request, *args, **kwargs)
+
+    return decorated_function
+
+
+def get_player_with_game(user):
+    """ The user's player with its game and board, or None.
+    """
+    return (Player.objects
+        .select_related('game', 'game__board')
+        .filter(user=user)
+        .first())
+
 
 def get_user_player_game(request) -> tuple:
     user = request.user